@@ -4,7 +4,7 @@
 # top-level directory of this distribution for the full license text.
 
 
-from flask import Flask, render_template, flash, request, url_for, redirect, session
+from flask import Flask, render_template, flash, request, url_for, redirect
 from flask_wtf.csrf import CSRFProtect
 from flask_login import LoginManager, logout_user, current_user, login_required
 from forms.forms import ChangePasswordForm
@@ -12,17 +12,35 @@ from datetime import timedelta, date, datetime
 from routes.transfer import transfer_bp, login_bp, ddso_bp, create_transaction_bp, edit_profile_bp, add_recipient_bp
 from routes.my_routes import grocery1_bp, grocery2_bp, grocery3_bp, grocery4_bp, gas_bp, power_bp, petrol_bp, clothes_bp, water_bp, add_customer_bp
 from routes.my_routes_hc import send_query_bp, process_query_bp, read_message_bp, send_message_for_query_bp, send_message_for_message_bp, delete_messages_for_query_bp
-from routes.my_routes_hc import delete_query_confirmation_bp, show_statement_for_customer_bp, edit_customer_information_bp
+from routes.my_routes_hc import delete_query_confirmation_bp, show_statement_for_customer_bp, edit_customer_information_bp, ticket_events_bp
 from routes.my_routes_statement import download_transactions_bp, download_transactions_csv_bp
 from routes.my_routes_admin import transactions_filter_bp, reports_and_statistics_bp, delete_user_bp, update_customer_information_bp, find_tickets_bp, block_customer_bp, unlock_access_bp
-from routes.my_routes_admin import admin_dashboard_bp, logs_filtering_bp, cwc_bp
+from routes.my_routes_admin import admin_dashboard_bp, logs_filtering_bp, cwc_bp, query_stats_bp
 from routes.my_routes_loans import apply_consumer_loan_bp, apply_car_loan_bp, apply_home_renovation_loan_bp, apply_test_loan_bp
-from models.models import Users, Transaction, db, Recipient, DDSO, SupportTickets, LockedUsers, Loans
-from sqlalchemy import func
-from routes.transfer import admin_required
+from models.models import Users, Transaction, db, Recipient, DDSO, LockedUsers, Loans, TicketHeaders
+from routes.transfer import admin_required, log_writer
+from routes.chart_cache import chart_cache
+from routes.log_stats import log_stats
+from routes.audit_log import audit_log
+from routes.log_archive import log_archive
+from routes.report_snapshots import refresh_report_snapshot
+from routes.admin_counters import increment_admin_counter
+from routes.tickets import latest_ticket_messages
+from migrations import check_schema
+from routes.sequences import ticket_references
+from routes.ticket_events import ticket_events, TooManyListeners
+from routes.user_cache import user_cache
+from routes.login_limiter import login_limiter
+from models.password_hasher import password_hasher, PasswordHasherBusy
+from routes.session_store import server_sessions
+from routes.sqlite_profile import sqlite_profile
+from models.read_replica import read_replica
+from routes.ledger_archive import ledger_archive
+from routes.query_stats import query_stats
 from flask_apscheduler import APScheduler
 from flask_talisman import Talisman
 import traceback
+import os
 
 scheduler = APScheduler()
 
@@ -31,6 +49,7 @@ login_manager.login_view = 'login_bp.login'
 
 
 
+@query_stats.job
 def process_ddso_payments():
     """
     Processes pending Direct Debit Standing Order (DDSO) payments for the current day.
@@ -142,6 +161,7 @@ def process_ddso_payments():
         
         
         
+@query_stats.job
 def process_loans_payments():
     """
     Processes pending loan payment transactions for the current day. It updates the balances of both 
@@ -265,6 +285,72 @@ def process_loans_payments():
         
         
         
+@query_stats.job
+def refresh_report_snapshots():
+    """
+    Recomputes the admin report aggregates and stores them as a new report snapshot.
+
+    Runs periodically in the scheduler so that the admin reports and dashboard only have to read the latest snapshot
+    instead of recomputing group-bys over the whole database and rescanning the log file on every visit.
+
+    Returns:
+        None. Prints the generation time of the new snapshot to the console.
+    """
+    with app.app_context():
+        try:
+            snapshot = refresh_report_snapshot()
+            print("Report snapshot generated at:", snapshot.generated_at)
+        except Exception as e:
+            db.session.rollback()
+            print('An error occurred. Report snapshot failed:', e)
+            traceback.print_exc()
+
+
+
+@query_stats.job
+def refresh_read_replica():
+    """
+    Renews the read replica snapshot used by the read-only views (once per interval for all the processes), or with
+    an external replica (READ_REPLICA_URI) writes the heartbeat row it replicates, and then reads the replica's
+    heartbeat to know how recent its data is.
+
+    Runs periodically in the scheduler. If it fails, the views keep reading the replica until its heartbeat is older
+    than READ_REPLICA_MAX_STALENESS, and then read from the database itself.
+
+    Returns:
+        None. Prints an error message to the console if the copy fails.
+    """
+    with app.app_context():
+        try:
+            read_replica.refresh(db)
+        except Exception as e:
+            print('An error occurred. Read replica refresh failed:', e)
+            traceback.print_exc()
+
+
+
+@query_stats.job
+def archive_ledger():
+    """
+    Moves the transactions older than LEDGER_HOT_DAYS days out of the transaction table into the yearly ledger
+    archive databases, leaving a balance brought forward row per account.
+
+    Runs daily in the scheduler. Each year's rows are copied and checked before they are deleted, so a failed run is
+    completed by the next one.
+
+    Returns:
+        None. Prints the number of archived transactions, or an error message, to the console.
+    """
+    with app.app_context():
+        try:
+            moved = ledger_archive.archive()
+            print("Transactions archived:", moved)
+        except Exception as e:
+            print('An error occurred. Ledger archiving failed:', e)
+            traceback.print_exc()
+        
+        
+        
 
 def create_app():
     """
@@ -277,12 +363,30 @@ def create_app():
     - CSRF protection to safeguard against Cross-Site Request Forgery attacks.
     - Login manager for handling user authentication.
     - SQLAlchemy database instance for ORM-based database interactions.
+    - SQLite profile, setting WAL and the cache pragmas on every database connection and sizing the connection pool.
+    - Read replica, a periodically refreshed snapshot of the database serving the views marked read-only.
+    - Ledger archive, moving old transactions into yearly archive databases read by the statements on demand.
+    - SQL statement instrumentation, recording the statements and database time of each request and scheduler job.
+    - Schema version check against the migrations in the `migrations` package (applied by `manage.py migrate`).
+    - Chart cache for the rendered images on the reports and statistics page.
+    - Ticket reference number allocator, reserving blocks of sequence numbers per process.
+    - Ticket event broker, pushing new support ticket messages to the pages listening to them.
+    - User identity cache, serving the Flask-Login user loader without a database query.
+    - Login rate limiter, refusing bursts of failed login attempts per username and per IP address.
+    - Password hasher, verifying passwords in a bounded worker pool with a configurable method and work factor.
+    - Optional server-side session store (SESSION_BACKEND), keeping the session data in SQLite or in memory behind a
+      signed session id cookie.
+    - Incremental log statistics, counting only the lines appended to the log file since the last report.
+    - Queued log writer, writing and rotating 'app.log' in a background thread instead of the request threads.
+    - Log archive, compressing each rotated log file into a block-indexed archive searchable by the admin.
+    - Audit log store, a structured and indexed copy of the log records used by the admin log filtering.
     - APScheduler for scheduling background tasks.
     - Flask blueprints for modularizing the application into distinct components, each responsible
       for a set of routes and functionalities.
     
     Scheduled tasks for processing payments and loan installments are added with a delay after 
     the application start, demonstrating how to execute background operations at specific times.
+    The admin report snapshot is refreshed by an interval task every REPORT_SNAPSHOT_INTERVAL_MINUTES.
     
     Returns:
         Flask app: The configured Flask application instance ready to run.
@@ -296,6 +400,31 @@ def create_app():
     app.config['SECRET_KEY'] = 'bc684cf3981dbcacfd60fc34d6985095'
     app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///ib_database_users.db'  # Setting the database name
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False  # Recommended for performance
+    app.config['READ_REPLICA_REFRESH_SECONDS'] = 60  # How often the read replica snapshot is copied from the database
+    app.config['READ_REPLICA_MAX_STALENESS'] = 180  # Read-only views fall back to the database when the snapshot is older
+    app.config['SQLITE_PRAGMAS'] = {}  # Overrides of the WAL profile pragmas, e.g. {'synchronous': 'FULL'} for every commit synced
+    app.config['LEDGER_HOT_DAYS'] = 730  # Transactions older than this are moved to the yearly ledger archive
+    app.config['QUERY_STATS_MAX_STATEMENTS'] = 50  # A request or job running more SQL statements than this is logged
+    app.config['QUERY_STATS_REPEAT_THRESHOLD'] = 10  # Running one statement this many times (a per-row query loop) is logged
+    app.config['CHART_CACHE_TTL'] = 300  # Seconds a rendered report chart may be reused while its data is unchanged
+    app.config['CHART_CACHE_MAX_ENTRIES'] = 64
+    app.config['REPORT_SNAPSHOT_INTERVAL_MINUTES'] = 10  # How often the admin report snapshot is recomputed
+    app.config['LOG_STATS_FILE'] = 'app.log'  # Log file whose records are counted per level and per day for the reports
+    app.config['AUDIT_LOG_BATCH_SIZE'] = 100  # Log records written to the audit log database per transaction
+    app.config['AUDIT_LOG_FLUSH_INTERVAL'] = 1.0  # Seconds a log record may wait before it is written
+    app.config['LOG_QUEUE_SIZE'] = 10000  # Log records waiting for the app.log writer; more are dropped, not waited for
+    app.config['LOG_MAX_BYTES'] = 10 * 1024 * 1024  # app.log is rotated at this size and at the start of each day
+    app.config['LOG_BACKUP_COUNT'] = 5  # Rotated files kept next to app.log (app.log.1 ... app.log.5), besides their archives
+    app.config['TICKET_REFERENCE_BLOCK_SIZE'] = 20  # Ticket reference numbers reserved at once by each process
+    app.config['EVENT_STREAM_HEARTBEAT'] = 15  # Seconds between heartbeats on idle ticket event streams
+    app.config['USER_CACHE_TTL'] = 60  # Seconds a logged-in user's identity is served from memory
+    app.config['LOGIN_WINDOW_SECONDS'] = 900  # Failed login attempts are counted over the last 15 minutes
+    app.config['PASSWORD_HASH_METHOD'] = 'scrypt:32768:8:1'  # Older hashes are upgraded at the next login
+    app.config['SESSION_BACKEND'] = 'cookie'  # Session data in the signed cookie ('cookie'), or opt in to server-side 'sqlite' or 'memory'
+    app.config['SESSION_REFRESH_AFTER'] = 300  # Seconds before an unchanged session's expiry and cookie are renewed
+    # Startup only compares the schema version; migrations are applied with 'python manage.py migrate'. Development
+    # databases may be migrated at start instead by setting the SCHEMA_AUTO_MIGRATE=1 environment variable.
+    app.config['SCHEMA_AUTO_MIGRATE'] = os.environ.get('SCHEMA_AUTO_MIGRATE') == '1'
     
     
     csp = {
@@ -333,9 +462,63 @@ def create_app():
     login_manager.init_app(app)
     csrf.init_app(app)
     
+    # SQLite pragmas and connection pool options, read before the engine is created
+    sqlite_profile.init_app(app)
+    
+    # Replica bind of the read-only views, added before the engines are created
+    read_replica.init_app(app)
+    
     # Initializing db with app object
     db.init_app(app)
     
+    # Statement counts and database time per request and scheduler job (admin page '/admin/perf')
+    query_stats.init_app(app)
+    
+    # Compare the database schema version with the latest migration, once per process instead of per request
+    with app.app_context():
+        sqlite_profile.attach(db.engine)
+        for engine in db.engines.values():
+            query_stats.attach(engine)
+        check_schema(auto_migrate=app.config['SCHEMA_AUTO_MIGRATE'])
+    
+    # Yearly archive databases of the old transactions (in the instance folder)
+    ledger_archive.init_app(app)
+    
+    # Cache of rendered report charts
+    chart_cache.init_app(app)
+    
+    # Incremental log level counters (state kept in the instance folder)
+    log_stats.init_app(app)
+    
+    # Support ticket reference numbers, reserved in blocks per process
+    ticket_references.init_app(app)
+    
+    # In-process publish/subscribe of new ticket messages, feeding the ticket event streams
+    ticket_events.init_app(app)
+    
+    # Identities of the logged-in users, loaded without a database query on every request
+    user_cache.init_app(app)
+    
+    # Failed login attempts per username and IP address (state kept in the instance folder)
+    login_limiter.init_app(app)
+    
+    # Password hashing and verification pool
+    password_hasher.init_app(app)
+    
+    # Server-side sessions (separate SQLite file in the instance folder)
+    server_sessions.init_app(app)
+    
+    # Background writer of the app.log file
+    log_writer.init_app(app)
+    
+    # Rotated log files are counted to the end and then compressed into searchable, block-indexed archives by a
+    # background archiver thread
+    log_archive.init_app(app)
+    log_writer.on_rotate[:] = [log_stats.catch_up, log_archive.archive_rotated_file]
+    
+    # Indexed audit log store behind the admin log filtering (separate SQLite file in the instance folder)
+    audit_log.init_app(app)
+    
     # Scheduler initialization
     scheduler.init_app(app)
     scheduler.start()
@@ -345,6 +528,24 @@ def create_app():
     # Run the task only once, shortly after starting the application trigger='date'
     scheduler.add_job(id='process_ddso', func=process_ddso_payments, trigger = 'date', run_date = datetime.now() + timedelta(seconds = 5))
     scheduler.add_job(id='process_loans', func=process_loans_payments, trigger = 'date', run_date = datetime.now() + timedelta(seconds = 10))
+    
+    # Recompute the admin report snapshot periodically, the first time shortly after the payment jobs
+    scheduler.add_job(id='refresh_report_snapshots', func=refresh_report_snapshots, trigger = 'interval', 
+                      minutes = app.config['REPORT_SNAPSHOT_INTERVAL_MINUTES'], next_run_time = datetime.now() + timedelta(seconds = 15))
+    
+    # Copy the database into the read replica snapshot, the first time shortly after starting
+    scheduler.add_job(id='refresh_read_replica', func=refresh_read_replica, trigger = 'interval',
+                      seconds = app.config['READ_REPLICA_REFRESH_SECONDS'], next_run_time = datetime.now() + timedelta(seconds = 2))
+    
+    # Archive the transactions past the ledger horizon every night
+    scheduler.add_job(id='archive_ledger', func=archive_ledger, trigger = 'cron', hour = app.config['LEDGER_ARCHIVE_HOUR'])
+    
+    # Save the failed login attempt counters, so a restart does not reset them
+    scheduler.add_job(id='persist_login_limits', func=login_limiter.persist, trigger = 'interval',
+                      seconds = app.config['LOGIN_LIMITS_PERSIST_SECONDS'])
+    
+    # Remove the expired server-side sessions
+    scheduler.add_job(id='purge_expired_sessions', func=server_sessions.purge_expired, trigger = 'interval', minutes = 10)
 
     # Blueprint registration
     app.register_blueprint(transfer_bp)
@@ -373,6 +574,7 @@ def create_app():
     app.register_blueprint(delete_query_confirmation_bp)
     app.register_blueprint(show_statement_for_customer_bp)
     app.register_blueprint(edit_customer_information_bp)
+    app.register_blueprint(ticket_events_bp)
     
     app.register_blueprint(download_transactions_bp)
     app.register_blueprint(download_transactions_csv_bp)
@@ -387,12 +589,23 @@ def create_app():
     app.register_blueprint(admin_dashboard_bp)
     app.register_blueprint(logs_filtering_bp)
     app.register_blueprint(cwc_bp)
+    app.register_blueprint(query_stats_bp)
     
     app.register_blueprint(apply_consumer_loan_bp)
     app.register_blueprint(apply_car_loan_bp)
     app.register_blueprint(apply_home_renovation_loan_bp)
     app.register_blueprint(apply_test_loan_bp)
     
+    @app.errorhandler(PasswordHasherBusy)
+    def password_hasher_busy(error):
+        # Too many password checks are waiting: ask the client to retry instead of queueing the request
+        return 'The service is busy. Please try again in a moment.', 503, {'Retry-After': '1'}
+    
+    @app.errorhandler(TooManyListeners)
+    def too_many_listeners(error):
+        # The open event streams would take the worker threads of the other requests: the page retries later
+        return 'Too many open event streams. Please try again later.', 503, {'Retry-After': str(ticket_events.retry_after)}
+    
     return app
 
 
@@ -401,10 +614,9 @@ app = create_app()
   
 def initialize_app():
     """
-    Initializes the application's database and populates it with sample data.
+    Populates the application's database with sample data.
     
     This function performs the following actions within the application's context:
-    - Creates all database tables based on the SQLAlchemy models defined elsewhere in the application.
     - Calls a function to create a sample user, demonstrating how to pre-populate the database with 
       initial data for development or testing purposes.
     
@@ -418,44 +630,14 @@ def initialize_app():
         a predefined user or set of users into the database, which can be useful for testing or 
         initial setup purposes.
         
-        It is important to ensure that `db.create_all()` does not overwrite existing data when called 
-        in a production environment. Consider using migrations for managing database schema changes 
-        in a more controlled manner, especially for applications already in production.
+        The database schema itself is managed by the versioned migrations in the `migrations` package, 
+        applied with `python manage.py migrate` and checked once when the application is created.
     """
     with app.app_context():
-        db.create_all()
         create_sample_user()
         
         
         
-@app.before_request
-def initialize_database():
-    """
-    Ensures that all database tables are created before handling any request and makes the session permanent.
-    
-    This function is executed before each request within the Flask application context. It performs
-    two primary actions:
-    - Calls `db.create_all()` to ensure that all database tables defined by the SQLAlchemy models are 
-      created. This operation is idempotent, meaning it will not attempt to recreate tables that already exist.
-    - Sets `session.permanent` to True, making the session permanent. This extends the session lifetime
-      beyond the default duration, requiring manual session termination or expiration based on the 
-      `PERMANENT_SESSION_LIFETIME` configuration.
-    
-    Note:
-        Using `db.create_all()` on every request can impact performance and is not recommended for production 
-        environments. It is typically used during development or testing for convenience. For production, 
-        consider using database migrations to manage schema changes.
-        
-        The permanent session feature is useful for extending user sessions, but session management should 
-        be carefully designed to balance user experience with security considerations.
-        
-        Ensure that the Flask application is properly configured to handle permanent sessions, including 
-        configuring the `PERMANENT_SESSION_LIFETIME` as needed.
-    """
-    db.create_all()
-    session.permanent = True
-    
-    
 @login_manager.user_loader
 def load_user(user_id):
     """
@@ -465,6 +647,10 @@ def load_user(user_id):
     essential for managing user sessions in Flask applications that utilize Flask-Login for authentication. The function 
     queries the database for the user ID and returns the user object if found, or None if no user is found with that ID.
     
+    Since this runs on every authenticated request, the user is served from the in-process user cache
+    (routes/user_cache.py) when it was loaded recently, without a database query. Routes that change, delete, lock or
+    unlock a user invalidate its cache entry.
+    
     Parameters:
     - user_id (str): The user ID that Flask-Login seeks to reload from the session. It is assumed to be a string that 
       can be converted to an integer, representing the user's unique identifier in the database.
@@ -477,10 +663,10 @@ def load_user(user_id):
         to the user's ID in the database. This function must be able to handle the conversion of the user_id from a string 
         (as Flask-Login stores it in the session) to the appropriate type expected by the database query method (typically an integer).
         
-        The Users model and query method used should be defined elsewhere in the application, with Users.query.get() 
-        being an SQLAlchemy ORM query for fetching a user by their ID from the Users table.
+        The Users model is defined elsewhere in the application; on a cache miss the user is fetched by their ID from
+        the Users table with db.session.get().
     """
-    return Users.query.get(int(user_id))
+    return user_cache.load(int(user_id))
     
 # The following code is optional and is used to add an example user during database initialization
 def create_sample_user():
@@ -515,6 +701,7 @@ def create_sample_user():
         admin = Users(username='admin', role='admin', email='admin@ib.co.uk', phone_number='+447710989456', country='UK')
         admin.set_password('admin_password')
         db.session.add(admin)
+        increment_admin_counter('users')
         db.session.commit()  
         
 
@@ -1098,11 +1285,9 @@ def help_center():
     designed to handle GET requests, presenting users with the most current status of each of their inquiries based
     on unique reference numbers.
 
-    The function achieves this by executing a two-step query process:
-    1. A subquery that groups support tickets by their reference number and identifies the latest date of submission
-       for each group, representing the most recent update for each unique inquiry.
-    2. A main query that joins this subquery to retrieve the full records of the latest tickets, filtering them by
-       the current user's ID to personalize the data presented on the help center page.
+    Every ticket thread has a header (TicketHeaders) that is updated with each new message and points at the
+    thread's latest message. The function reads the current user's headers, using the index on (user_id,
+    last_message_at), and joins each to its latest message by primary key, newest thread first.
 
     This method ensures that users are shown the most up-to-date information regarding their submitted tickets,
     enhancing the user experience by providing clear and current insights into the resolution status of their inquiries.
@@ -1113,8 +1298,6 @@ def help_center():
         interface for tracking support interactions.
 
     Note:
-        - This function's implementation of SQL subqueries and joins demonstrates an effective approach to retrieving
-          complex, user-specific data in applications requiring personalized user interactions.
         - Future enhancements could include the implementation of filtering or sorting options, allowing users to
           navigate their support ticket history more efficiently.
         - Ensuring the privacy and security of user data in this context is paramount, especially given the potentially
@@ -1122,12 +1305,12 @@ def help_center():
         - The clarity and usability of the help center interface are crucial for user satisfaction, suggesting that the
           design should facilitate easy access to detailed ticket information and support resources.
     """
-    # First, we create a subquery to find the latest dates for each unique reference number
-    subquery = db.session.query(SupportTickets.reference_number,func.max(SupportTickets.created_at).label('max_date')).group_by(SupportTickets.reference_number).subquery()
-
-    # We then append this subquery to the main query to retrieve the latest records
-    user_queries = db.session.query(SupportTickets).join(subquery,(SupportTickets.reference_number == subquery.c.reference_number) &
-        (SupportTickets.created_at == subquery.c.max_date)).filter(SupportTickets.user_id == current_user.id).all()
+    # The ticket headers point at the latest message of each thread, so no grouping of the messages is needed
+    user_queries = (latest_ticket_messages()
+                    .filter(TicketHeaders.user_id == current_user.id)
+                    .order_by(None)
+                    .order_by(TicketHeaders.last_message_at.desc())
+                    .all())
 
     return render_template('help_center.html', all_queries = user_queries)
 
@@ -1274,6 +1457,7 @@ def change_password(user_id):
     if form.validate_on_submit():
         user.set_password(form.new_password.data)
         db.session.commit()
+        user_cache.invalidate(user.id)
         flash('Password has been updated.', 'success')
         return redirect(url_for('list_users'))
 
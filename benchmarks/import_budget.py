@@ -0,0 +1,92 @@
+"""
+Import-time and memory budget check for the web application.
+
+Imports the application in a fresh interpreter with `python -X importtime`, and reports:
+- the cumulative import time of the application modules,
+- the peak resident memory (RSS) of the process after the import,
+- whether the heavy analytics dependencies (pandas, matplotlib) were imported.
+
+For comparison, the same measurement is repeated with pandas and matplotlib.pyplot imported eagerly, which is what
+every worker paid before they were loaded lazily.
+
+Usage (from the repository root):
+    python benchmarks/import_budget.py [--budget-ms 1000] [--budget-rss-mb 100]
+
+The script exits with status 1 if the lazy import exceeds the time or memory budget, or if pandas or matplotlib were
+imported at start-up.
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY_MODULES = ('pandas', 'matplotlib')
+
+# Imports the route modules (the application's import graph without starting the scheduler) and prints the peak RSS
+# and which heavy modules ended up in sys.modules
+PROBE = """
+import resource, sys
+{preload}
+import routes.transfer, routes.my_routes, routes.my_routes_hc, routes.my_routes_statement, routes.my_routes_admin, routes.my_routes_loans
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print('RSS_KB', rss if sys.platform != 'darwin' else rss // 1024)
+print('HEAVY', ','.join(name for name in {heavy!r} if name in sys.modules))
+"""
+
+
+def measure(preload=''):
+    """
+    Runs the probe in a fresh interpreter and returns (import time in ms, peak RSS in MB, imported heavy modules).
+    """
+    code = PROBE.format(preload=preload, heavy=HEAVY_MODULES)
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=ROOT,
+                            capture_output=True, text=True, check=True)
+
+    # Lines of -X importtime: "import time: <self us> | <cumulative us> | <module>"; top-level imports have no indent
+    total_us = 0
+    for line in result.stderr.splitlines():
+        match = re.match(r'import time:\s+(\d+) \|\s+(\d+) \| (\S.*)$', line)
+        if match:
+            total_us += int(match.group(2))
+
+    rss_kb = int(re.search(r'RSS_KB (\d+)', result.stdout).group(1))
+    heavy = [name for name in re.search(r'HEAVY (.*)', result.stdout).group(1).split(',') if name]
+
+    return total_us / 1000, rss_kb / 1024, heavy
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--budget-ms', type=float, default=1000, help='maximum cumulative import time in ms')
+    parser.add_argument('--budget-rss-mb', type=float, default=100, help='maximum peak RSS after import in MB')
+    parser.add_argument('--runs', type=int, default=3, help='number of runs, the best one is reported')
+    args = parser.parse_args()
+
+    lazy = min((measure() for _ in range(args.runs)), key=lambda run: run[0])
+    eager = min((measure('import pandas, matplotlib.pyplot') for _ in range(args.runs)), key=lambda run: run[0])
+
+    print(f"{'':<28}{'import time':>14}{'peak RSS':>12}  heavy modules")
+    print(f"{'eager (pandas + pyplot)':<28}{eager[0]:>11.0f} ms{eager[1]:>9.1f} MB  {', '.join(eager[2]) or '-'}")
+    print(f"{'lazy (current)':<28}{lazy[0]:>11.0f} ms{lazy[1]:>9.1f} MB  {', '.join(lazy[2]) or '-'}")
+    print(f"Saved {eager[0] - lazy[0]:.0f} ms of import time and {eager[1] - lazy[1]:.1f} MB per worker.")
+
+    failures = []
+    if lazy[2]:
+        failures.append(f"heavy modules imported at start-up: {', '.join(lazy[2])}")
+    if lazy[0] > args.budget_ms:
+        failures.append(f"import time {lazy[0]:.0f} ms exceeds the budget of {args.budget_ms:.0f} ms")
+    if lazy[1] > args.budget_rss_mb:
+        failures.append(f"peak RSS {lazy[1]:.1f} MB exceeds the budget of {args.budget_rss_mb:.0f} MB")
+
+    for failure in failures:
+        print('FAIL:', failure)
+
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
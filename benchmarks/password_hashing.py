@@ -0,0 +1,90 @@
+"""
+Throughput of password verification, the CPU cost of every login and of every payment confirmation.
+
+For each hash method, measures how many verifications one core performs per second (each login and each transfer or
+DDSO confirmation is one verification, so this is also logins/sec and transfers/sec per core, ignoring the rest of
+the request), and then the throughput of the PasswordHasher worker pool with the given number of workers, loaded by
+more concurrent requests than it has workers. The pool's figure divided by the number of workers shows how well the
+verifications scale across cores.
+
+Usage (from the repository root):
+    python benchmarks/password_hashing.py [--methods scrypt:32768:8:1 pbkdf2:sha256:600000] [--workers 4]
+                                          [--seconds 3]
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from models.password_hasher import PasswordHasher, PasswordHasherBusy
+
+
+def single_core(hasher, password_hash, seconds):
+    """
+    Returns the verifications per second on the calling thread.
+    """
+    count = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        hasher.verify(password_hash, 'correct horse battery staple')
+        count += 1
+    return count / (time.perf_counter() - start)
+
+
+def pooled(hasher, password_hash, seconds, clients):
+    """
+    Returns (verifications per second, refused verifications) with `clients` threads calling verify() concurrently.
+    """
+    counts = [0] * clients
+    refused = [0] * clients
+    deadline = time.perf_counter() + seconds
+
+    def client(index):
+        while time.perf_counter() < deadline:
+            try:
+                hasher.verify(password_hash, 'correct horse battery staple')
+                counts[index] += 1
+            except PasswordHasherBusy:
+                refused[index] += 1
+                time.sleep(0.001)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=client, args=(index,)) for index in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sum(counts) / (time.perf_counter() - start), sum(refused)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--methods', nargs='+', default=['scrypt:32768:8:1', 'pbkdf2:sha256:600000'],
+                        help='werkzeug hash methods to compare')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='size of the verification pool')
+    parser.add_argument('--seconds', type=float, default=3, help='duration of each measurement')
+    args = parser.parse_args()
+
+    clients = 2 * args.workers
+    print(f'{"method":<24}{"1 core /s":>12}{f"pool ({args.workers} workers) /s":>26}{"per worker /s":>16}'
+          f'{"refused":>10}')
+    for method in args.methods:
+        inline = PasswordHasher(method=method, workers=0)
+        password_hash = inline.hash('correct horse battery staple')
+        per_core = single_core(inline, password_hash, args.seconds)
+
+        pool = PasswordHasher(method=method, workers=args.workers, max_pending=args.workers * 4)
+        total, refused = pooled(pool, password_hash, args.seconds, clients)
+
+        print(f'{method:<24}{per_core:>12.1f}{total:>26.1f}{total / args.workers:>16.1f}{refused:>10}')
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
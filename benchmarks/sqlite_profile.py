@@ -0,0 +1,146 @@
+"""
+Concurrent read/write throughput of the application database with SQLite's default settings and with the profile of
+routes/sqlite_profile.py (WAL, synchronous=NORMAL, busy_timeout, mmap_size, cache_size, temp_store).
+
+Builds a scratch database with a transaction table shaped like the application's, then for a fixed time runs
+reader threads (statement-like queries: the latest transactions of a random user, and a per-user balance sum, as
+the dashboard and the reports do) next to writer threads (one inserted transaction per commit, as transfers and the
+scheduler's payment jobs do), all through a SQLAlchemy engine with the same pool as the application. It reports
+reads/sec, commits/sec and the operations that failed with 'database is locked' for each configuration.
+
+The default configuration keeps the rollback journal, so each commit locks the readers out and the readers delay the
+commits; with the profile, reads go on during commits and commits only fsync at checkpoints.
+
+Usage (from the repository root):
+    python benchmarks/sqlite_profile.py [--readers 8] [--writers 2] [--seconds 5] [--rows 50000]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+from routes.sqlite_profile import SQLiteProfile, DEFAULT_ENGINE_OPTIONS
+
+
+USERS = 500
+
+SCHEMA = [
+    'CREATE TABLE transactions (id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL, amount FLOAT NOT NULL, '
+    'balance FLOAT NOT NULL, transaction_date TEXT NOT NULL, title TEXT)',
+    'CREATE INDEX ix_transactions_user_date ON transactions (user_id, transaction_date)',
+]
+
+INSERT = text('INSERT INTO transactions (user_id, amount, balance, transaction_date, title) '
+              'VALUES (:user_id, :amount, :balance, :transaction_date, :title)')
+
+LATEST = text('SELECT id, amount, balance, transaction_date, title FROM transactions WHERE user_id = :user_id '
+              'ORDER BY transaction_date DESC LIMIT 20')
+
+TOTAL = text('SELECT SUM(amount), COUNT(*) FROM transactions WHERE user_id = :user_id')
+
+
+def random_row():
+    return {'user_id': random.randrange(USERS), 'amount': round(random.uniform(-500, 500), 2),
+            'balance': round(random.uniform(0, 10000), 2),
+            'transaction_date': f'2024-{random.randint(1, 12):02d}-{random.randint(1, 28):02d}',
+            'title': 'Transfer'}
+
+
+def make_engine(path, profiled):
+    """
+    Returns an engine on the database file, with the application's pool and, if `profiled`, the pragma profile.
+    """
+    engine = create_engine(f'sqlite:///{path}', **DEFAULT_ENGINE_OPTIONS)
+    if profiled:
+        SQLiteProfile().attach(engine)
+    else:
+        # Rollback journal, as a database that was never switched to WAL
+        with engine.begin() as connection:
+            connection.exec_driver_sql('PRAGMA journal_mode = DELETE')
+    return engine
+
+
+def populate(path, rows):
+    engine = create_engine(f'sqlite:///{path}')
+    with engine.begin() as connection:
+        for statement in SCHEMA:
+            connection.exec_driver_sql(statement)
+        connection.execute(INSERT, [random_row() for _ in range(rows)])
+    engine.dispose()
+
+
+def run(engine, readers, writers, seconds):
+    """
+    Returns (reads per second, commits per second, locked errors) of `readers` and `writers` threads.
+    """
+    reads = [0] * readers
+    commits = [0] * writers
+    locked = [0]
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def reader(index):
+        while time.perf_counter() < deadline:
+            try:
+                with engine.connect() as connection:
+                    user_id = random.randrange(USERS)
+                    connection.execute(LATEST, {'user_id': user_id}).fetchall()
+                    connection.execute(TOTAL, {'user_id': user_id}).fetchone()
+                reads[index] += 1
+            except OperationalError:
+                with lock:
+                    locked[0] += 1
+
+    def writer(index):
+        while time.perf_counter() < deadline:
+            try:
+                with engine.begin() as connection:
+                    connection.execute(INSERT, random_row())
+                commits[index] += 1
+            except OperationalError:
+                with lock:
+                    locked[0] += 1
+
+    start = time.perf_counter()
+    threads = ([threading.Thread(target=reader, args=(index,)) for index in range(readers)]
+               + [threading.Thread(target=writer, args=(index,)) for index in range(writers)])
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return sum(reads) / elapsed, sum(commits) / elapsed, locked[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--readers', type=int, default=8, help='concurrent reading threads')
+    parser.add_argument('--writers', type=int, default=2, help='concurrent writing threads')
+    parser.add_argument('--seconds', type=float, default=5, help='duration of each measurement')
+    parser.add_argument('--rows', type=int, default=50000, help='transactions in the scratch database')
+    args = parser.parse_args()
+
+    print(f'{"configuration":<16}{"reads /s":>12}{"commits /s":>12}{"locked":>10}')
+    with tempfile.TemporaryDirectory() as directory:
+        for name, profiled in (('default', False), ('profile', True)):
+            path = os.path.join(directory, f'{name}.db')
+            populate(path, args.rows)
+            engine = make_engine(path, profiled)
+            per_second_reads, per_second_commits, locked = run(engine, args.readers, args.writers, args.seconds)
+            engine.dispose()
+            print(f'{name:<16}{per_second_reads:>12.1f}{per_second_commits:>12.1f}{locked:>10}')
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
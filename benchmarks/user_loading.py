@@ -0,0 +1,88 @@
+"""
+Overhead of loading the logged-in user on authenticated requests, with and without the user identity cache.
+
+Sends the same authenticated request (an admin page that only renders a template, so the cost is dominated by
+Flask-Login's user loader and the admin_required check of current_user.role) repeatedly through the test client,
+first with the user cache disabled (USER_CACHE_TTL = 0, one SELECT on the users table per request, as before the
+cache) and then enabled. For each run it reports the mean time per request and the number of SQL statements per
+request.
+
+The requests only read: run it against a development copy of the database, since importing the application starts
+it like any other process (scheduler included).
+
+Usage (from the repository root):
+    python benchmarks/user_loading.py [--requests 2000] [--user-id 1] [--path /communication_with_clients_sorting]
+"""
+import argparse
+import os
+import sys
+import time
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def run(app, client, path, requests, ttl):
+    """
+    Sends `requests` requests to `path` with the given cache TTL and returns (ms per request, statements per request).
+    """
+    from sqlalchemy import event
+    from models.models import db
+    from routes.user_cache import user_cache
+
+    user_cache.ttl = ttl
+    user_cache.clear()
+
+    statements = [0]
+
+    def count_statement(*args):
+        statements[0] += 1
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', count_statement)
+    try:
+        # Warm-up request (first-request initialisation, template compilation, filling the cache)
+        response = client.get(path)
+        if response.status_code != 200:
+            raise SystemExit(f'{path} returned {response.status_code}; check --user-id and --path')
+
+        statements[0] = 0
+        start = time.perf_counter()
+        for _ in range(requests):
+            client.get(path)
+        elapsed = time.perf_counter() - start
+    finally:
+        event.remove(engine, 'before_cursor_execute', count_statement)
+
+    return elapsed * 1000 / requests, statements[0] / requests
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=2000, help='number of measured requests per run')
+    parser.add_argument('--user-id', default='1', help='id of the (admin) user the requests are sent as')
+    parser.add_argument('--path', default='/communication_with_clients_sorting', help='page requested')
+    args = parser.parse_args()
+
+    os.chdir(ROOT)
+    from app import app
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = args.user_id
+
+    uncached = run(app, client, args.path, args.requests, ttl=0)
+    cached = run(app, client, args.path, args.requests, ttl=60)
+
+    print(f"{'':<22}{'per request':>14}{'SQL statements':>18}")
+    print(f"{'without user cache':<22}{uncached[0]:>11.3f} ms{uncached[1]:>18.2f}")
+    print(f"{'with user cache':<22}{cached[0]:>11.3f} ms{cached[1]:>18.2f}")
+    print(f'Saved {uncached[0] - cached[0]:.3f} ms and {uncached[1] - cached[1]:.2f} statements per request.')
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
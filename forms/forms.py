@@ -1,5 +1,5 @@
 from flask_wtf import FlaskForm
-from wtforms import StringField, FloatField, SubmitField, PasswordField, SelectField, DateField, TextAreaField
+from wtforms import StringField, DecimalField, SubmitField, PasswordField, SelectField, DateField, TextAreaField
 from wtforms.validators import DataRequired, Length, Email, NumberRange, EqualTo 
 
 
@@ -42,8 +42,8 @@ class TransferForm(FlaskForm):
                                            used to identify the bank's branch. This field is mandatory.
         recipient_account_number (StringField): Input field for the recipient's account number. This field is
                                                 mandatory and must be provided to complete the transfer.
-        amount (FloatField): Input field for the amount of money to be transferred. This field requires a float
-                             value and is mandatory.
+        amount (DecimalField): Input field for the amount of money to be transferred. This field requires a decimal
+                               value and is mandatory; it is parsed exactly and rounded to pence, never to a float.
         transaction_description (StringField): Input field for providing a description or memo for the transaction.
                                                This field is mandatory and helps in identifying the purpose of the
                                                transfer.
@@ -58,7 +58,7 @@ class TransferForm(FlaskForm):
     """
     recipient_sort_code = StringField('Recipient Sort Code', validators=[DataRequired()])
     recipient_account_number = StringField('Recipient Account Number', validators=[DataRequired()])
-    amount = FloatField('Amount', validators=[DataRequired()])
+    amount = DecimalField('Amount', places=2, validators=[DataRequired()])
     transaction_description = StringField('Description', validators=[DataRequired()])
     confirm_password = PasswordField('Confirm Password', validators=[DataRequired()])
     submit = SubmitField('Transfer')
@@ -120,12 +120,12 @@ class CreateTransactionForm(FlaskForm):
                                       mandatory and has specified length constraints.
         transaction_description (StringField): Field for a descriptive memo of the transaction. It is mandatory to
                                                provide context for the transaction.
-        debit_amount (FloatField): Field for specifying the debit amount in the transaction. It must be a non-negative
-                                   value, allowing for validation of transaction amounts.
-        credit_amount (FloatField): Field for specifying the credit amount in the transaction. Similar to debit_amount,
-                                    it requires a non-negative value.
-        balance (FloatField): Field for the balance after the transaction. It is validated to ensure a non-negative value,
-                              reflecting the account's financial state post-transaction.
+        debit_amount (DecimalField): Field for specifying the debit amount in the transaction. It must be a non-negative
+                                     value, allowing for validation of transaction amounts.
+        credit_amount (DecimalField): Field for specifying the credit amount in the transaction. Similar to debit_amount,
+                                      it requires a non-negative value.
+        balance (DecimalField): Field for the balance after the transaction. It is validated to ensure a non-negative value,
+                                reflecting the account's financial state post-transaction.
         submit (SubmitField): A submit button to finalize the creation of the transaction record.
 
     This form is designed for use in administrative or operational views where transactions need to be manually
@@ -138,9 +138,9 @@ class CreateTransactionForm(FlaskForm):
     sort_code = StringField('Sort Code', validators=[DataRequired(), Length(min=6, max=10)])
     account_number = StringField('Account Number', validators=[DataRequired(), Length(min=5, max=20)])
     transaction_description = StringField('Description', validators=[DataRequired()])
-    debit_amount = FloatField('Debit Amount', validators=[NumberRange(min=0)])
-    credit_amount = FloatField('Credit Amount', validators=[NumberRange(min=0)])
-    balance = FloatField('Balance', validators=[NumberRange(min=0)])
+    debit_amount = DecimalField('Debit Amount', places=2, validators=[NumberRange(min=0)])
+    credit_amount = DecimalField('Credit Amount', places=2, validators=[NumberRange(min=0)])
+    balance = DecimalField('Balance', places=2, validators=[NumberRange(min=0)])
     submit = SubmitField('Create Transaction')
     
     
@@ -154,7 +154,7 @@ class DDSOForm(FlaskForm):
     the form, providing CSRF protection and validation of the input data.
 
     Attributes:
-        amount (FloatField): Field for specifying the payment amount. Requires a non-negative value and is mandatory.
+        amount (DecimalField): Field for specifying the payment amount. Requires a non-negative value and is mandatory.
         recipient (StringField): Input field for the name or identifier of the payment recipient. It is mandatory.
         reference_number (StringField): Field for a unique reference number for the transaction. It is mandatory for
                                         tracking and identification purposes.
@@ -172,7 +172,7 @@ class DDSOForm(FlaskForm):
     This form facilitates the automated processing of regular payments, enabling users to manage their financial
     commitments through Direct Debits and Standing Orders efficiently.
     """
-    amount = FloatField('Amount', validators=[DataRequired(), NumberRange(min=0)])
+    amount = DecimalField('Amount', places=2, validators=[DataRequired(), NumberRange(min=0)])
     recipient = StringField('Recipient', validators=[DataRequired()])
     reference_number = StringField('Reference number', validators=[DataRequired()])
     next_payment_date = DateField('Next payment date', format='%Y-%m-%d', validators=[DataRequired()])
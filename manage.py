@@ -1,13 +1,19 @@
 from flask import Flask
 from flask.cli import FlaskGroup
-from werkzeug.security import generate_password_hash
-from app import db, User  # Zaimportuj odpowiednie modele
+from models.models import db, Users  # Zaimportuj odpowiednie modele
+from migrations import migrate as apply_migrations, current_version, latest_version
+from routes.sqlite_profile import sqlite_profile
 import click
 
+# A minimal application bound to the same database as the web application, so the commands below do not start the
+# scheduler or the background writers of the full application
 app = Flask(__name__)
 app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///ib_database_users.db'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+sqlite_profile.init_app(app)
 db.init_app(app)
+with app.app_context():
+    sqlite_profile.attach(db.engine)
 
 # Komenda CLI do tworzenia klienta
 @app.cli.command('create_client')
@@ -16,10 +22,10 @@ db.init_app(app)
 def create_client(username, password):
     """Create a new client."""
     with app.app_context():
-        existing_client = User.query.filter_by(username=username).first()
+        existing_client = Users.query.filter_by(username=username).first()
 
         if not existing_client:
-            client = User(username=username, role='client')
+            client = Users(username=username, role='client')
             client.set_password(password)
             db.session.add(client)
             db.session.commit()
@@ -28,6 +34,28 @@ def create_client(username, password):
             print(f"Client '{username}' already exists.")
 
 
+# CLI command applying the schema migrations
+@app.cli.command('migrate')
+@click.option('--target', type=int, default=None, help='Stop after this schema version (default: the latest)')
+def migrate(target):
+    """Apply the database schema migrations the database has not had yet."""
+    with app.app_context():
+        before = current_version()
+        after = apply_migrations(target=target)
+        if after == before:
+            print(f'The database schema is up to date (version {after}).')
+        else:
+            print(f'The database schema was migrated from version {before} to version {after}.')
+
+
+# CLI command showing the schema version
+@app.cli.command('schema_version')
+def schema_version():
+    """Show the schema version of the database and the latest migration."""
+    with app.app_context():
+        print(f'Database schema version: {current_version()}, latest migration: {latest_version()}.')
+
+
 if __name__ == '__main__':
-    cli = FlaskGroup(app)
-    cli()
\ No newline at end of file
+    cli = FlaskGroup(create_app=lambda: app)
+    cli()
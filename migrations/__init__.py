@@ -0,0 +1,120 @@
+"""
+Versioned schema migrations of the application database.
+
+Every module of this package named 'v<NNN>_<description>.py' is one migration: it defines VERSION (its number, one
+higher than the previous migration's), DESCRIPTION and upgrade(), which changes the schema (and data) from the
+previous version to its own. upgrade() runs inside the application context, with `db` bound to the database being
+migrated.
+
+The version of a database is recorded in its 'schema_version' table, one row per applied migration. The migrations
+are applied by `python manage.py migrate`; at startup the application only compares the recorded version with the
+latest one (see check_schema()), instead of inspecting the schema on every request.
+"""
+import importlib
+import pkgutil
+import re
+from datetime import datetime
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from models.models import db
+
+
+SCHEMA_VERSION_TABLE = """
+CREATE TABLE IF NOT EXISTS schema_version (
+    version INTEGER PRIMARY KEY,
+    description TEXT NOT NULL,
+    applied_at TEXT NOT NULL
+)
+"""
+
+MIGRATION_MODULE = re.compile(r'^v(\d{3})_\w+$')
+
+
+
+def migrations():
+    """
+    Returns the migration modules of this package, ordered by version.
+    """
+    modules = []
+    for module_info in pkgutil.iter_modules(__path__):
+        if MIGRATION_MODULE.match(module_info.name):
+            modules.append(importlib.import_module(f'{__name__}.{module_info.name}'))
+    modules.sort(key=lambda module: module.VERSION)
+
+    for expected, module in enumerate(modules, start=1):
+        if module.VERSION != expected:
+            raise RuntimeError(f'Migration {module.__name__} has version {module.VERSION}, expected {expected}.')
+    return modules
+
+
+def latest_version():
+    return len(migrations())
+
+
+def current_version():
+    """
+    Returns the schema version of the database, 0 if no migration has been applied yet.
+    """
+    try:
+        with db.engine.connect() as connection:
+            return connection.execute(text('SELECT MAX(version) FROM schema_version')).scalar() or 0
+    except OperationalError:
+        # No schema_version table: a new database, or one created before the migrations existed
+        return 0
+
+
+def migrate(target=None, echo=print):
+    """
+    Applies the migrations the database has not had yet, in order, each recorded in 'schema_version' as it completes.
+
+    Parameters:
+    - target (int, optional): Stop after this version. Defaults to the latest one.
+    - echo (callable): Called with a progress message for each migration.
+
+    Returns:
+    - int: The schema version of the database afterwards.
+    """
+    with db.engine.begin() as connection:
+        connection.execute(text(SCHEMA_VERSION_TABLE))
+
+    version = current_version()
+    for module in migrations():
+        if module.VERSION <= version or (target is not None and module.VERSION > target):
+            continue
+        echo(f'Applying migration {module.VERSION}: {module.DESCRIPTION}')
+        module.upgrade()
+        db.session.commit()
+        with db.engine.begin() as connection:
+            connection.execute(text('INSERT INTO schema_version (version, description, applied_at) '
+                                    'VALUES (:version, :description, :applied_at)'),
+                               {'version': module.VERSION, 'description': module.DESCRIPTION,
+                                'applied_at': datetime.utcnow().isoformat(sep=' ', timespec='seconds')})
+        version = module.VERSION
+
+    return version
+
+
+def check_schema(auto_migrate=False):
+    """
+    Startup check: compares the database's schema version with the latest migration.
+
+    Parameters:
+    - auto_migrate (bool): Apply the missing migrations instead of failing, for development databases.
+
+    Returns:
+    - int: The schema version of the database.
+
+    Raises:
+    - RuntimeError: If the database is behind and auto_migrate is False, or if it is newer than the application.
+    """
+    version = current_version()
+    latest = latest_version()
+    if version == latest:
+        return version
+    if version > latest:
+        raise RuntimeError(f'The database schema is at version {version}, newer than the application '
+                           f'(version {latest}).')
+    if not auto_migrate:
+        raise RuntimeError(f'The database schema is at version {version}, the application needs version {latest}. '
+                           f'Run "python manage.py migrate".')
+    return migrate()
@@ -0,0 +1,15 @@
+"""
+Creates the tables of the application's models that do not exist yet.
+
+Databases created before the migrations existed already have most of them; only the missing ones are created.
+"""
+from models.models import db
+
+
+VERSION = 1
+DESCRIPTION = 'Initial schema'
+
+
+def upgrade():
+    # All the models are on the default bind; the read replica bind is a copy of it and is never created
+    db.create_all(bind_key=None)
@@ -0,0 +1,13 @@
+"""
+Adds the priority rank and the work queue indexes to the support ticket thread headers, and creates the headers of
+the threads stored before the headers existed.
+"""
+from routes.tickets import backfill_ticket_headers
+
+
+VERSION = 2
+DESCRIPTION = 'Ticket thread headers and work queue indexes'
+
+
+def upgrade():
+    backfill_ticket_headers()
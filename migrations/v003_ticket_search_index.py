@@ -0,0 +1,12 @@
+"""
+Creates the full-text search index of the support ticket messages and fills it with the stored messages.
+"""
+from routes.ticket_search import ensure_ticket_search_index
+
+
+VERSION = 3
+DESCRIPTION = 'Full-text search index of the support tickets'
+
+
+def upgrade():
+    ensure_ticket_search_index()
@@ -0,0 +1,75 @@
+"""
+Stores the money columns of the ledger (transactions, direct debits and standing orders, loans) as INTEGER minor units
+instead of floating point, converting the existing amounts to pence.
+
+SQLite cannot change the type of a column, so each table is rebuilt: a copy with the new column types is created
+from the model, the rows are copied with every amount rounded to the nearest minor unit, the old table is dropped and
+the copy renamed in its place, and the model's indexes are created again. All tables are converted in a single
+transaction, so an interrupted migration leaves the database as it was.
+"""
+from sqlalchemy.schema import CreateIndex, CreateTable
+from models.models import db, Transaction, DDSO, Loans
+from models.money import MINOR_UNITS
+
+
+VERSION = 4
+DESCRIPTION = 'Money stored as integer minor units'
+
+MONEY_COLUMNS = {
+    Transaction: ('debit_amount', 'credit_amount', 'balance'),
+    DDSO: ('amount',),
+    Loans: ('nominal_amount', 'installment_amount', 'total_amount_to_be_repaid', 'remaining_amount_to_be_repaid',
+            'loan_cost'),
+}
+
+
+def rebuild_table(cursor, dialect, model, money_columns):
+    """
+    Rebuilds the table of `model` with its money columns as INTEGER minor units, unless they already are (a table
+    created from the current models by the initial migration).
+    """
+    table = model.__table__
+    preparer = dialect.identifier_preparer
+    quoted_name = preparer.format_table(table)
+
+    column_types = {row[1]: row[2].upper() for row in cursor.execute(f'PRAGMA table_info({quoted_name})')}
+    if all(column_types.get(column) == 'INTEGER' for column in money_columns):
+        return
+
+    temp_name = preparer.quote(f'{table.name}_minor_units')
+    create = str(CreateTable(table).compile(dialect=dialect)).strip()
+    cursor.execute(create.replace(f'CREATE TABLE {quoted_name}', f'CREATE TABLE {temp_name}', 1))
+
+    columns = [column.name for column in table.columns if column.name in column_types]
+    selected = [f'CAST(ROUND({preparer.quote(column)} * {MINOR_UNITS}) AS INTEGER)' if column in money_columns
+                else preparer.quote(column) for column in columns]
+    cursor.execute(f'INSERT INTO {temp_name} ({", ".join(preparer.quote(column) for column in columns)}) '
+                   f'SELECT {", ".join(selected)} FROM {quoted_name}')
+
+    cursor.execute(f'DROP TABLE {quoted_name}')
+    cursor.execute(f'ALTER TABLE {temp_name} RENAME TO {quoted_name}')
+    for index in table.indexes:
+        cursor.execute(str(CreateIndex(index).compile(dialect=dialect)))
+
+
+def upgrade():
+    db.session.commit()
+    connection = db.engine.raw_connection()
+    sqlite_connection = connection.driver_connection
+    isolation_level = sqlite_connection.isolation_level
+    # Manual transaction control: the sqlite3 module does not begin a transaction before DDL statements by itself
+    sqlite_connection.isolation_level = None
+    cursor = sqlite_connection.cursor()
+    try:
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            for model, money_columns in MONEY_COLUMNS.items():
+                rebuild_table(cursor, db.engine.dialect, model, money_columns)
+            cursor.execute('COMMIT')
+        except Exception:
+            cursor.execute('ROLLBACK')
+            raise
+    finally:
+        cursor.close()
+        sqlite_connection.isolation_level = isolation_level
+        connection.close()
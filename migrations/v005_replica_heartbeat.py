@@ -0,0 +1,12 @@
+"""
+Creates the heartbeat table used to measure the lag of an external read replica (see models/read_replica.py).
+"""
+from models.models import db, ReplicaHeartbeat
+
+
+VERSION = 5
+DESCRIPTION = 'Read replica heartbeat'
+
+
+def upgrade():
+    ReplicaHeartbeat.__table__.create(db.engine, checkfirst=True)
@@ -1,10 +1,13 @@
 from flask_sqlalchemy import SQLAlchemy
-from werkzeug.security import generate_password_hash, check_password_hash
+from models.password_hasher import password_hasher
+from models.read_replica import RoutingSession
+from models.money import MoneyType
 from flask_login import UserMixin
 from datetime import date, datetime
 from flask_sqlalchemy import SQLAlchemy
 
-db = SQLAlchemy()
+# Sessions read from the read replica in views marked read-only (see models/read_replica.py)
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 
 class Users(db.Model, UserMixin):
@@ -18,7 +21,8 @@ class Users(db.Model, UserMixin):
     Attributes:
         id (db.Column): Unique identifier for the user, serves as the primary key.
         username (db.Column): Unique username for the user. It is a required field.
-        password_hash (db.Column): Hashed password for secure storage. It is a required field.
+        password_hash (db.Column): Hashed password for secure storage, in werkzeug's 'method$salt$hash' format (up to
+            162 characters for scrypt). It is a required field.
         role (db.Column): Role of the user in the system. Defaults to 'client'. It is a required field.
         email (db.Column): Unique email address for the user. It is a required field.
         phone_number (db.Column): Contact phone number for the user. It is a required field.
@@ -26,11 +30,12 @@ class Users(db.Model, UserMixin):
         transactions (db.relationship): One-to-many relationship linking users to their transactions.
 
     Methods:
-        set_password(self, password): Hashes the password and stores it.
+        set_password(self, password): Hashes the password with the configured method and work factor and stores it.
             Args:
                 password (str): Plain text password to be hashed and stored.
 
-        check_password(self, password): Verifies if the provided password matches the stored hash.
+        check_password(self, password): Verifies if the provided password matches the stored hash, in the password
+            hasher's worker pool (see models/password_hasher.py); raises PasswordHasherBusy when the pool is saturated.
             Args:
                 password (str): Plain text password to be verified against the stored hash.
             Returns:
@@ -38,7 +43,7 @@ class Users(db.Model, UserMixin):
     """
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(50), unique=True, nullable=False)
-    password_hash = db.Column(db.String(128), nullable=False)
+    password_hash = db.Column(db.String(255), nullable=False)
     role = db.Column(db.String(20), nullable=False, default='client')
     email = db.Column(db.String(120), unique=True, nullable=False)
     phone_number = db.Column(db.String(20), nullable = False)
@@ -46,10 +51,10 @@ class Users(db.Model, UserMixin):
     transactions = db.relationship('Transaction', backref='user', lazy=True)
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = password_hasher.hash(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return password_hasher.verify(self.password_hash, password)
     
 
 
@@ -73,7 +78,8 @@ class Transaction(db.Model):
         balance (db.Column): The resulting balance after the transaction. It is a required field.
 
     The model includes fields for both debit and credit amounts to accommodate different types of financial transactions.
-    The balance field reflects the account balance after the transaction has been processed.
+    The balance field reflects the account balance after the transaction has been processed. The amounts and the
+    balance are stored as integer minor units and read as Money (see models/money.py), so balances are exact.
     """
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     id = db.Column(db.Integer, primary_key=True)
@@ -82,9 +88,9 @@ class Transaction(db.Model):
     sort_code = db.Column(db.String(10), nullable=False)
     account_number = db.Column(db.String(20), nullable=False)
     transaction_description = db.Column(db.String(255) , nullable=False)
-    debit_amount = db.Column(db.Float)
-    credit_amount = db.Column(db.Float)
-    balance = db.Column(db.Float, nullable=False)  
+    debit_amount = db.Column(MoneyType)
+    credit_amount = db.Column(MoneyType)
+    balance = db.Column(MoneyType, nullable=False)  
     
     
 
@@ -133,7 +139,7 @@ class DDSO(db.Model):
         user_id (db.Column): Foreign key linking the DDSO to a user. Indicates the user who has set up the DDSO. It is a required field.
         recipient (db.Column): The name or identifier of the recipient of the DDSO. It is a required field.
         reference_number (db.Column): A unique reference number for the DDSO, possibly used by the bank or financial institution. It is a required field.
-        amount (db.Column): The amount of money to be transferred in each transaction. It is a required field.
+        amount (db.Column): The amount of money to be transferred in each transaction, as Money. It is a required field.
         transaction_type (db.Column): Specifies whether the DDSO is a direct debit or a standing order. It is a required field.
         frequency (db.Column): The frequency of the DDSO payments (e.g., 'daily', 'monthly'). This field is optional and can be left blank if not applicable.
         next_payment_date (db.Column): The date when the next payment is due. It is a required field.
@@ -145,7 +151,7 @@ class DDSO(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     recipient = db.Column(db.String(50),  nullable=False) 
     reference_number = db.Column(db.String(100), nullable=False)
-    amount = db.Column(db.Float, nullable=False)
+    amount = db.Column(MoneyType, nullable=False)
     transaction_type = db.Column(db.String(20), nullable=False)
     frequency = db.Column(db.String(50))  # 'daily' 'monthly' etc
     next_payment_date = db.Column(db.Date, nullable=False)
@@ -184,6 +190,50 @@ class SupportTickets(db.Model):
     category = db.Column(db.String(50), nullable=False, default='general')  # values: general, fraud, service problem, money transfer
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    # The messages of one thread are looked up by reference number and ordered by date
+    __table_args__ = (db.Index('ix_support_tickets_reference_created', 'reference_number', 'created_at'),)
+    
+    
+class TicketHeaders(db.Model):
+    """
+    Model for the header of a support ticket thread, one row per reference number.
+
+    Each message of a thread (the user's query and every reply) is a row of SupportTickets. The header keeps the
+    current state of the whole thread, updated whenever a message is added, so the ticket listings read one indexed
+    row per thread instead of grouping all messages by reference number to find the latest one.
+
+    Attributes:
+        id (db.Column): Unique identifier for the thread, serves as the primary key.
+        reference_number (db.Column): Reference number of the thread. It is unique and required.
+        user_id (db.Column): Foreign key linking the thread to the user who opened it. It is a required field.
+        title (db.Column): Title of the thread. It is a required field.
+        category (db.Column): Category of the thread ('general', 'fraud', 'service problem', 'money transfer').
+        status (db.Column): Status of the latest message ('new', 'in progress', 'closed', 'rejected').
+        priority (db.Column): Priority of the thread ('normal', 'high', 'urgent').
+        priority_rank (db.Column): Position of the priority in the work queue (1 = urgent, 2 = high, 3 = normal),
+            stored so the queue can be read in order from an index.
+        created_at (db.Column): Timestamp of the first message of the thread.
+        last_message_at (db.Column): Timestamp of the latest message of the thread.
+        last_message_id (db.Column): Foreign key of the latest message in SupportTickets.
+        message_count (db.Column): Number of messages in the thread.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    reference_number = db.Column(db.String(50), unique=True, nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    title = db.Column(db.String(100), nullable=False)
+    category = db.Column(db.String(50), nullable=False, default='general')
+    status = db.Column(db.String(50), nullable=False, default='new')
+    priority = db.Column(db.String(50), nullable=False, default='normal')
+    priority_rank = db.Column(db.Integer, nullable=False, default=3)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    last_message_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    last_message_id = db.Column(db.Integer, db.ForeignKey('support_tickets.id'))
+    message_count = db.Column(db.Integer, nullable=False, default=0)
+    
+    __table_args__ = (db.Index('ix_ticket_headers_user_last_message', 'user_id', 'last_message_at'),
+                      db.Index('ix_ticket_headers_queue', 'priority_rank', 'last_message_at', 'id'),
+                      db.Index('ix_ticket_headers_status_queue', 'status', 'priority_rank', 'last_message_at', 'id'))
+    
     
 class LockedUsers(db.Model):
     """
@@ -241,22 +291,23 @@ class Loans(db.Model):
         notes (db.Column): Additional notes or comments about the loan. Optional.
 
     The model supports detailed tracking of loans, including repayment progress and financial terms,
-    aiding both users and administrators in monitoring and managing loan obligations.
+    aiding both users and administrators in monitoring and managing loan obligations. The money fields are stored
+    as integer minor units and read as Money.
     """
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     recipient = db.Column(db.String(100), nullable=False)
     product_id = db.Column(db.String(50), nullable=False)
     transaction_type = db.Column(db.String(20), nullable=False, default='LOAN')
-    nominal_amount = db.Column(db.Float, nullable=False)
+    nominal_amount = db.Column(MoneyType, nullable=False)
     interest = db.Column(db.String(20), nullable=False)
-    installment_amount = db.Column(db.Float, nullable=False)
+    installment_amount = db.Column(MoneyType, nullable=False)
     installments_number = db.Column(db.Integer, nullable=False)
     installments_paid = db.Column(db.Integer, nullable=False)
     installments_to_be_paid = db.Column(db.Integer, nullable=False)
-    total_amount_to_be_repaid = db.Column(db.Float, nullable=False)
-    remaining_amount_to_be_repaid = db.Column(db.Float, nullable=False)
-    loan_cost = db.Column(db.Float, nullable=False)
+    total_amount_to_be_repaid = db.Column(MoneyType, nullable=False)
+    remaining_amount_to_be_repaid = db.Column(MoneyType, nullable=False)
+    loan_cost = db.Column(MoneyType, nullable=False)
     interest_type = db.Column(db.String(20), nullable=False)
     loan_status = db.Column(db.String(20), nullable=False)
     frequency = db.Column(db.Integer, nullable=False) # eg. 1 = daily, 30 = monthly
@@ -265,4 +316,69 @@ class Loans(db.Model):
     next_payment_date = db.Column(db.Date, nullable=False)
     currency_code = db.Column(db.String(3), nullable=False)
     loan_purpose = db.Column(db.String(255), nullable=False)
-    notes = db.Column(db.Text)
\ No newline at end of file
+    notes = db.Column(db.Text)    
+    
+class ReportSnapshots(db.Model):
+    """
+    Model for storing precomputed snapshots of the admin report aggregates.
+
+    Computing the admin reports requires group-bys over the users, transactions, support tickets and loans tables
+    and a scan of the application log. A scheduled job computes all of these aggregates at once and stores them in
+    this table, so the admin views only need to read the latest snapshot.
+
+    Attributes:
+        id (db.Column): Unique identifier for the snapshot, serves as the primary key. Newer snapshots have higher ids.
+        generated_at (db.Column): UTC timestamp of when the aggregates were computed. It is a required field.
+        data (db.Column): The aggregates serialized as JSON. It is a required field.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    generated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    data = db.Column(db.Text, nullable=False)
+    
+    
+class AdminCounters(db.Model):
+    """
+    Model for the counters shown on the admin dashboard.
+
+    Each row holds one named counter (e.g. the number of users or of locked accounts). The counters are updated in
+    the same transaction as the change they count, by the code paths that add or delete users, lock or unlock
+    accounts and create or delete support tickets, so the dashboard reads them instead of counting the tables.
+
+    Attributes:
+        name (db.Column): Name of the counter, serves as the primary key.
+        value (db.Column): Current value of the counter. It is a required field.
+    """
+    name = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
+    
+    
+class Sequences(db.Model):
+    """
+    Model for named number sequences, such as the numbers of the support ticket reference numbers.
+
+    Each row holds the next value that has not been handed out yet. Application processes reserve whole blocks of
+    numbers by advancing next_value in a short transaction of their own, and hand the numbers of a block out from
+    memory.
+
+    Attributes:
+        name (db.Column): Name of the sequence, serves as the primary key.
+        next_value (db.Column): The first value not yet reserved by any process. It is a required field.
+    """
+    name = db.Column(db.String(50), primary_key=True)
+    next_value = db.Column(db.Integer, nullable=False)
+    
+    
+class ReplicaHeartbeat(db.Model):
+    """
+    Model for the heartbeat row used to measure the lag of an external read replica.
+
+    The read replica refresh job writes the current time into the single row of this table on the primary database
+    and reads it back from the replica: the time found there is how far the replica has caught up with the primary.
+
+    Attributes:
+        id (db.Column): Always 1, serves as the primary key.
+        written_at (db.Column): Unix time of the latest heartbeat written on the primary. It is a required field.
+    """
+    __tablename__ = 'replica_heartbeat'
+    id = db.Column(db.Integer, primary_key=True)
+    written_at = db.Column(db.Float, nullable=False)
@@ -0,0 +1,160 @@
+from decimal import Decimal, ROUND_HALF_UP
+from functools import total_ordering
+from sqlalchemy import Integer
+from sqlalchemy.types import TypeDecorator
+
+
+MINOR_UNITS = 100  # Minor units (pence, cents) per major unit of every supported currency (GBP, USD, EUR)
+
+
+
+@total_ordering
+class Money:
+    """
+    An amount of money, held as an integer number of minor units (pence, cents).
+
+    Arithmetic between amounts is integer arithmetic, so a running balance computed as
+    `last_transaction.balance - amount` is exact however many transactions it goes through, unlike the binary
+    floating point the ledger used before. Plain numbers (int, float, Decimal or numeric str, in major units) are
+    accepted wherever an amount is: in arithmetic they are converted with Money.of(), rounding to the nearest minor
+    unit, so existing code such as `balance + 5000` keeps working, and they are compared exactly with the amount (as
+    int, float and Decimal compare with each other), so `balance < amount` works too and equal values hash equally.
+
+    str() gives the amount in major units with two decimals ('1250.50'), float() the nearest float, for templates,
+    exports and charts.
+    """
+
+    __slots__ = ('minor_units',)
+
+    def __init__(self, minor_units=0):
+        if not isinstance(minor_units, int):
+            raise TypeError(f'Money takes an integer number of minor units, not {minor_units!r}; use Money.of()')
+        self.minor_units = minor_units
+
+    @classmethod
+    def of(cls, amount):
+        """
+        Converts an amount in major units (int, float, Decimal or str) to Money, rounded half up to a minor unit.
+        """
+        if isinstance(amount, Money):
+            return amount
+        if isinstance(amount, int):
+            return cls(amount * MINOR_UNITS)
+        if isinstance(amount, float):
+            # The shortest repr is the decimal number the float was meant to be (0.1 and not 0.1000000000000000055...)
+            amount = Decimal(repr(amount))
+        elif not isinstance(amount, Decimal):
+            amount = Decimal(str(amount))
+        return cls(int((amount * MINOR_UNITS).to_integral_value(rounding=ROUND_HALF_UP)))
+
+    def to_decimal(self):
+        return Decimal(self.minor_units).scaleb(-2)
+
+    @staticmethod
+    def _coerce(other):
+        if isinstance(other, (Money, int, float, Decimal)) and not isinstance(other, bool):
+            return Money.of(other)
+        return None
+
+    def __add__(self, other):
+        other = self._coerce(other)
+        if other is None:
+            return NotImplemented
+        return Money(self.minor_units + other.minor_units)
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        other = self._coerce(other)
+        if other is None:
+            return NotImplemented
+        return Money(self.minor_units - other.minor_units)
+
+    def __rsub__(self, other):
+        other = self._coerce(other)
+        if other is None:
+            return NotImplemented
+        return Money(other.minor_units - self.minor_units)
+
+    def __mul__(self, factor):
+        if isinstance(factor, int) and not isinstance(factor, bool):
+            return Money(self.minor_units * factor)
+        if isinstance(factor, Decimal):
+            return Money.of(self.to_decimal() * factor)
+        return NotImplemented
+
+    __rmul__ = __mul__
+
+    def __neg__(self):
+        return Money(-self.minor_units)
+
+    def __pos__(self):
+        return self
+
+    def __abs__(self):
+        return Money(abs(self.minor_units))
+
+    @staticmethod
+    def _compared(other):
+        # Comparisons are exact, as between int, float and Decimal: Money('0.10') is not equal to the float 0.1
+        if isinstance(other, Money):
+            return other.to_decimal()
+        if isinstance(other, (int, float, Decimal)) and not isinstance(other, bool):
+            return Decimal(other)
+        return None
+
+    def __eq__(self, other):
+        other = self._compared(other)
+        if other is None:
+            return NotImplemented
+        return self.to_decimal() == other
+
+    def __lt__(self, other):
+        other = self._compared(other)
+        if other is None:
+            return NotImplemented
+        return self.to_decimal() < other
+
+    def __hash__(self):
+        # Equal to the hash of the int, float or Decimal the amount compares equal to, as __eq__ requires
+        return hash(self.to_decimal())
+
+    def __bool__(self):
+        return self.minor_units != 0
+
+    def __float__(self):
+        return self.minor_units / MINOR_UNITS
+
+    def __str__(self):
+        return str(self.to_decimal())
+
+    def __format__(self, format_spec):
+        return format(self.to_decimal(), format_spec)
+
+    def __repr__(self):
+        return f"Money('{self}')"
+
+
+
+class MoneyType(TypeDecorator):
+    """
+    Column type storing Money as an INTEGER number of minor units.
+
+    Values bound to it (including the literals of comparisons such as `Transaction.balance >= 100`) are converted
+    with Money.of(), and rows read from it are returned as Money. Expressions over money columns keep the type, so
+    `func.sum(Transaction.debit_amount)` is summed by the database in exact integer arithmetic and comes back as Money.
+    """
+
+    impl = Integer
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return Money.of(value).minor_units
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        # int() also accepts the whole-number floats of a column not yet converted by the migration
+        return Money(int(value))
@@ -0,0 +1,112 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.security import generate_password_hash, check_password_hash
+
+
+
+class PasswordHasherBusy(Exception):
+    """
+    Raised when a password verification is refused because too many are already waiting for a worker.
+    """
+
+
+
+class PasswordHasher:
+    """
+    Hashes and verifies the users' passwords with a configurable algorithm and work factor.
+
+    Hashing and verification use werkzeug's password helpers, so hashes keep the 'method$salt$hash' format and every
+    hash records the parameters it was made with. A hash made with other parameters than the configured ones (an
+    older algorithm or a lower work factor) still verifies; needs_rehash() reports it, so the login route can hash
+    the password again with the current parameters while it knows the plain text.
+
+    Verifications run in a bounded pool of PASSWORD_HASH_WORKERS threads instead of on the request thread. The key
+    derivation functions release the GIL, so the pool uses up to that many cores, and it caps the CPU that logins and
+    payment confirmations can take at once. At most PASSWORD_HASH_MAX_PENDING verifications may be running or waiting;
+    beyond that verify() raises PasswordHasherBusy at once, and the application answers 503 Service Unavailable,
+    instead of queueing requests that would time out anyway. Setting PASSWORD_HASH_WORKERS to 0 verifies on the
+    request thread.
+
+    Configuration (read in init_app):
+    - PASSWORD_HASH_METHOD (str): werkzeug hash method with its work factor, e.g. 'scrypt:32768:8:1' or
+      'pbkdf2:sha256:600000'. Defaults to 'scrypt:32768:8:1'.
+    - PASSWORD_HASH_WORKERS (int): Size of the verification pool. Defaults to the number of CPUs.
+    - PASSWORD_HASH_MAX_PENDING (int): Maximum number of verifications running or waiting. Defaults to four per worker.
+    """
+
+    def __init__(self, method='scrypt:32768:8:1', workers=None, max_pending=None):
+        self.method = method
+        self.workers = workers if workers is not None else (os.cpu_count() or 1)
+        self.max_pending = max_pending if max_pending is not None else 4 * max(self.workers, 1)
+        self._pool = None
+        self._pending = None
+        self._method_prefix = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.method = app.config.setdefault('PASSWORD_HASH_METHOD', self.method)
+        self.workers = app.config.setdefault('PASSWORD_HASH_WORKERS', self.workers)
+        self.max_pending = app.config.setdefault('PASSWORD_HASH_MAX_PENDING', 4 * max(self.workers, 1))
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False)
+            self._pool = None
+        app.extensions['password_hasher'] = self
+
+    def _executor(self):
+        with self._lock:
+            if self._pool is None and self.workers:
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='password-hasher')
+                self._pending = threading.BoundedSemaphore(self.max_pending)
+            return self._pool
+
+    def hash(self, password):
+        """
+        Returns the hash of a password, made with the configured method and work factor.
+        """
+        return generate_password_hash(password, method=self.method)
+
+    def verify(self, password_hash, password):
+        """
+        Checks a password against a stored hash, in the verification pool.
+
+        Parameters:
+        - password_hash (str): The stored hash.
+        - password (str): The password to check.
+
+        Returns:
+        - bool: True if the password matches.
+
+        Raises:
+        - PasswordHasherBusy: If PASSWORD_HASH_MAX_PENDING verifications are already running or waiting.
+        """
+        pool = self._executor()
+        if pool is None:
+            return check_password_hash(password_hash, password)
+
+        pending = self._pending
+        if not pending.acquire(blocking=False):
+            raise PasswordHasherBusy()
+        try:
+            return pool.submit(check_password_hash, password_hash, password).result()
+        finally:
+            pending.release()
+
+    def needs_rehash(self, password_hash):
+        """
+        Returns True if a stored hash was made with other parameters than the configured method and work factor.
+        """
+        return password_hash.split('$', 1)[0] != self.current_method()
+
+    def current_method(self):
+        """
+        Returns the configured method as werkzeug writes it into hashes, with its defaults filled in (e.g. 'scrypt' is
+        written as 'scrypt:32768:8:1'). Found by hashing an empty password once per configured method.
+        """
+        if self._method_prefix is None or self._method_prefix[0] != self.method:
+            self._method_prefix = (self.method, generate_password_hash('', method=self.method).split('$', 1)[0])
+        return self._method_prefix[1]
+
+
+password_hasher = PasswordHasher()
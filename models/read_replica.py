@@ -0,0 +1,270 @@
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from flask import g, has_app_context, has_request_context, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import text
+
+
+REPLICA_BIND = 'replica'
+
+# Table of the heartbeat row read back from the replica to measure its lag: written on the primary for an external
+# replica, and into the copy itself for a snapshot
+HEARTBEAT_TABLE = 'replica_heartbeat'
+
+# Session key of the time of the user's latest commit, for reading one's own writes in every worker process
+LAST_WRITE_KEY = 'last_write_at'
+
+
+
+class ReadReplica:
+    """
+    Routes the queries of read-only views to a replica of the application database, keeping writes on the primary.
+
+    Views marked with the read_only decorator (reports, transaction filtering, the support work queue, statements)
+    read through the 'replica' bind, so their long scans and group-bys do not hold connections and read locks of the
+    primary that transfers, logins and the scheduler's payment jobs are waiting for. Every other view, and any
+    flush or INSERT/UPDATE/DELETE statement issued by a read-only view, uses the primary.
+
+    By default the replica is a snapshot of the primary SQLite database, copied with SQLite's online backup API into a
+    file in the instance folder every READ_REPLICA_REFRESH_SECONDS seconds (refresh(), run by the scheduler) and
+    opened read-only. The copy reads the whole database, so its cost grows with the size of the database; it is made
+    once per interval for all the worker processes (whichever process's job comes first, the others find a recent
+    snapshot file and only reopen it), and should be replaced by an external replica once the database gets large.
+    READ_REPLICA_URI may point to such an external replica instead; it is then refreshed by whatever replicates it,
+    not by this class.
+
+    The freshness of the replica is measured the same way in both cases, in every process: the heartbeat row
+    ('replica_heartbeat') read from the replica holds the time up to which it has the primary's data. For a snapshot,
+    the time the copy was started is written into the copy itself; for an external replica, the refresh job writes
+    the current time into the row on the primary and reads back the replicated one. Until a heartbeat has been read
+    from the replica, it is not used.
+
+    Staleness bound: a replica whose heartbeat is older than READ_REPLICA_MAX_STALENESS seconds (e.g. because the
+    refresh job fails or replication falls behind) is not used, and reads fall back to the primary. Read-your-writes:
+    the time of a user's latest commit is kept in their session ('last_write_at'), so whichever worker process serves
+    their next request reads from the primary until the replica's heartbeat is newer than that commit.
+
+    Configuration (read in init_app, before db.init_app creates the engines):
+    - READ_REPLICA_ENABLED (bool): Whether read-only views use the replica at all. Defaults to True.
+    - READ_REPLICA_URI (str): URI of an external replica. Defaults to None (a snapshot of the primary).
+    - READ_REPLICA_SNAPSHOT_FILE (str): File of the snapshot. Defaults to 'ib_database_users.replica.db' in the
+      instance folder.
+    - READ_REPLICA_REFRESH_SECONDS (int): Interval of the snapshot refresh job. Defaults to 60.
+    - READ_REPLICA_MAX_STALENESS (int): Age in seconds after which a snapshot is no longer read. Defaults to 180.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.snapshot_file = None
+        # Whether the replica is an external database (READ_REPLICA_URI), whose lag is measured with the heartbeat
+        self.external = False
+        self.refresh_seconds = 60
+        self.max_staleness = 180
+        # Heartbeat time read from the replica (its data is at least this recent); None before the first
+        self.refreshed_at = None
+        # Modification time of the snapshot file the replica engine's connections have open
+        self._snapshot_mtime = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.enabled = app.config.setdefault('READ_REPLICA_ENABLED', True)
+        uri = app.config.setdefault('READ_REPLICA_URI', None)
+        self.snapshot_file = app.config.setdefault('READ_REPLICA_SNAPSHOT_FILE',
+                                                   os.path.join(app.instance_path, 'ib_database_users.replica.db'))
+        self.refresh_seconds = app.config.setdefault('READ_REPLICA_REFRESH_SECONDS', self.refresh_seconds)
+        self.max_staleness = app.config.setdefault('READ_REPLICA_MAX_STALENESS', self.max_staleness)
+        app.extensions['read_replica'] = self
+
+        if not self.enabled:
+            return
+        if uri is None:
+            # Opened read-only, so a query routed here by mistake can never write to the snapshot
+            uri = f'sqlite:///file:{os.path.abspath(self.snapshot_file)}?mode=ro&uri=true'
+        else:
+            self.snapshot_file = None
+            self.external = True
+        app.config.setdefault('SQLALCHEMY_BINDS', {})[REPLICA_BIND] = uri
+
+    def refresh(self, db):
+        """
+        Renews the snapshot if no process has done so in the current interval, and reads the replica's heartbeat.
+        Run periodically by the scheduler of every process, in an application context.
+
+        Returns:
+        - float: The heartbeat time read from the replica, or None if there is no replica or it could not be read.
+        """
+        if not self.enabled:
+            return None
+        if self.external:
+            self.write_heartbeat(db)
+        else:
+            if self._snapshot_age() is None or self._snapshot_age() >= self.refresh_seconds / 2:
+                self.copy_snapshot(db)
+            self._reopen_snapshot(db)
+        return self.read_heartbeat(db)
+
+    def _snapshot_age(self):
+        try:
+            return time.time() - os.path.getmtime(self.snapshot_file)
+        except OSError:
+            return None
+
+    def copy_snapshot(self, db):
+        """
+        Copies the primary database into the snapshot file, with the time the copy was started as its heartbeat.
+
+        The backup API copies a consistent state of the database while the primary keeps serving reads and (in WAL
+        mode) writes. The copy is made into a temporary file and then renamed over the previous snapshot, so queries
+        still running on the previous snapshot finish on it.
+        """
+        started = time.time()
+        temp_file = f'{self.snapshot_file}.{os.getpid()}.tmp'
+        source = db.engines[None].raw_connection()
+        try:
+            target = sqlite3.connect(temp_file)
+            try:
+                source.driver_connection.backup(target)
+                target.execute(f'INSERT INTO {HEARTBEAT_TABLE} (id, written_at) VALUES (1, ?) '
+                               f'ON CONFLICT (id) DO UPDATE SET written_at = excluded.written_at', (started,))
+                target.commit()
+                # The snapshot gets a rollback journal: it is only read, and a WAL file of the previous snapshot
+                # still open by a running query must not be taken for the new one's
+                target.execute('PRAGMA journal_mode = DELETE')
+            finally:
+                target.close()
+        finally:
+            source.close()
+        os.replace(temp_file, self.snapshot_file)
+
+    def _reopen_snapshot(self, db):
+        # Pooled connections keep the replaced file open: close them when the snapshot is a new file, whichever
+        # process copied it, so new connections open the new one
+        try:
+            mtime = os.path.getmtime(self.snapshot_file)
+        except OSError:
+            return
+        if mtime != self._snapshot_mtime:
+            db.engines[REPLICA_BIND].dispose()
+            self._snapshot_mtime = mtime
+
+    def write_heartbeat(self, db):
+        """
+        Writes the current time into the heartbeat row of the primary, to be replicated to the external replica.
+        """
+        with db.engines[None].begin() as connection:
+            connection.execute(text(f'INSERT INTO {HEARTBEAT_TABLE} (id, written_at) VALUES (1, :written_at) '
+                                    f'ON CONFLICT (id) DO UPDATE SET written_at = excluded.written_at'),
+                               {'written_at': time.time()})
+
+    def read_heartbeat(self, db):
+        """
+        Reads the heartbeat from the replica: it holds every commit made on the primary before that time. If it
+        cannot be read (no heartbeat yet, or the replica is down), the replica is no longer used once the previous
+        heartbeat is older than READ_REPLICA_MAX_STALENESS.
+
+        Returns:
+        - float: The heartbeat time read from the replica, or None if it could not be read.
+        """
+        try:
+            with db.engines[REPLICA_BIND].connect() as connection:
+                replicated = connection.execute(text(f'SELECT written_at FROM {HEARTBEAT_TABLE} WHERE id = 1')).scalar()
+        except Exception as e:
+            print('Read replica heartbeat could not be read:', e)
+            return None
+        if replicated is not None:
+            with self._lock:
+                if self.refreshed_at is None or replicated > self.refreshed_at:
+                    self.refreshed_at = replicated
+        return replicated
+
+    def use_replica(self):
+        """
+        Returns True if the queries of the current request may be read from the replica.
+        """
+        if not (self.enabled and has_request_context() and g.get('read_only_view')):
+            return False
+        refreshed_at = self.refreshed_at
+        if refreshed_at is None or time.time() - refreshed_at > self.max_staleness:
+            return False
+        last_write = session.get(LAST_WRITE_KEY)
+        return last_write is None or last_write < refreshed_at
+
+    def record_write(self):
+        # Called after a commit that wrote something; kept in the session, so it holds in every worker process
+        if has_request_context():
+            session[LAST_WRITE_KEY] = time.time()
+
+    def staleness(self):
+        """
+        Returns the age in seconds of the data on the replica, or None if there is no snapshot yet.
+        """
+        if self.refreshed_at is None:
+            return None
+        return max(0.0, time.time() - self.refreshed_at)
+
+
+read_replica = ReadReplica()
+
+
+
+class RoutingSession(Session):
+    """
+    Flask-SQLAlchemy session that reads from the replica bind in read-only views (see ReadReplica).
+
+    Flushes and INSERT/UPDATE/DELETE statements always go to the primary; a transaction that wrote is recorded in the
+    user's session at commit, so their next reads come from the primary until the replica has caught up.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None:
+            writing = self._flushing or getattr(clause, 'is_dml', False)
+            if writing:
+                self.info['wrote'] = True
+            elif read_replica.use_replica():
+                engine = self._db.engines.get(REPLICA_BIND)
+                if engine is not None:
+                    return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def commit(self):
+        super().commit()
+        if self.info.pop('wrote', False):
+            read_replica.record_write()
+
+    def rollback(self):
+        self.info.pop('wrote', None)
+        super().rollback()
+
+
+
+def read_only(view):
+    """
+    Marks a view as read-only, so its queries may be served by the read replica.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.read_only_view = True
+        return view(*args, **kwargs)
+
+    return wrapper
+
+
+
+@contextmanager
+def primary_reads():
+    """
+    Reads from the primary inside the block, even in a read-only view, for queries whose results are written back
+    (e.g. counters rebuilt from the tables) and so must not come from a stale replica.
+    """
+    read_only_view = has_app_context() and g.get('read_only_view', False)
+    if read_only_view:
+        g.read_only_view = False
+    try:
+        yield
+    finally:
+        if read_only_view:
+            g.read_only_view = True
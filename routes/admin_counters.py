@@ -0,0 +1,84 @@
+from models.models import Users, db, LockedUsers, AdminCounters, TicketHeaders
+from models.read_replica import primary_reads
+
+
+# Statuses of a support ticket thread, as stored by the ticket processing form ('in progres' is the stored value)
+TICKET_STATUSES = ('new', 'in progres', 'closed', 'rejected')
+
+
+def status_counter(status):
+    """
+    Returns the name of the counter of ticket threads with the given status, e.g. 'tickets_status_in_progress'.
+    """
+    return 'tickets_status_' + status.replace(' ', '_')
+
+
+# How each counter is computed from the tables, used to (re)build the counters
+COUNTER_SOURCES = {
+    'users': lambda: Users.query.count(),
+    'locked_users': lambda: LockedUsers.query.count(),
+    'tickets_normal': lambda: TicketHeaders.query.filter_by(priority='normal').count(),
+    'tickets_high': lambda: TicketHeaders.query.filter_by(priority='high').count(),
+    'tickets_urgent': lambda: TicketHeaders.query.filter_by(priority='urgent').count(),
+}
+COUNTER_SOURCES.update({status_counter(status): (lambda status=status: TicketHeaders.query.filter_by(status=status).count())
+                        for status in TICKET_STATUSES})
+
+
+
+def rebuild_admin_counters():
+    """
+    Recomputes every admin counter from the underlying tables and stores the values.
+
+    Used when the counters do not exist yet, and can be called at any time to correct them. The tables are always
+    read from the primary database, never from the read replica, since the values are stored.
+
+    Returns:
+    - dict: The counter values by name.
+    """
+    with primary_reads():
+        values = {name: source() for name, source in COUNTER_SOURCES.items()}
+    for name, value in values.items():
+        db.session.merge(AdminCounters(name=name, value=value))
+    db.session.commit()
+
+    return values
+
+
+
+def admin_counters():
+    """
+    Returns the admin dashboard counters.
+
+    Reading the counters is a single query over a handful of rows, independent of the size of the users, locked
+    users and support tickets tables. If some counter is missing (e.g. right after the table was created), all of
+    them are rebuilt from the tables first.
+
+    Returns:
+    - dict: The counter values by name: 'users', 'locked_users', 'tickets_normal', 'tickets_high', 'tickets_urgent'
+      and one 'tickets_status_<status>' counter per ticket status.
+    """
+    values = {counter.name: counter.value for counter in AdminCounters.query.all()}
+
+    if not all(name in values for name in COUNTER_SOURCES):
+        values = rebuild_admin_counters()
+
+    return values
+
+
+
+def increment_admin_counter(name, amount=1):
+    """
+    Adds `amount` (which may be negative) to an admin counter.
+
+    The update is added to the current database session and is not committed here: the caller commits it together
+    with the change being counted, so the counter can never disagree with the data after a rollback. The increment
+    is a single 'value = value + amount' statement, so concurrent requests cannot lose updates. If the counter does
+    not exist yet nothing is updated; it will be computed from the tables when it is first read.
+
+    Parameters:
+    - name (str): Name of the counter, e.g. 'locked_users'.
+    - amount (int): The value to add.
+    """
+    AdminCounters.query.filter_by(name=name).update({AdminCounters.value: AdminCounters.value + amount},
+                                                    synchronize_session=False)
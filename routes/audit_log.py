@@ -0,0 +1,290 @@
+import atexit
+import logging
+import math
+import os
+import queue
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+from flask import has_request_context, request
+from flask_login import current_user
+from routes.log_stats import LOG_RECORD
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS audit_log (
+    id INTEGER PRIMARY KEY,
+    created_at TEXT NOT NULL,
+    level TEXT NOT NULL,
+    event_type TEXT NOT NULL,
+    username TEXT,
+    path TEXT,
+    message TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_audit_log_created_at ON audit_log (created_at);
+CREATE INDEX IF NOT EXISTS ix_audit_log_level_created_at ON audit_log (level, created_at);
+CREATE INDEX IF NOT EXISTS ix_audit_log_username_created_at ON audit_log (username, created_at);
+"""
+
+INSERT = ('INSERT INTO audit_log (created_at, level, event_type, username, path, message) '
+          'VALUES (:created_at, :level, :event_type, :username, :path, :message)')
+
+
+
+class AuditLogPage:
+    """
+    One page of audit log records, with the same navigation attributes as Flask-SQLAlchemy's pagination object
+    (items, page, pages, total, has_prev, has_next, prev_num, next_num), so templates can page through it alike.
+
+    When the total number of records is not known (total is None), has_next must be given and pages is None.
+    """
+
+    def __init__(self, items, page, per_page, total, has_next=None):
+        self.items = items
+        self.page = page
+        self.per_page = per_page
+        self.total = total
+        self.pages = max(1, math.ceil(total / per_page)) if total is not None else None
+        self.has_prev = page > 1
+        self.has_next = has_next if has_next is not None else page < self.pages
+        self.prev_num = page - 1 if self.has_prev else None
+        self.next_num = page + 1 if self.has_next else None
+
+
+
+class AuditLog:
+    """
+    Structured, indexed store of the application's log records in a separate SQLite database.
+
+    Every record passed to the logger in routes/transfer.py is also written to the 'audit_log' table with its
+    timestamp, level, event type, username and request path, so the admin can filter the logs with indexed queries
+    instead of re-reading and splitting the whole 'app.log' file.
+
+    Records are not written by the request thread: AuditLogHandler only puts them on a queue, and a background writer
+    thread inserts them in batches of up to AUDIT_LOG_BATCH_SIZE records, one transaction per batch, at least every
+    AUDIT_LOG_FLUSH_INTERVAL seconds. Records logged before init_app() are kept on the queue until the writer starts.
+
+    Configuration (read in init_app):
+    - AUDIT_LOG_DATABASE (str): Path of the SQLite file. Defaults to 'audit_log.db' in the instance folder.
+    - AUDIT_LOG_BATCH_SIZE (int): Maximum number of records per insert transaction. Defaults to 100.
+    - AUDIT_LOG_FLUSH_INTERVAL (float): Maximum delay in seconds before a queued record is written. Defaults to 1.0.
+    - AUDIT_LOG_IMPORT_FILE (str): Log file whose existing records are imported when the store is created, so the
+      history from before the store existed stays searchable. Defaults to 'app.log'.
+    """
+
+    def __init__(self, database='audit_log.db', batch_size=100, flush_interval=1.0):
+        self.database = database
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue()
+        self._writer = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.database = app.config.setdefault('AUDIT_LOG_DATABASE', os.path.join(app.instance_path, 'audit_log.db'))
+        self.batch_size = app.config.setdefault('AUDIT_LOG_BATCH_SIZE', self.batch_size)
+        self.flush_interval = app.config.setdefault('AUDIT_LOG_FLUSH_INTERVAL', self.flush_interval)
+        import_file = app.config.setdefault('AUDIT_LOG_IMPORT_FILE', 'app.log')
+        app.extensions['audit_log'] = self
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.database)), exist_ok=True)
+        is_new = not os.path.exists(self.database)
+        connection = self._connect()
+        try:
+            connection.executescript(SCHEMA)
+        finally:
+            connection.close()
+        if is_new and import_file:
+            self.import_log_file(import_file)
+
+        self.start()
+
+    def _connect(self):
+        connection = sqlite3.connect(self.database, timeout=10)
+        connection.row_factory = sqlite3.Row
+        # WAL lets the admin view read while the writer thread (or another worker process) inserts
+        connection.execute('PRAGMA journal_mode=WAL')
+        return connection
+
+    def enqueue(self, entry):
+        self._queue.put(entry)
+
+    def start(self):
+        """
+        Starts the background writer thread (once) and makes sure queued records are written when the process exits.
+        """
+        with self._lock:
+            if self._writer is None or not self._writer.is_alive():
+                self._writer = threading.Thread(target=self._write_loop, name='audit-log-writer', daemon=True)
+                self._writer.start()
+                atexit.register(self.flush)
+
+    def _take_batch(self, timeout):
+        try:
+            batch = [self._queue.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write_batch(self, batch):
+        connection = self._connect()
+        try:
+            with connection:
+                connection.executemany(INSERT, batch)
+        except sqlite3.Error as e:
+            print('An error occurred. Audit log records could not be written:', e)
+        finally:
+            connection.close()
+
+    def _write_loop(self):
+        while True:
+            batch = self._take_batch(self.flush_interval)
+            if batch:
+                self._write_batch(batch)
+
+    def flush(self):
+        """
+        Writes all queued records immediately, in the calling thread.
+        """
+        while True:
+            batch = self._take_batch(0.01)
+            if not batch:
+                break
+            self._write_batch(batch)
+
+    def import_log_file(self, file_path):
+        """
+        Imports the records of an existing log file written in the '%(asctime)s - %(levelname)s - %(message)s' format.
+
+        Lines that do not start a record (e.g. tracebacks) are skipped. Imported records get the event type
+        'imported', since the plain log file carries no structured fields.
+
+        Parameters:
+        - file_path (str): The log file to import.
+
+        Returns:
+        - int: The number of imported records.
+        """
+        rows = []
+        try:
+            with open(file_path, 'r', encoding='utf-8', errors='replace') as file:
+                for line in file:
+                    match = LOG_RECORD.match(line)
+                    if not match or not match.group(1):
+                        continue
+                    rows.append({'created_at': line[:23], 'level': match.group(2), 'event_type': 'imported',
+                                 'username': None, 'path': None, 'message': line[match.end():].rstrip('\n')})
+        except FileNotFoundError:
+            return 0
+
+        connection = self._connect()
+        try:
+            with connection:
+                connection.executemany(INSERT, rows)
+        finally:
+            connection.close()
+
+        return len(rows)
+
+    def search(self, level=None, username=None, date_from=None, date_to=None, text=None, page=1, per_page=50):
+        """
+        Returns one page of audit log records matching the given filters, newest first.
+
+        Every filter is optional. Level, username and date range filters are answered from the indexes on
+        (level, created_at), (username, created_at) and (created_at); the text filter is a case-insensitive substring
+        match on the message, applied to the rows the other filters leave.
+
+        Parameters:
+        - level (str, optional): Log level, e.g. 'ERROR'.
+        - username (str, optional): Exact username.
+        - date_from (date, optional): First day to include.
+        - date_to (date, optional): Last day to include.
+        - text (str, optional): Text the message must contain.
+        - page (int): Page number, starting at 1.
+        - per_page (int): Number of records per page.
+
+        Returns:
+        - AuditLogPage: The records as dictionaries with the keys 'date', 'level', 'event_type', 'username', 'path'
+          and 'message', and the pagination attributes.
+        """
+        conditions = []
+        params = {}
+        if level:
+            conditions.append('level = :level')
+            params['level'] = level.upper()
+        if username:
+            conditions.append('username = :username')
+            params['username'] = username
+        if date_from:
+            conditions.append('created_at >= :date_from')
+            params['date_from'] = date_from.strftime('%Y-%m-%d')
+        if date_to:
+            # Timestamps are stored as 'YYYY-MM-DD HH:MM:SS,mmm' text, so the range ends before the following day
+            conditions.append('created_at < :date_to')
+            params['date_to'] = (date_to + timedelta(days=1)).strftime('%Y-%m-%d')
+        if text:
+            conditions.append("message LIKE :text ESCAPE '\\'")
+            escaped = text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+            params['text'] = f'%{escaped}%'
+
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        page = max(1, page)
+
+        connection = self._connect()
+        try:
+            total = connection.execute(f'SELECT COUNT(*) FROM audit_log {where}', params).fetchone()[0]
+            rows = connection.execute(f'SELECT created_at, level, event_type, username, path, message FROM audit_log '
+                                      f'{where} ORDER BY created_at DESC, id DESC LIMIT :limit OFFSET :offset',
+                                      dict(params, limit=per_page, offset=(page - 1) * per_page)).fetchall()
+        finally:
+            connection.close()
+
+        items = [{'date': row['created_at'], 'level': row['level'], 'event_type': row['event_type'],
+                  'username': row['username'], 'path': row['path'], 'message': row['message']} for row in rows]
+
+        return AuditLogPage(items, page, per_page, total)
+
+
+
+class AuditLogHandler(logging.Handler):
+    """
+    Logging handler that turns log records into structured audit log entries and hands them to the AuditLog writer.
+
+    The event type and the username are taken from the record's extra fields, e.g.
+    logger.warning("...", extra={'event_type': 'login_failed', 'username': username}). Without them the event type is
+    'general' and the username is the logged-in user of the current request, if any. The request path is recorded
+    whenever the record is logged inside a request.
+    """
+
+    def __init__(self, store, level=logging.NOTSET):
+        super().__init__(level)
+        self.store = store
+
+    def emit(self, record):
+        try:
+            username = getattr(record, 'username', None)
+            path = None
+            if has_request_context():
+                path = request.path
+                if username is None and current_user and current_user.is_authenticated:
+                    username = current_user.username
+
+            created_at = (datetime.fromtimestamp(record.created).strftime('%Y-%m-%d %H:%M:%S')
+                          + ',%03d' % record.msecs)
+
+            self.store.enqueue({'created_at': created_at,
+                                'level': record.levelname,
+                                'event_type': getattr(record, 'event_type', 'general'),
+                                'username': username,
+                                'path': path,
+                                'message': record.getMessage()})
+        except Exception:
+            self.handleError(record)
+
+
+audit_log = AuditLog()
@@ -0,0 +1,135 @@
+import hashlib
+import io
+import threading
+import time
+from collections import OrderedDict
+
+
+def fingerprint(rows):
+    """
+    Computes a stable fingerprint of the aggregate rows a chart is drawn from.
+
+    The rows are normalised to plain tuples (SQLAlchemy Row objects, lists and tuples are all accepted) and hashed,
+    so two calls with the same data always produce the same fingerprint, regardless of the row type returned by
+    the query.
+
+    Parameters:
+    - rows (iterable): The aggregate rows, e.g. [('admin', 2), ('client', 14)].
+
+    Returns:
+    - str: A hex digest identifying the data set.
+    """
+    normalised = [tuple(row) for row in rows]
+    return hashlib.sha1(repr(normalised).encode('utf-8')).hexdigest()
+
+
+def load_pyplot():
+    """
+    Imports matplotlib's pyplot on first use, with the headless 'Agg' backend selected explicitly.
+
+    Matplotlib is only needed to render chart images, so it is not imported when the application starts: workers
+    that never render a chart do not pay its import time or memory. Selecting the backend explicitly keeps
+    matplotlib from probing for a GUI toolkit in a server process.
+
+    Returns:
+    - module: The matplotlib.pyplot module.
+    """
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    return plt
+
+
+def figure_to_png(fig):
+    """
+    Renders a matplotlib figure to PNG bytes and closes the figure.
+
+    Closing the figure is important here: pyplot keeps every open figure alive, so charts rendered on each request
+    would otherwise accumulate in the worker's memory.
+
+    Parameters:
+    - fig (matplotlib.figure.Figure): The figure to render.
+
+    Returns:
+    - bytes: The PNG image.
+    """
+    plt = load_pyplot()
+
+    buf = io.BytesIO()
+    fig.savefig(buf, format='png')
+    plt.close(fig)
+    png = buf.getvalue()
+    buf.close()
+
+    return png
+
+
+class ChartCache:
+    """
+    In-process cache of rendered chart images, keyed by chart name and validated by a fingerprint of the data.
+
+    Each chart name holds a single entry: the fingerprint of the rows it was drawn from, the PNG bytes and the time
+    it was rendered. A lookup with the same rows (same fingerprint) within the TTL is served straight from memory
+    without touching matplotlib; different rows, or an expired entry, trigger a re-render that replaces the entry.
+    The number of entries is bounded and the least recently used chart is evicted first.
+
+    Configuration (read in init_app):
+    - CHART_CACHE_TTL (int): Lifetime of an entry in seconds. Defaults to 300.
+    - CHART_CACHE_MAX_ENTRIES (int): Maximum number of cached charts. Defaults to 64.
+    """
+
+    def __init__(self, ttl=300, max_entries=64):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.ttl = app.config.setdefault('CHART_CACHE_TTL', self.ttl)
+        self.max_entries = app.config.setdefault('CHART_CACHE_MAX_ENTRIES', self.max_entries)
+        app.extensions['chart_cache'] = self
+
+    def get_or_render(self, name, rows, render):
+        """
+        Returns the PNG for the chart `name`, rendering it only if the cached image is missing, stale or was drawn
+        from different data.
+
+        Parameters:
+        - name (str): Unique name of the chart, e.g. 'user_roles'.
+        - rows (list): The aggregate rows the chart is drawn from; used to compute the fingerprint.
+        - render (callable): Called as render(rows) on a cache miss; must return PNG bytes.
+
+        Returns:
+        - bytes: The PNG image of the chart.
+        """
+        key = fingerprint(rows)
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry and entry[0] == key and now - entry[2] < self.ttl:
+                self._entries.move_to_end(name)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        # Rendering happens outside the lock so a slow chart does not block lookups of the others
+        png = render(rows)
+
+        with self._lock:
+            self._entries[name] = (key, png, now)
+            self._entries.move_to_end(name)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+        return png
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+chart_cache = ChartCache()
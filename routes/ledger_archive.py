@@ -0,0 +1,342 @@
+import glob
+import json
+import os
+import re
+import sqlite3
+import threading
+from datetime import date, timedelta
+from sqlalchemy import func, text
+from models.models import db, Transaction
+from models.money import Money
+
+
+BROUGHT_FORWARD = 'BF'
+BROUGHT_FORWARD_DESCRIPTION = 'Balance brought forward'
+
+ARCHIVE_FILE = re.compile(r'^transactions_(\d{4})\.db$')
+
+COLUMNS = ('id', 'user_id', 'transaction_date', 'transaction_type', 'sort_code', 'account_number',
+           'transaction_description', 'debit_amount', 'credit_amount', 'balance')
+
+ARCHIVE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS transactions (
+    id INTEGER PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    transaction_date DATE NOT NULL,
+    transaction_type VARCHAR(20) NOT NULL,
+    sort_code VARCHAR(10) NOT NULL,
+    account_number VARCHAR(20) NOT NULL,
+    transaction_description VARCHAR(255) NOT NULL,
+    debit_amount INTEGER,
+    credit_amount INTEGER,
+    balance INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_transactions_user_date ON transactions (user_id, transaction_date);
+"""
+
+# SQLite attaches at most 10 databases to a connection by default
+MAX_ATTACHED = 8
+
+
+
+class LedgerArchive:
+    """
+    Hot/cold partitioning of the transaction ledger.
+
+    Transactions dated before the archive horizon (LEDGER_HOT_DAYS days ago) are moved by a scheduled job out of the
+    'transaction' table into yearly archive databases, 'transactions_<year>.db' in LEDGER_ARCHIVE_DIR, with the same
+    columns and the same ids. The hot table, which every transfer, dashboard and payment job reads, so stays bounded
+    by the horizon instead of growing forever.
+
+    The balance of an account is the balance of its latest transaction, and the transfer code also finds accounts by
+    the sort code and account number of their transactions, so each account keeps one row of its archived history in
+    the hot table: its latest archived transaction becomes a 'BF' (balance brought forward) row, with the same id,
+    date and balance and no amounts. The original transaction is in the archive.
+
+    transactions() reads a user's ledger for a date range: from the hot table alone when the range starts at or after
+    the archive horizon, and otherwise also from the archive files of the years in the range, attached read-only to a
+    single connection and read with one UNION ALL query, in which case the brought-forward rows are replaced by the
+    archived transactions they stand for.
+
+    Configuration (read in init_app):
+    - LEDGER_HOT_DAYS (int): Transactions older than this many days are archived. Defaults to 730.
+    - LEDGER_ARCHIVE_DIR (str): Directory of the yearly archive databases. Defaults to 'ledger_archive' in the
+      instance folder.
+    - LEDGER_ARCHIVE_HOUR (int): Hour of the day of the archiving job. Defaults to 3.
+    """
+
+    def __init__(self, hot_days=730, directory='ledger_archive'):
+        self.hot_days = hot_days
+        self.directory = directory
+        # Every transaction dated before this day is in the archive; None while nothing has been archived
+        self.archived_before = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.hot_days = app.config.setdefault('LEDGER_HOT_DAYS', self.hot_days)
+        self.directory = app.config.setdefault('LEDGER_ARCHIVE_DIR', os.path.join(app.instance_path, 'ledger_archive'))
+        app.config.setdefault('LEDGER_ARCHIVE_HOUR', 3)
+        app.extensions['ledger_archive'] = self
+
+        self.archived_before = self._load_state()
+
+    def _state_file(self):
+        return os.path.join(self.directory, 'archive.json')
+
+    def _load_state(self):
+        try:
+            with open(self._state_file(), 'r', encoding='utf-8') as file:
+                return date.fromisoformat(json.load(file)['archived_before'])
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _save_state(self):
+        temp_file = self._state_file() + '.tmp'
+        with open(temp_file, 'w', encoding='utf-8') as file:
+            json.dump({'archived_before': self.archived_before.isoformat()}, file)
+        os.replace(temp_file, self._state_file())
+
+    def archive_file(self, year):
+        return os.path.join(self.directory, f'transactions_{year}.db')
+
+    def archive_years(self):
+        """
+        Returns the years that have an archive database, in ascending order.
+        """
+        years = []
+        for path in glob.glob(os.path.join(self.directory, 'transactions_*.db')):
+            match = ARCHIVE_FILE.match(os.path.basename(path))
+            if match:
+                years.append(int(match.group(1)))
+        return sorted(years)
+
+    def archive(self, today=None):
+        """
+        Moves the transactions dated before the archive horizon into the yearly archive databases. Run daily by the
+        scheduler, in an application context.
+
+        The rows of each year are first copied into that year's archive (attached to a connection of the application
+        database) and the copy is checked; only then, in one transaction of the application database, does the
+        latest archived transaction of each account become its brought-forward row and the other copied rows get
+        deleted. The copy is idempotent, so an interrupted run is completed by the next one.
+
+        Parameters:
+        - today (date, optional): The day the horizon is counted back from. Defaults to today.
+
+        Returns:
+        - int: The number of transactions moved out of the hot table.
+        """
+        with self._lock:
+            cutoff = (today or date.today()) - timedelta(days=self.hot_days)
+            os.makedirs(self.directory, exist_ok=True)
+            table = db.engine.dialect.identifier_preparer.format_table(Transaction.__table__)
+            columns = ', '.join(COLUMNS)
+            archived = f"transaction_date < :cutoff AND transaction_type != '{BROUGHT_FORWARD}'"
+
+            with db.engine.connect() as connection:
+                years = [int(year) for year in connection.exec_driver_sql(
+                    f"SELECT DISTINCT strftime('%Y', transaction_date) FROM {table} "
+                    f"WHERE transaction_date < ? AND transaction_type != ?",
+                    (cutoff.isoformat(), BROUGHT_FORWARD)).scalars()]
+                connection.rollback()
+
+                for year in years:
+                    path = self.archive_file(year)
+                    archive_connection = sqlite3.connect(path)
+                    try:
+                        archive_connection.executescript(ARCHIVE_SCHEMA)
+                    finally:
+                        archive_connection.close()
+
+                    params = {'cutoff': min(cutoff, date(year + 1, 1, 1)).isoformat(),
+                              'start': date(year, 1, 1).isoformat()}
+                    in_year = f'{archived} AND transaction_date >= :start'
+                    # ATTACH and DETACH cannot run inside a transaction
+                    connection.exec_driver_sql('ATTACH DATABASE ? AS archive', (path,))
+                    connection.commit()
+                    try:
+                        with connection.begin():
+                            connection.execute(text(f'INSERT OR IGNORE INTO archive.transactions ({columns}) '
+                                                    f'SELECT {columns} FROM main.{table} WHERE {in_year}'), params)
+                            missing = connection.execute(text(
+                                f'SELECT COUNT(*) FROM main.{table} WHERE {in_year} '
+                                f'AND id NOT IN (SELECT id FROM archive.transactions)'), params).scalar()
+                            if missing:
+                                raise RuntimeError(f'{missing} transactions of {year} were not copied to {path}.')
+                    finally:
+                        connection.exec_driver_sql('DETACH DATABASE archive')
+                        connection.commit()
+
+                params = {'cutoff': cutoff.isoformat()}
+                with connection.begin():
+                    accounts = f'SELECT user_id FROM {table} WHERE {archived}'
+                    # The previous brought-forward rows of the accounts getting a newer one
+                    connection.execute(text(f"DELETE FROM {table} WHERE transaction_type = '{BROUGHT_FORWARD}' "
+                                            f"AND user_id IN ({accounts})"), params)
+                    connection.execute(text(
+                        f"UPDATE {table} SET transaction_type = '{BROUGHT_FORWARD}', "
+                        f"transaction_description = '{BROUGHT_FORWARD_DESCRIPTION}', debit_amount = 0, "
+                        f"credit_amount = 0 WHERE id IN (SELECT MAX(id) FROM {table} WHERE {archived} "
+                        f"GROUP BY user_id)"), params)
+                    moved = connection.execute(text(f'DELETE FROM {table} WHERE {archived}'), params).rowcount
+
+            if self.archived_before is None or cutoff > self.archived_before:
+                self.archived_before = cutoff
+                self._save_state()
+            return moved
+
+    def needs_archive(self, date_from):
+        """
+        Returns True if a range starting on `date_from` (None for the whole history) reaches into the archive.
+        """
+        return self.archived_before is not None and (date_from is None or date_from < self.archived_before)
+
+    def transactions(self, user_id=None, date_from=None, date_until=None, transaction_type=None):
+        """
+        Returns the transactions of the ledger matching the filters, from the hot table and, if the range needs it,
+        from the archive, ordered by id (the order they were made in).
+
+        Parameters:
+        - user_id (int, optional): Only this user's transactions.
+        - date_from (date | str, optional): Only transactions on or after this day.
+        - date_until (date | str, optional): Only transactions on or before this day.
+        - transaction_type (str, optional): Only transactions of this type.
+
+        Returns:
+        - list: Transaction objects; the archived ones are not attached to the database session.
+        """
+        date_from = _as_date(date_from)
+        date_until = _as_date(date_until)
+
+        query = Transaction.query
+        if user_id:
+            query = query.filter(Transaction.user_id == user_id)
+        if date_from:
+            query = query.filter(Transaction.transaction_date >= date_from)
+        if date_until:
+            query = query.filter(Transaction.transaction_date <= date_until)
+        if transaction_type:
+            query = query.filter(Transaction.transaction_type == transaction_type)
+
+        if not self.needs_archive(date_from):
+            return query.order_by(Transaction.id).all()
+
+        # The archive holds the transactions the brought-forward rows stand for
+        hot = query.filter(Transaction.transaction_type != BROUGHT_FORWARD).all()
+        cold = self.archived_transactions(user_id, date_from, date_until, transaction_type)
+        return sorted(cold + hot, key=lambda transaction: transaction.id)
+
+    def archived_transactions(self, user_id=None, date_from=None, date_until=None, transaction_type=None):
+        """
+        Reads the archived transactions matching the filters from the archive databases of the years in the range.
+
+        Returns:
+        - list: Transaction objects, not attached to the database session.
+        """
+        rows = self._read_archive(f'SELECT {", ".join(COLUMNS)} FROM {{table}}',
+                                  user_id, date_from, date_until, transaction_type)
+        return [_transaction(row) for row in rows]
+
+    def totals_by_type(self, user_id):
+        """
+        Returns the total amount (debit plus credit) of a user's transactions per transaction type, over the hot table
+        and the archive, without the brought-forward rows.
+
+        Returns:
+        - list: (transaction type, Money) tuples, ordered by transaction type.
+        """
+        totals = {}
+        hot = (db.session.query(Transaction.transaction_type,
+                                func.sum(Transaction.debit_amount + Transaction.credit_amount))
+               .filter(Transaction.user_id == user_id, Transaction.transaction_type != BROUGHT_FORWARD)
+               .group_by(Transaction.transaction_type)
+               .all())
+        for transaction_type, total in hot:
+            totals[transaction_type] = total or Money(0)
+
+        if self.needs_archive(None):
+            rows = self._read_archive('SELECT transaction_type, SUM(COALESCE(debit_amount, 0) + COALESCE(credit_amount, 0)) '
+                                      'FROM {table} GROUP BY transaction_type', user_id)
+            for transaction_type, total in rows:
+                totals[transaction_type] = totals.get(transaction_type, Money(0)) + _money(total or 0)
+
+        return sorted(totals.items())
+
+    def archived_type_totals(self, max_amount=None):
+        """
+        Returns the number and total amount (debit plus credit) of the archived transactions of each type, for the
+        reports over the whole ledger.
+
+        Parameters:
+        - max_amount (Money, optional): Only count the transactions whose amount is at most this.
+
+        Returns:
+        - dict: transaction type -> (count, Money total); empty if nothing has been archived.
+        """
+        if not self.needs_archive(None):
+            return {}
+        amount = 'COALESCE(debit_amount, 0) + COALESCE(credit_amount, 0)'
+        # The bound is an integer number of minor units, so it is safe to inline
+        where = f' WHERE {amount} <= {int(Money.of(max_amount).minor_units)}' if max_amount is not None else ''
+        totals = {}
+        for transaction_type, count, total in self._read_archive(
+                f'SELECT transaction_type, COUNT(*), SUM({amount}) FROM {{table}}{where} GROUP BY transaction_type'):
+            previous_count, previous_total = totals.get(transaction_type, (0, Money(0)))
+            totals[transaction_type] = (previous_count + count, previous_total + _money(total or 0))
+        return totals
+
+    def _read_archive(self, select, user_id=None, date_from=None, date_until=None, transaction_type=None):
+        """
+        Runs `select` on the filtered rows of the archive databases of the years in the range, which are attached
+        read-only to one connection and read with a single UNION ALL query (the '{table}' of `select`) per group of
+        attached files.
+        """
+        years = [year for year in self.archive_years()
+                 if (date_from is None or year >= date_from.year) and (date_until is None or year <= date_until.year)]
+
+        conditions, params = [], []
+        for condition, value in (('user_id = ?', user_id), ('transaction_date >= ?', date_from),
+                                 ('transaction_date <= ?', date_until), ('transaction_type = ?', transaction_type)):
+            if value:
+                conditions.append(condition)
+                params.append(value.isoformat() if isinstance(value, date) else value)
+        where = f' WHERE {" AND ".join(conditions)}' if conditions else ''
+
+        rows = []
+        connection = sqlite3.connect('file::memory:', uri=True)
+        try:
+            for start in range(0, len(years), MAX_ATTACHED):
+                group = years[start:start + MAX_ATTACHED]
+                for year in group:
+                    connection.execute(f'ATTACH DATABASE ? AS archive_{year}', (f'file:{self.archive_file(year)}?mode=ro',))
+                try:
+                    union = ' UNION ALL '.join(f'SELECT * FROM archive_{year}.transactions{where}' for year in group)
+                    query = select.format(table=f'({union})')
+                    rows.extend(connection.execute(query, params * len(group)).fetchall())
+                finally:
+                    for year in group:
+                        connection.execute(f'DETACH DATABASE archive_{year}')
+        finally:
+            connection.close()
+        return rows
+
+
+def _as_date(value):
+    if not value or isinstance(value, date):
+        return value or None
+    return date.fromisoformat(value)
+
+
+def _money(value):
+    return None if value is None else Money(int(value))
+
+
+def _transaction(row):
+    values = dict(zip(COLUMNS, row))
+    values['transaction_date'] = date.fromisoformat(values['transaction_date'])
+    for column in ('debit_amount', 'credit_amount', 'balance'):
+        values[column] = _money(values[column])
+    return Transaction(**values)
+
+
+ledger_archive = LedgerArchive()
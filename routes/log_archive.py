@@ -0,0 +1,305 @@
+import json
+import mmap
+import os
+import queue
+import re
+import shutil
+import struct
+import threading
+import time
+import zlib
+from datetime import timedelta
+from routes.audit_log import AuditLogPage
+from routes.log_stats import LOG_RECORD, LEVELS
+
+
+# Archive layout: compressed blocks, then the JSON block index, then the footer (index offset, index length, magic)
+FOOTER = struct.Struct('<QQ4s')
+MAGIC = b'LGZ1'
+
+# Uncompressed size of the records stored in one block
+BLOCK_SIZE = 64 * 1024
+
+# Usernames are quoted in the application's log messages, e.g. "User 'Paul' logged in to the system."
+QUOTED_NAME = re.compile(r"'([^'\s]+)'")
+
+
+
+def split_records(lines):
+    """
+    Groups the lines of a log file into records.
+
+    A record starts with a timestamped line ('%(asctime)s - %(levelname)s - %(message)s'); the lines that follow it
+    without a timestamp (tracebacks, output of other loggers) belong to it. Lines before the first record are skipped.
+
+    Parameters:
+    - lines (iterable): Lines of the log file, without the trailing newlines.
+
+    Returns:
+    - generator: Tuples (timestamp, level, message) - 'YYYY-MM-DD HH:MM:SS,mmm', the level name and the message,
+      including its continuation lines.
+    """
+    record = None
+    for line in lines:
+        match = LOG_RECORD.match(line)
+        if match and match.group(1):
+            if record:
+                yield record[0], record[1], '\n'.join(record[2])
+            record = (line[:23], match.group(2), [line[match.end():]])
+        elif record:
+            record[2].append(line)
+    if record:
+        yield record[0], record[1], '\n'.join(record[2])
+
+
+def level_bit(level):
+    return 1 << LEVELS.index(level) if level in LEVELS else 0
+
+
+
+class LogArchive:
+    """
+    Compressed, block-indexed archives of the rotated application log files, and a search over them.
+
+    When the log writer rotates 'app.log', the rotated file is handed to a background archiver thread, so the log
+    writer thread goes straight back to writing: archive_rotated_file() only hard-links the rotated file into the
+    'pending' subdirectory of the archive directory (or copies it, where hard links are not available) and queues it.
+    The archiver converts the pending file into an archive and removes it. The rotated file itself stays where the log
+    writer put it, so the writer keeps its LOG_BACKUP_COUNT backups. Pending files left by a process that stopped
+    before archiving them are archived when the next process starts.
+
+    An archive consists of zlib-compressed blocks of about BLOCK_SIZE bytes of records each, followed by
+    a small index with one entry per block: its offset and length in the file, the time range of its records, a
+    bitmap of the levels it contains and the usernames mentioned in it.
+
+    search() memory-maps the archives, reads only their indexes, and decompresses only the blocks whose index can
+    match the level, user and time filters, so searching months of history touches a fraction of the data.
+
+    Configuration (read in init_app):
+    - LOG_ARCHIVE_DIR (str): Directory of the archives. Defaults to 'log_archives' in the instance folder.
+    """
+
+    def __init__(self, directory='log_archives'):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._archiver = None
+
+    def init_app(self, app):
+        self.directory = app.config.setdefault('LOG_ARCHIVE_DIR', os.path.join(app.instance_path, 'log_archives'))
+        app.extensions['log_archive'] = self
+
+        pending_directory = self.pending_directory()
+        if os.path.isdir(pending_directory):
+            for name in sorted(os.listdir(pending_directory)):
+                self._queue.put(os.path.join(pending_directory, name))
+        self.start()
+
+    def pending_directory(self):
+        return os.path.join(self.directory, 'pending')
+
+    def start(self):
+        """
+        Starts the background archiver thread (once).
+        """
+        with self._lock:
+            if self._archiver is None or not self._archiver.is_alive():
+                self._archiver = threading.Thread(target=self._archive_loop, name='log-archiver', daemon=True)
+                self._archiver.start()
+
+    def _archive_loop(self):
+        while True:
+            pending_file = self._queue.get()
+            try:
+                self.archive_file(pending_file)
+                os.remove(pending_file)
+            except Exception as e:
+                print('An error occurred. The rotated log file could not be archived:', e)
+            finally:
+                self._queue.task_done()
+
+    def wait(self):
+        """
+        Blocks until every queued rotated file has been archived.
+        """
+        self._queue.join()
+
+    def archive_file(self, file_path):
+        """
+        Writes the records of a log file into a new archive.
+
+        Parameters:
+        - file_path (str): The log file to archive.
+
+        Returns:
+        - str: The path of the archive, or None if the file contained no records.
+        """
+        blocks = []
+        index = []
+
+        def close_block(records):
+            data = '\n'.join(f'{timestamp} - {level} - {message}' for timestamp, level, message in records)
+            users = set()
+            levels = 0
+            for _, level, message in records:
+                users.update(QUOTED_NAME.findall(message))
+                levels |= level_bit(level)
+            blocks.append(zlib.compress(data.encode('utf-8'), 6))
+            index.append({'first': records[0][0], 'last': records[-1][0], 'levels': levels,
+                          'users': sorted(users), 'count': len(records)})
+
+        with open(file_path, 'r', encoding='utf-8', errors='replace') as file:
+            records = []
+            size = 0
+            for record in split_records(line.rstrip('\n') for line in file):
+                records.append(record)
+                size += len(record[2]) + 30
+                if size >= BLOCK_SIZE:
+                    close_block(records)
+                    records = []
+                    size = 0
+            if records:
+                close_block(records)
+
+        if not index:
+            return None
+
+        os.makedirs(self.directory, exist_ok=True)
+        # Named after the time range, e.g. 'app-20240125175858-20240131093012.lgz', so the archives sort chronologically
+        name = '-'.join(re.sub(r'[^0-9]', '', timestamp[:19]) for timestamp in (index[0]['first'], index[-1]['last']))
+        with self._lock:
+            archive_path = os.path.join(self.directory, f'app-{name}.lgz')
+            suffix = 1
+            while os.path.exists(archive_path):
+                archive_path = os.path.join(self.directory, f'app-{name}-{suffix}.lgz')
+                suffix += 1
+
+            temp_path = archive_path + '.tmp'
+            with open(temp_path, 'wb') as archive:
+                offset = 0
+                for block, entry in zip(blocks, index):
+                    archive.write(block)
+                    entry['offset'] = offset
+                    entry['length'] = len(block)
+                    offset += len(block)
+                index_data = json.dumps(index).encode('utf-8')
+                archive.write(index_data)
+                archive.write(FOOTER.pack(offset, len(index_data), MAGIC))
+            os.replace(temp_path, archive_path)
+
+        return archive_path
+
+    def archive_rotated_file(self, rotated_file):
+        """
+        Queues a log file that has just been rotated for archiving. Used as the log writer's on_rotate callback.
+
+        Runs on the log writer thread, so it only links the file into the pending directory (a copy is made where hard
+        links are not supported) and leaves compressing it to the archiver thread. The rotated file is not removed.
+
+        Parameters:
+        - rotated_file (str): The new path of the rotated log file, e.g. 'app.log.1'.
+        """
+        if os.path.getsize(rotated_file) == 0:
+            return
+        pending_directory = self.pending_directory()
+        os.makedirs(pending_directory, exist_ok=True)
+        # Named after the rotation time, so leftover pending files are archived in the order they were rotated
+        pending_file = os.path.join(pending_directory, f'{time.time_ns()}-{os.path.basename(rotated_file)}')
+        try:
+            os.link(rotated_file, pending_file)
+        except OSError:
+            shutil.copyfile(rotated_file, pending_file)
+        self._queue.put(pending_file)
+        self.start()
+
+    def archives(self):
+        """
+        Returns the paths of all archives, newest first.
+        """
+        try:
+            names = [name for name in os.listdir(self.directory) if name.endswith('.lgz')]
+        except FileNotFoundError:
+            return []
+        return [os.path.join(self.directory, name) for name in sorted(names, reverse=True)]
+
+    @staticmethod
+    def _read_index(archive):
+        if len(archive) < FOOTER.size:
+            return []
+        index_offset, index_length, magic = FOOTER.unpack(archive[-FOOTER.size:])
+        if magic != MAGIC:
+            return []
+        return json.loads(archive[index_offset:index_offset + index_length])
+
+    def search(self, level=None, username=None, date_from=None, date_to=None, text=None, page=1, per_page=50):
+        """
+        Returns one page of archived log records matching the given filters, newest first.
+
+        Blocks are skipped without being decompressed when their time range lies outside the date range, when their
+        level bitmap lacks the requested level, or when the requested username is not mentioned in them. The
+        remaining blocks are decompressed and their records filtered exactly.
+
+        Since only as many blocks are decompressed as the requested page needs, the total number of matches is not
+        known: the page reports whether a next page exists instead.
+
+        Parameters:
+        - level (str, optional): Log level, e.g. 'ERROR'.
+        - username (str, optional): Username mentioned in the message.
+        - date_from (date, optional): First day to include.
+        - date_to (date, optional): Last day to include.
+        - text (str, optional): Text the record must contain (case-insensitive).
+        - page (int): Page number, starting at 1.
+        - per_page (int): Number of records per page.
+
+        Returns:
+        - AuditLogPage: The records as dictionaries with the keys 'date', 'level', 'event_type', 'username', 'path'
+          and 'message', and the pagination attributes (total is None).
+        """
+        page = max(1, page)
+        level = level.upper() if level else None
+        wanted_bit = level_bit(level) if level else 0
+        start = date_from.strftime('%Y-%m-%d') if date_from else None
+        # Timestamps are 'YYYY-MM-DD HH:MM:SS,mmm' text, so the range ends before the following day
+        end = (date_to + timedelta(days=1)).strftime('%Y-%m-%d') if date_to else None
+        text = text.lower() if text else None
+
+        skip = (page - 1) * per_page
+        matches = []
+
+        for path in self.archives():
+            with open(path, 'rb') as file:
+                if os.fstat(file.fileno()).st_size == 0:
+                    continue
+                with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as archive:
+                    for entry in reversed(self._read_index(archive)):
+                        if start and entry['last'] < start or end and entry['first'] >= end:
+                            continue
+                        if wanted_bit and not entry['levels'] & wanted_bit:
+                            continue
+                        if username and username not in entry['users']:
+                            continue
+
+                        block = zlib.decompress(archive[entry['offset']:entry['offset'] + entry['length']])
+                        records = list(split_records(block.decode('utf-8').split('\n')))
+                        for timestamp, record_level, message in reversed(records):
+                            if level and record_level != level:
+                                continue
+                            if start and timestamp < start or end and timestamp >= end:
+                                continue
+                            if username and username not in QUOTED_NAME.findall(message):
+                                continue
+                            if text and text not in message.lower():
+                                continue
+
+                            if skip:
+                                skip -= 1
+                                continue
+                            matches.append({'date': timestamp, 'level': record_level, 'event_type': 'archived',
+                                            'username': username, 'path': None, 'message': message})
+                            if len(matches) > per_page:
+                                return AuditLogPage(matches[:per_page], page, per_page, None, has_next=True)
+
+        return AuditLogPage(matches, page, per_page, None, has_next=False)
+
+
+log_archive = LogArchive()
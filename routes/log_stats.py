@@ -0,0 +1,238 @@
+import json
+import os
+import re
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows - the state file is then only guarded within one process
+    fcntl = None
+
+
+# A record written by the application logger: "2024-01-25 17:58:58,184 - INFO - message",
+# or by the logging module's default format: "INFO:werkzeug:message"
+LOG_RECORD = re.compile(r'^(?:(\d{4}-\d{2}-\d{2}) \d{2}:\d{2}:\d{2},\d{3} - ([A-Z]+) - |([A-Z]+):[^:\s]*:)')
+
+LEVELS = ('DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL')
+
+# Size of the chunks in which newly appended data is read
+READ_CHUNK = 1024 * 1024
+
+
+def parse_level(line):
+    """
+    Extracts the day and the level of a log record from a single line of the log file.
+
+    Only the level field of the record is looked at, so a message that merely contains a level name (e.g.
+    "User 'ERROR' logged in") is classified by its real level.
+
+    Parameters:
+    - line (str): One line of the log file, without the trailing newline.
+
+    Returns:
+    - tuple: (day, level) - the 'YYYY-MM-DD' day of the record (None if the line carries no timestamp) and the level
+      name, or (None, None) if the line is not the start of a log record (e.g. a traceback line).
+    """
+    match = LOG_RECORD.match(line)
+    if not match:
+        return None, None
+
+    level = match.group(2) or match.group(3)
+    if level not in LEVELS:
+        return None, None
+
+    return match.group(1), level
+
+
+
+class LogStats:
+    """
+    Incrementally maintained per-level and per-day counters of the records in the application log file.
+
+    Instead of re-reading the whole log on every report, the component remembers the byte offset up to which the
+    file has been counted, together with its inode, and on each update() parses only the lines appended since then.
+    Only complete lines are consumed: a record that is still being written is left for the next update. The offset
+    and the counters are persisted in a small JSON state file, so they survive restarts of the application.
+
+    Rotation is detected by a change of the inode or by the file becoming shorter than the stored offset. The
+    unread tail of the rotated file ('<log>.1') is counted first, if it is still there, and counting then restarts
+    at the beginning of the new file.
+
+    Configuration (read in init_app):
+    - LOG_STATS_FILE (str): The log file to count. Defaults to 'app.log'.
+    - LOG_STATS_STATE_FILE (str): Where the offset and counters are stored. Defaults to 'log_stats.json' in the
+      application's instance folder.
+    """
+
+    def __init__(self, log_file='app.log', state_file='log_stats.json'):
+        self.log_file = log_file
+        self.state_file = state_file
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.log_file = app.config.setdefault('LOG_STATS_FILE', self.log_file)
+        self.state_file = app.config.setdefault('LOG_STATS_STATE_FILE',
+                                                os.path.join(app.instance_path, 'log_stats.json'))
+        app.extensions['log_stats'] = self
+
+    @staticmethod
+    def _empty_state():
+        return {'inode': None, 'offset': 0, 'levels': {level: 0 for level in LEVELS}, 'days': {}}
+
+    def _load_state(self):
+        try:
+            with open(self.state_file, 'r', encoding='utf-8') as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return self._empty_state()
+
+    def _save_state(self, state):
+        # Written to a temporary file and renamed, so a crash never leaves a half-written state behind
+        directory = os.path.dirname(os.path.abspath(self.state_file))
+        os.makedirs(directory, exist_ok=True)
+        temp_file = self.state_file + '.tmp'
+        with open(temp_file, 'w', encoding='utf-8') as file:
+            json.dump(state, file)
+        os.replace(temp_file, self.state_file)
+
+    @staticmethod
+    def _count_from(path, offset, state):
+        """
+        Counts the complete lines of `path` from the byte `offset` into `state` and returns the new offset.
+        """
+        with open(path, 'rb') as file:
+            file.seek(offset)
+            pending = b''
+            while True:
+                chunk = file.read(READ_CHUNK)
+                if not chunk:
+                    break
+                data = pending + chunk
+                end = data.rfind(b'\n') + 1
+                pending = data[end:]
+
+                for raw_line in data[:end].splitlines():
+                    day, level = parse_level(raw_line.decode('utf-8', errors='replace'))
+                    if level is None:
+                        continue
+                    state['levels'][level] = state['levels'].get(level, 0) + 1
+                    if day:
+                        day_counts = state['days'].setdefault(day, {})
+                        day_counts[level] = day_counts.get(level, 0) + 1
+
+                offset += end
+
+        return offset
+
+    def _update(self, state):
+        try:
+            stat = os.stat(self.log_file)
+        except FileNotFoundError:
+            return state
+
+        if state['inode'] is not None and (stat.st_ino != state['inode'] or stat.st_size < state['offset']):
+            # The log was rotated: finish the old file if it was renamed to '<log>.1', then start from the beginning
+            rotated_file = self.log_file + '.1'
+            try:
+                if os.stat(rotated_file).st_ino == state['inode']:
+                    self._count_from(rotated_file, state['offset'], state)
+            except FileNotFoundError:
+                pass
+            state['offset'] = 0
+
+        state['inode'] = stat.st_ino
+        if stat.st_size > state['offset']:
+            state['offset'] = self._count_from(self.log_file, state['offset'], state)
+
+        return state
+
+    def update(self):
+        """
+        Counts the records appended to the log file since the last update and persists the new state.
+
+        The cost is proportional to the amount of newly written log data, not to the size of the file. Concurrent
+        updates from several threads, or several worker processes where file locking is available, are serialised.
+
+        Returns:
+        - dict: The persisted state: 'inode', 'offset', 'levels' (total count per level) and 'days' (count per level
+          for every 'YYYY-MM-DD' day).
+        """
+        with self._locked():
+            state = self._update(self._load_state())
+            self._save_state(state)
+
+        return state
+
+    def catch_up(self, rotated_file):
+        """
+        Counts the unread tail of a log file that has just been rotated, before it is archived or removed.
+
+        Called by the log writer right after it renamed the log file. Counting then restarts at the beginning of the
+        new log file on the next update.
+
+        Parameters:
+        - rotated_file (str): The new path of the rotated log file, e.g. 'app.log.1'.
+        """
+        with self._locked():
+            state = self._load_state()
+            try:
+                # Continue from the stored offset if that file is the one being counted, otherwise it was never read
+                offset = state['offset'] if state['inode'] in (None, os.stat(rotated_file).st_ino) else 0
+                self._count_from(rotated_file, offset, state)
+            except FileNotFoundError:
+                pass
+            state['inode'] = None
+            state['offset'] = 0
+            self._save_state(state)
+
+    @contextmanager
+    def _locked(self):
+        # Serialises updates between threads, and between worker processes where file locking is available
+        with self._lock:
+            lock_file = None
+            if fcntl is not None:
+                os.makedirs(os.path.dirname(os.path.abspath(self.state_file)), exist_ok=True)
+                lock_file = open(self.state_file + '.lock', 'w')
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if lock_file is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+                    lock_file.close()
+
+    def level_counts(self):
+        """
+        Returns the number of INFO, ERROR, WARNING and CRITICAL records in the log, counting any new lines first.
+
+        Returns:
+        - dict: e.g. {"INFO": 2, "ERROR": 1, "WARNING": 1, "CRITICAL": 0}
+        """
+        levels = self.update()['levels']
+        return {level: levels.get(level, 0) for level in ("INFO", "ERROR", "WARNING", "CRITICAL")}
+
+    def daily_counts(self, days=None):
+        """
+        Returns the per-day level counters, counting any new lines first.
+
+        Parameters:
+        - days (int, optional): Only return the most recent `days` days.
+
+        Returns:
+        - dict: {'YYYY-MM-DD': {level: count}} ordered by day.
+        """
+        counts = sorted(self.update()['days'].items())
+        if days is not None:
+            counts = counts[-days:]
+        return dict(counts)
+
+    def reset(self):
+        """
+        Forgets the stored offset and counters, so the next update counts the log file from the beginning.
+        """
+        with self._locked():
+            self._save_state(self._empty_state())
+
+
+log_stats = LogStats()
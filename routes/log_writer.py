@@ -0,0 +1,201 @@
+import atexit
+import os
+import queue
+import threading
+from datetime import date
+from logging.handlers import QueueHandler
+
+
+# Marks the end of the queue when the writer is stopped
+_STOP = object()
+
+
+
+class DroppingQueueHandler(QueueHandler):
+    """
+    Queue handler that never blocks the logging thread.
+
+    If the queue is full (the disk cannot keep up), the record is dropped and counted instead of making the request
+    wait for the writer.
+    """
+
+    def __init__(self, writer):
+        super().__init__(writer.queue)
+        self.writer = writer
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+            self.writer.count('enqueued')
+        except queue.Full:
+            self.writer.count('dropped')
+
+
+
+class QueuedLogWriter:
+    """
+    Writes log records to a file from a single background thread, so request threads never wait for the disk.
+
+    The logger gets a DroppingQueueHandler that only puts records on a bounded queue. The writer thread takes the
+    records off the queue in batches, formats them with the usual '%(asctime)s - %(levelname)s - %(message)s' format
+    (the admin log views and the log statistics depend on it), writes the whole batch and flushes the file once.
+
+    The file is rotated when it grows beyond LOG_MAX_BYTES or, if LOG_ROTATE_DAILY is set, when the first record of a
+    new day is written: '<log>' is renamed to '<log>.1', older backups are shifted to '<log>.2' ... up to
+    LOG_BACKUP_COUNT, and a new file is started. Callbacks can be registered in on_rotate to process each rotated file
+    before it is shifted again; they run on the writer thread, so they must hand any lengthy work to another thread.
+
+    metrics() reports how many records are waiting on the queue and how many were enqueued, written and dropped.
+
+    Configuration (read in init_app):
+    - LOG_QUEUE_SIZE (int): Maximum number of records waiting to be written. Defaults to 10000.
+    - LOG_BATCH_SIZE (int): Maximum number of records written per flush. Defaults to 500.
+    - LOG_MAX_BYTES (int): Size after which the file is rotated, 0 disables it. Defaults to 10 MB.
+    - LOG_ROTATE_DAILY (bool): Also rotate when the day changes. Defaults to True.
+    - LOG_BACKUP_COUNT (int): Number of rotated files kept. Defaults to 5.
+    """
+
+    def __init__(self, file_path, formatter, queue_size=10000, batch_size=500, max_bytes=10 * 1024 * 1024,
+                 rotate_daily=True, backup_count=5):
+        self.file_path = file_path
+        self.formatter = formatter
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.batch_size = batch_size
+        self.max_bytes = max_bytes
+        self.rotate_daily = rotate_daily
+        self.backup_count = backup_count
+        self.on_rotate = []
+        self._counters = {'enqueued': 0, 'written': 0, 'dropped': 0, 'flushes': 0, 'rotations': 0}
+        self._counters_lock = threading.Lock()
+        self._stream = None
+        self._day = None
+        self._thread = None
+
+    def init_app(self, app):
+        self.batch_size = app.config.setdefault('LOG_BATCH_SIZE', self.batch_size)
+        self.max_bytes = app.config.setdefault('LOG_MAX_BYTES', self.max_bytes)
+        self.rotate_daily = app.config.setdefault('LOG_ROTATE_DAILY', self.rotate_daily)
+        self.backup_count = app.config.setdefault('LOG_BACKUP_COUNT', self.backup_count)
+        queue_size = app.config.setdefault('LOG_QUEUE_SIZE', self.queue.maxsize)
+        # The queue object is shared with the handler, so only its limit is changed
+        self.queue.maxsize = queue_size
+        app.extensions['log_writer'] = self
+
+    def handler(self):
+        """
+        Returns a new handler to add to a logger; records handled by it are written by this writer.
+        """
+        return DroppingQueueHandler(self)
+
+    def count(self, name, amount=1):
+        with self._counters_lock:
+            self._counters[name] += amount
+
+    def metrics(self):
+        """
+        Returns the writer's counters.
+
+        Returns:
+        - dict: 'queued' (records waiting to be written), 'enqueued', 'written', 'dropped' (records lost because the
+          queue was full), 'flushes' and 'rotations' since the start of the process.
+        """
+        with self._counters_lock:
+            return dict(self._counters, queued=self.queue.qsize())
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='log-writer', daemon=True)
+            self._thread.start()
+            atexit.register(self.stop)
+
+    def stop(self, timeout=5):
+        """
+        Writes the records still on the queue and stops the writer thread.
+        """
+        if self._thread is not None and self._thread.is_alive():
+            try:
+                self.queue.put(_STOP, timeout=timeout)
+            except queue.Full:
+                pass
+            self._thread.join(timeout)
+
+    def _open(self):
+        self._stream = open(self.file_path, 'a', encoding='utf-8')
+        try:
+            self._day = date.fromtimestamp(os.path.getmtime(self.file_path)) if self._stream.tell() else date.today()
+        except OSError:
+            self._day = date.today()
+
+    def _should_rotate(self):
+        if self.max_bytes and self._stream.tell() >= self.max_bytes:
+            return True
+        return self.rotate_daily and self._stream.tell() > 0 and date.today() != self._day
+
+    def _rotate(self):
+        self._stream.close()
+        self._stream = None
+
+        for index in range(self.backup_count - 1, 0, -1):
+            source = f'{self.file_path}.{index}'
+            if os.path.exists(source):
+                os.replace(source, f'{self.file_path}.{index + 1}')
+        rotated_file = f'{self.file_path}.1'
+        os.replace(self.file_path, rotated_file)
+        self.count('rotations')
+
+        for callback in self.on_rotate:
+            try:
+                callback(rotated_file)
+            except Exception as e:
+                print('An error occurred while processing the rotated log file:', e)
+
+        self._open()
+
+    def _write(self, records):
+        if self._stream is None:
+            self._open()
+        if self._should_rotate():
+            self._rotate()
+
+        lines = []
+        for record in records:
+            try:
+                lines.append(self.formatter.format(record) + '\n')
+            except Exception as e:
+                print('An error occurred. A log record could not be formatted:', e)
+                self.count('dropped')
+
+        self._stream.write(''.join(lines))
+        self._stream.flush()
+        self._day = date.fromtimestamp(records[-1].created) if records else self._day
+        self.count('written', len(lines))
+        self.count('flushes')
+
+    def _run(self):
+        while True:
+            record = self.queue.get()
+            stop = record is _STOP
+            records = [] if stop else [record]
+
+            while not stop and len(records) < self.batch_size:
+                try:
+                    record = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if record is _STOP:
+                    stop = True
+                else:
+                    records.append(record)
+
+            if records:
+                try:
+                    self._write(records)
+                except OSError as e:
+                    print(f'An error occurred. {len(records)} log records could not be written:', e)
+                    self.count('dropped', len(records))
+
+            if stop:
+                if self._stream is not None:
+                    self._stream.close()
+                    self._stream = None
+                return
@@ -0,0 +1,200 @@
+import atexit
+import json
+import math
+import os
+import threading
+import time
+
+
+
+class SlidingWindowCounter:
+    """
+    Approximate sliding-window event counter per key, in constant memory and time per key.
+
+    Each key keeps only the count of the current fixed window and of the previous one. The number of events in the
+    last `window` seconds is estimated as the current count plus the previous count weighted by the part of the
+    previous window that still lies within the sliding window. This avoids both the burst allowed at the boundary of
+    plain fixed windows and the per-event timestamps of an exact sliding log.
+    """
+
+    def __init__(self, limit, window):
+        self.limit = limit
+        self.window = window
+        # key -> [index of the current window, events in it, events in the previous window]
+        self._counters = {}
+
+    def _counter(self, key, now):
+        index = int(now // self.window)
+        counter = self._counters.get(key)
+        if counter is None:
+            return [index, 0, 0]
+        if counter[0] != index:
+            # Roll the windows forward; an event older than the previous window no longer counts
+            counter[:] = [index, 0, counter[1] if counter[0] == index - 1 else 0]
+        return counter
+
+    def count(self, key, now):
+        """
+        Returns the estimated number of events for `key` in the last `window` seconds.
+        """
+        index, current, previous = self._counter(key, now)
+        elapsed = (now % self.window) / self.window
+        return current + previous * (1 - elapsed)
+
+    def retry_after(self, key, now):
+        """
+        Returns the number of seconds until the estimate for `key` drops below the limit (0 if it already is).
+        """
+        index, current, previous = self._counter(key, now)
+        if self.count(key, now) < self.limit:
+            return 0
+        until_next_window = self.window - now % self.window
+        if current >= self.limit or not previous:
+            # The current window alone is over the limit: the next window starts with `current` as its previous one
+            return math.ceil(until_next_window)
+        # Wait until the previous window's weight has decayed enough: previous * (1 - elapsed) < limit - current
+        needed = self.window * (1 - (self.limit - current) / previous) - now % self.window
+        return max(1, math.ceil(needed))
+
+    def hit(self, key, now):
+        counter = self._counter(key, now)
+        counter[1] += 1
+        self._counters[key] = counter
+
+    def reset(self, key):
+        self._counters.pop(key, None)
+
+    def prune(self, now):
+        # Keys without events in the current or the previous window no longer count towards anything
+        index = int(now // self.window)
+        for key in [key for key, counter in self._counters.items() if counter[0] < index - 1]:
+            del self._counters[key]
+
+    def snapshot(self):
+        return dict(self._counters)
+
+    def restore(self, counters):
+        self._counters = {key: list(counter) for key, counter in counters.items()}
+
+
+
+class LoginRateLimiter:
+    """
+    Server-side limits on failed login attempts, per username and per client IP address.
+
+    The failed attempts of the last LOGIN_WINDOW_SECONDS are counted in sliding windows held in memory (see
+    SlidingWindowCounter), so unlike a counter in the client's session they cannot be reset by dropping the cookie.
+    check() is a couple of dictionary lookups and runs before the user is loaded and before any password hash is
+    computed, so a burst of credential-stuffing requests is refused without costing a database query or a
+    check_password_hash call:
+
+    - an IP address with LOGIN_MAX_FAILURES_PER_IP failed attempts in the window is refused (any username),
+    - a username with LOGIN_MAX_FAILURES_PER_USERNAME failed attempts in the window is refused (any address).
+
+    should_lock() tells the login route when a username reaches LOGIN_LOCK_AFTER_FAILURES failed attempts, after
+    which the account is locked in the LockedUsers table as before.
+
+    The counters are written to a JSON state file by a scheduler job every LOGIN_LIMITS_PERSIST_SECONDS seconds and
+    when the process exits, and read back at start, so restarting the application does not reset them. Each worker
+    process counts the attempts it handles itself.
+
+    Configuration (read in init_app):
+    - LOGIN_WINDOW_SECONDS (int): Length of the sliding window. Defaults to 900.
+    - LOGIN_MAX_FAILURES_PER_IP (int): Failed attempts after which an address is refused. Defaults to 20.
+    - LOGIN_MAX_FAILURES_PER_USERNAME (int): Failed attempts after which a username is refused. Defaults to 10.
+    - LOGIN_LOCK_AFTER_FAILURES (int): Failed attempts after which an existing account is locked. Defaults to 3.
+    - LOGIN_LIMITS_STATE_FILE (str): Where the counters are persisted. Defaults to 'login_limits.json' in the
+      instance folder.
+    - LOGIN_LIMITS_PERSIST_SECONDS (int): Interval of the persistence job. Defaults to 60.
+    """
+
+    def __init__(self, window=900, max_failures_per_ip=20, max_failures_per_username=10, lock_after_failures=3,
+                 state_file='login_limits.json'):
+        self.lock_after_failures = lock_after_failures
+        self.state_file = state_file
+        self.by_ip = SlidingWindowCounter(max_failures_per_ip, window)
+        self.by_username = SlidingWindowCounter(max_failures_per_username, window)
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        window = app.config.setdefault('LOGIN_WINDOW_SECONDS', self.by_ip.window)
+        self.by_ip.window = self.by_username.window = window
+        self.by_ip.limit = app.config.setdefault('LOGIN_MAX_FAILURES_PER_IP', self.by_ip.limit)
+        self.by_username.limit = app.config.setdefault('LOGIN_MAX_FAILURES_PER_USERNAME', self.by_username.limit)
+        self.lock_after_failures = app.config.setdefault('LOGIN_LOCK_AFTER_FAILURES', self.lock_after_failures)
+        self.state_file = app.config.setdefault('LOGIN_LIMITS_STATE_FILE',
+                                                os.path.join(app.instance_path, 'login_limits.json'))
+        app.config.setdefault('LOGIN_LIMITS_PERSIST_SECONDS', 60)
+        app.extensions['login_limiter'] = self
+
+        self.load()
+        atexit.register(self.persist)
+
+    def check(self, username, ip):
+        """
+        Decides whether a login attempt may proceed.
+
+        Parameters:
+        - username (str): The submitted username.
+        - ip (str): The client's IP address.
+
+        Returns:
+        - int: 0 if the attempt is allowed, otherwise the number of seconds after which it would be.
+        """
+        now = time.time()
+        with self._lock:
+            return max(self.by_ip.retry_after(ip, now), self.by_username.retry_after(username, now))
+
+    def record_failure(self, username, ip):
+        now = time.time()
+        with self._lock:
+            self.by_ip.hit(ip, now)
+            self.by_username.hit(username, now)
+
+    def should_lock(self, username):
+        """
+        Returns True if the username has reached the number of failed attempts after which its account is locked.
+        """
+        with self._lock:
+            return self.by_username.count(username, time.time()) >= self.lock_after_failures
+
+    def record_success(self, username):
+        # A successful login clears the username's failures (the address keeps its count)
+        with self._lock:
+            self.by_username.reset(username)
+
+    def reset_username(self, username):
+        with self._lock:
+            self.by_username.reset(username)
+
+    def load(self):
+        try:
+            with open(self.state_file, 'r', encoding='utf-8') as file:
+                state = json.load(file)
+        except (OSError, ValueError):
+            return
+        with self._lock:
+            self.by_ip.restore(state.get('ip', {}))
+            self.by_username.restore(state.get('username', {}))
+
+    def persist(self):
+        """
+        Writes the counters that still matter to the state file. Run periodically by the scheduler.
+        """
+        now = time.time()
+        with self._lock:
+            self.by_ip.prune(now)
+            self.by_username.prune(now)
+            state = {'ip': self.by_ip.snapshot(), 'username': self.by_username.snapshot()}
+
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.state_file)), exist_ok=True)
+            temp_file = self.state_file + '.tmp'
+            with open(temp_file, 'w', encoding='utf-8') as file:
+                json.dump(state, file)
+            os.replace(temp_file, self.state_file)
+        except OSError as e:
+            print('An error occurred. The login limits could not be saved:', e)
+
+
+login_limiter = LoginRateLimiter()
@@ -4,7 +4,8 @@ from forms.forms import AddCustomerForm
 from datetime import date
 from models.models import Users, Transaction, db
 from routes.transfer import admin_required
-from werkzeug.security import generate_password_hash
+from routes.admin_counters import increment_admin_counter
+from models.password_hasher import password_hasher
 
 
 def handle_grocery_transaction(amount, recipient_id, description, description2, description3):
@@ -305,7 +306,7 @@ def add_customer():
         username = form.username.data
         password = form.password.data
         email = form.email.data
-        password_hash = generate_password_hash(password, method='pbkdf2:sha256')
+        password_hash = password_hasher.hash(password)
         
         # Check if a user with the given username or email already exists
         existing_user = Users.query.filter((Users.username == username) | (Users.email == email)).first()
@@ -324,6 +325,7 @@ def add_customer():
 
             new_user = Users(username=username, password_hash=password_hash, role=role, email=email, phone_number=phone_number, country=country)
             db.session.add(new_user)
+            increment_admin_counter('users')
             db.session.commit()
 
             flash('User added successfully.', 'success')
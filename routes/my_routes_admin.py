@@ -1,14 +1,21 @@
-from flask import Blueprint, flash, url_for, redirect
+from flask import Blueprint, flash, url_for, redirect, jsonify, make_response, abort
 from flask_login import current_user, login_required
 from forms.forms import DeleteUserForm, LockUser, EditUserForm
-from datetime import timedelta
-from models.models import Users, Transaction, db, SupportTickets, LockedUsers, Loans
-from sqlalchemy import func, and_, case, asc
-import pandas as pd
-import matplotlib.pyplot as plt
-import io
-import base64
-from routes.transfer import admin_required, logger
+from models.models import Users, db, LockedUsers, TicketHeaders
+from routes.transfer import admin_required, logger, log_writer
+from routes.chart_cache import chart_cache, figure_to_png, fingerprint, load_pyplot
+from routes.report_snapshots import latest_report_snapshot, refresh_report_snapshot
+from routes.admin_counters import admin_counters, increment_admin_counter, status_counter, TICKET_STATUSES
+from routes.tickets import latest_ticket_messages, ticket_queue_page, priority_rank
+from routes.ticket_search import search_tickets
+from routes.user_cache import user_cache
+from routes.login_limiter import login_limiter
+from routes.audit_log import audit_log
+from routes.log_archive import log_archive
+from models.read_replica import read_only
+from routes.ledger_archive import ledger_archive
+from routes.query_stats import query_stats
+from datetime import datetime
 from flask import render_template, request
 
 
@@ -18,6 +25,7 @@ transactions_filter_bp = Blueprint('transactions_filter_bp', __name__)
 @transactions_filter_bp.route('/transactions_filter', methods=['GET', 'POST'])
 @login_required
 @admin_required  
+@read_only
 def transactions_filter():
     """
     Renders a transaction management page with functionality to filter transactions based on various criteria.
@@ -30,6 +38,9 @@ def transactions_filter():
     - Date range (From and Until): Filters transactions within the specified date range.
     - Transaction type: Filters transactions of a specific type.
 
+    Transactions older than the archive horizon are read from the ledger archive when the date range reaches into it
+    (see routes/ledger_archive.py); an invalid date is answered with 400 Bad Request.
+
     After applying the filters, the function renders the transaction management page, displaying the filtered results
     alongside all transactions for comparison and review.
 
@@ -43,24 +54,16 @@ def transactions_filter():
         date_until = request.form.get('date_until')
         transaction_type = request.form.get('transaction_type')
 
-        query = Transaction.query
-
-        # Filtering by user ID
-        if user_id:
-            query = query.filter(Transaction.user_id == user_id)
-
-        # Filter by date range
-        if date_from:
-            query = query.filter(Transaction.transaction_date >= date_from)
-        if date_until:
-            query = query.filter(Transaction.transaction_date <= date_until)
-
         # Filtering by transaction type if other than 'all' is selected
-        if transaction_type and transaction_type != 'all':
-            query = query.filter(Transaction.transaction_type == transaction_type)
+        if transaction_type == 'all':
+            transaction_type = None
 
-        # Results
-        transactions = query.all()
+        # Results, read from the archive as well when the date range reaches into it
+        try:
+            transactions = ledger_archive.transactions(user_id=user_id, date_from=date_from, date_until=date_until,
+                                                       transaction_type=transaction_type)
+        except ValueError:
+            abort(400)
 
         return render_template('transaction_management.html', transactions=transactions)
 
@@ -70,361 +73,253 @@ def transactions_filter():
 
 
 
-def count_log_levels(file_path):
-    """
-    Counts the occurrences of different log levels in a log file.
+# Charts of the reports and statistics page: chart name -> (key in the report snapshot, chart kind, title, figure size)
+REPORT_CHARTS = {
+    'user_roles': ('user_roles', 'pie', 'Distribution of user roles in the system', (4, 3)),
+    'user_countries': ('user_countries', 'pie', 'Distribution of user nationalities in the system', (4, 3)),
+    'ticket_priorities': ('ticket_priorities', 'pie', 'Distribution of the number of messages with a specific priority in the system', (7, 3)),
+    'transaction_types': ('transaction_types', 'pie', 'Distribution of transaction types in the transaction system', (6, 3)),
+    'average_transaction_values': ('average_transaction_values', 'bar', 'Average Transaction Value for Each Transaction Type', (8, 6)),
+    'log_levels': ('log_counts', 'pie', 'Distribution of log types in the system', (6, 3)),
+    'loan_types': ('loan_types', 'pie', 'Distribution of loan types in the system', (6, 3)),
+}
 
-    This function reads a log file specified by `file_path` and counts the occurrences of log levels such as INFO,
-    ERROR, WARNING, and CRITICAL within the file. It returns a dictionary with the log levels as keys and the counts
-    as values.
 
-    Parameters:
-    - file_path (str): The path to the log file to be analyzed.
 
-    Returns:
-    - dict: A dictionary with keys corresponding to the log levels ("INFO", "ERROR", "WARNING", "CRITICAL") and
-      integer values representing the number of times each log level appears in the file.
+def chart_series(rows):
+    """
+    Splits aggregate (label, value) rows into the label and value series used by the charts.
 
-    Example:
-    If the log file contains two INFO messages, one ERROR message, and one WARNING message, the function will return:
-    {"INFO": 2, "ERROR": 1, "WARNING": 1, "CRITICAL": 0}
+    Parameters:
+    - rows (list | dict): Aggregate rows, or a dictionary mapping labels to values (e.g. the log level counts).
 
-    Note:
-    The function assumes that each line in the log file contains at most one log level. It does not count multiple
-    occurrences of log levels within a single line. The search for log level strings is case-sensitive.
+    Returns:
+    - tuple: (labels, values, rows) - the two series and the rows as a list of (label, value) pairs.
     """
-    log_levels = {"INFO": 0, "ERROR": 0, "WARNING": 0, "CRITICAL": 0}
-
-    with open(file_path, "r", encoding="utf-8") as file:
-        for line in file:
-            if "INFO" in line:
-                log_levels["INFO"] += 1
-            elif "ERROR" in line:
-                log_levels["ERROR"] += 1
-            elif "WARNING" in line:
-                log_levels["WARNING"] += 1
-            elif "CRITICAL" in line:
-                log_levels["CRITICAL"] += 1
+    if isinstance(rows, dict):
+        rows = list(rows.items())
+    rows = [(row[0], row[1]) for row in rows]
 
-    return log_levels
+    return [row[0] for row in rows], [row[1] for row in rows], rows
 
 
 
-def plot_to_html_img(plt):
+def chart_data_response(title, kind, rows):
     """
-    Converts a matplotlib plot to an HTML image tag with a base64-encoded PNG image.
+    Builds the JSON response with the data series behind a chart, for rendering on the client side.
 
-    This function takes a matplotlib plot object, saves it as a PNG image to a bytes buffer, then encodes the image
-    to a base64 string. This string is embedded into an HTML image tag, allowing the plot to be displayed directly
-    in web browsers or any HTML-supporting environment without needing a separate file.
+    The response carries an ETag derived from the data fingerprint (the same one the chart cache uses), so browsers
+    revalidate with If-None-Match and receive an empty 304 Not Modified response while the data is unchanged.
 
     Parameters:
-    - plt (matplotlib.pyplot): The plot object created using matplotlib that needs to be converted.
+    - title (str): Title of the chart.
+    - kind (str): Kind of the chart, 'pie' or 'bar'.
+    - rows (list | dict): Aggregate rows the chart is drawn from.
 
     Returns:
-    - str: An HTML image tag containing the base64-encoded PNG image of the plot.
-
-    Note:
-    - This function requires the `io` and `base64` modules to be imported.
-    - It's important to call plt.close() after using this function to release memory if you're generating many plots.
+    - Response: The JSON response, or a 304 response if the client's copy is current.
     """
-    buf = io.BytesIO()
-    plt.savefig(buf, format='png')
-    buf.seek(0)
-    image_base64 = base64.b64encode(buf.getvalue()).decode('utf-8').replace('\n', '')
-    buf.close()
+    labels, values, rows = chart_series(rows)
 
-    return f'<img src="data:image/png;base64,{image_base64}"/>'
+    response = jsonify(title=title, kind=kind, labels=labels, values=values)
+    response.set_etag(fingerprint([(title, kind)] + rows))
+    response.headers['Cache-Control'] = 'private, no-cache'
 
+    return response.make_conditional(request)
 
 
 
-reports_and_statistics_bp = Blueprint('reports_and_statistics_bp', __name__)
-
-@reports_and_statistics_bp.route('/reports_and_statistics', methods=['GET', 'POST'])
-@login_required
-@admin_required
-def reports_and_statistics():
+def render_pie_chart(rows, title, figsize):
     """
-    Generates a comprehensive report and statistics for various aspects of the system, including user roles, nationalities,
-    support ticket priorities, transaction types, average transaction values, response times for support tickets,
-    priority counts for support tickets, log levels, and loan types. It visualizes this data using pie charts and bar charts,
-    converting them into HTML images for easy display in a web interface.
-
-    This function queries the database for specific data sets, processes and analyzes the data using Pandas, and then
-    visualizes the results using Matplotlib. The visualizations are converted to HTML images that can be directly embedded
-    in the web page rendered by Flask. Additionally, the function calculates average response times for support tickets
-    and categorizes support tickets by priority, preparing all necessary information for display on the reports and statistics page.
-
-    Operations performed:
-    1. Queries and visualizes the distribution of user roles.
-    2. Queries and visualizes the distribution of user nationalities.
-    3. Queries and visualizes the distribution of support ticket priorities based on unique reference numbers.
-    4. Queries and visualizes the distribution of transaction types.
-    5. Calculates and visualizes the average transaction value for each transaction type.
-    6. Calculates the average response time between the first and second records for unique support ticket reference numbers.
-    7. Counts and prepares support tickets by priority level for display.
-    8. Counts the occurrences of different log levels in a log file and visualizes this distribution.
-    9. Queries and visualizes the distribution of loan types.
-
-    The results of these operations are passed to the 'reports_and_statistics.html' template, along with additional data
-    like average response time, priority counts, log counts, and visualizations as context variables for rendering.
+    Draws a pie chart from (label, count) rows and returns it as PNG bytes.
 
-    Returns:
-    - render_template: Renders the 'reports_and_statistics.html' template with context variables including
-      charts (as HTML images), average response time, counts of support tickets by priority, log counts, and more.
+    Parameters:
+    - rows (list): Aggregate rows, each a (label, count) pair.
+    - title (str): Title of the chart.
+    - figsize (tuple): Size of the figure in inches.
 
-    Requires:
-    - Flask login_required and admin_required decorators to ensure that only logged-in and authorized (admin) users
-      can access this function.
-    - SQLAlchemy for database queries.
-    - Pandas for data processing and analysis.
-    - Matplotlib for data visualization.
+    Returns:
+    - bytes: The PNG image of the chart.
     """
-    # Downloading data about user roles
-    roles_count = Users.query.with_entities(Users.role, func.count(Users.role)).group_by(Users.role).all()
-
-    # Creting DataFrame
-    roles_df = pd.DataFrame(roles_count, columns=['Role', 'Count'])
-
-    # Create a pie chart
-    fig, ax = plt.subplots(figsize=(4, 3))
-    ax.pie(roles_df['Count'], labels=roles_df['Role'], autopct='%1.1f%%', startangle=140)
-    ax.set_title('Distribution of user roles in the system')
+    plt = load_pyplot()
+    fig, ax = plt.subplots(figsize=figsize)
+    ax.pie([row[1] for row in rows], labels=[row[0] for row in rows], autopct='%1.1f%%', startangle=140)
+    ax.set_title(title)
 
     # Changing the background color
     ax.set_facecolor('black')
     # Changing the background color of the figure
     fig.patch.set_facecolor('lightgrey')
-    
-    # Convert chart to HTML img
-    chart1 = plot_to_html_img(plt)
-    
-    
-    
-    
-    # Retrieving data about user nationalities
-    countries_count = Users.query.with_entities(Users.country, func.count(Users.country)).group_by(Users.country).all()
-    
-    #Creating dataframe
-    countries_df = pd.DataFrame(countries_count, columns = ['Country', 'Count'])
-    
-    # Create a pie chart
-    fig, ax = plt.subplots(figsize=(4, 3)) 
-    ax.pie(countries_df['Count'], labels=countries_df['Country'], autopct='%1.1f%%', startangle=140)
-    ax.set_title('Distribution of user nationalities in the system')
 
-    
-    ax.set_facecolor('black') 
-    fig.patch.set_facecolor('lightgrey')  
-    
-    # Convert chart to HTML img
-    chart2 = plot_to_html_img(plt)
-    
-    
-    # Subquery to extract unique reference numbers with their priorities
-    # Podzapytanie do wyodrębnienia unikalnych numerów referencyjnych z ich priorytetami
-    subquery = (db.session.query(SupportTickets.reference_number, SupportTickets.priority)
-                .distinct(SupportTickets.reference_number)
-                .subquery())
-    
-    # Master Query - Priority grouping and counting based on unique reference numbers
-    # Zapytanie główne - grupowanie i zliczanie priorytetów na podstawie unikalnych numerów referencyjnych
-    tickets_count = (db.session.query(subquery.c.priority, func.count(subquery.c.priority))
-                    .group_by(subquery.c.priority)
-                    .all())
-
-    tickets_df = pd.DataFrame(tickets_count, columns=['Priority', 'Count'])
+    return figure_to_png(fig)
 
-    fig, ax = plt.subplots(figsize=(7, 3))
-    ax.pie(tickets_df['Count'], labels=tickets_df['Priority'], autopct='%1.1f%%', startangle=140)
-    ax.set_title('Distribution of the number of messages with a specific priority in the system')
-    ax.set_facecolor('black')
-    fig.patch.set_facecolor('lightgrey')
 
-    chart3 = plot_to_html_img(plt)
-    
-    
-    
-    
-    
-    # Retrieving data about transaction types
-    transaction_types_count = Transaction.query.with_entities(Transaction.transaction_type, func.count(Transaction.transaction_type)).group_by(Transaction.transaction_type).all()
-    
-    # Creating dataframe
-    transaction_types_df = pd.DataFrame(transaction_types_count, columns = ['Transaction type', 'Count'])
-    
-    # Create a pie chart
-    fig, ax = plt.subplots(figsize=(6, 3)) 
-    ax.pie(transaction_types_df['Count'], labels=transaction_types_df['Transaction type'], autopct='%1.1f%%', startangle=140)
-    ax.set_title('Distribution of transaction types in the transaction system')
 
-    
-    ax.set_facecolor('black')
-    fig.patch.set_facecolor('lightgrey')
-    
-    # Convert chart to HTML img
-    chart4 = plot_to_html_img(plt)
-    
-    
-    
-    
-    
-    
-    # A query to calculate the average transaction value for each type
-    avg_transactions = (db.session.query(Transaction.transaction_type,func.avg(Transaction.debit_amount + Transaction.credit_amount).label('average_value'))
-                    .filter((Transaction.debit_amount + Transaction.credit_amount) <= 10000).group_by(Transaction.transaction_type).all())
+def render_average_values_chart(rows):
+    """
+    Draws the bar chart of the average transaction value per transaction type and returns it as PNG bytes.
 
-    # Creating DataFrame from result
-    transactions_df = pd.DataFrame(avg_transactions, columns=['TransactionType', 'AverageValue'])
+    Parameters:
+    - rows (list): Aggregate rows, each a (transaction type, average value) pair.
 
-    # Create a bar chart
+    Returns:
+    - bytes: The PNG image of the chart.
+    """
+    plt = load_pyplot()
     fig, ax = plt.subplots(figsize=(8, 6))
-    transactions_df.plot(kind='bar', x='TransactionType', y='AverageValue', ax=ax, color='skyblue')
+    ax.bar([row[0] for row in rows], [row[1] for row in rows], color='skyblue', label='AverageValue')
+    ax.legend()
 
     ax.set_title('Average Transaction Value for Each Transaction Type')
     ax.set_xlabel('Transaction type')
     ax.set_ylabel('Average value')
-    plt.xticks(rotation=45)
-    
+    ax.tick_params(axis='x', labelrotation=45)
+
     # Adding numeric values in a chart
     for bar in ax.patches:
-        ax.annotate(format(bar.get_height(), '.2f'), 
-                (bar.get_x() + bar.get_width() / 2, 
+        ax.annotate(format(bar.get_height(), '.2f'),
+                (bar.get_x() + bar.get_width() / 2,
                     bar.get_height()), ha='center', va='center',
                 size=10, xytext=(0, 8),
                 textcoords='offset points')
-    
-    # Convert chart to HTML img
-    chart5 = plot_to_html_img(plt)
-    
-    
-    
-    
-    
-    
-    response_times = []
-    
-    # Find unique reference numbers
-    unique_reference_numbers = (SupportTickets.query.with_entities(SupportTickets.reference_number).distinct().all())
 
-    # Print the number of unique reference numbers
-    print(f"Number of unique reference numbers: {len(unique_reference_numbers)}")
+    return figure_to_png(fig)
 
-    # View reference numbers
-    for ref_number in unique_reference_numbers:
-        print(ref_number[0])
 
-        dates = (db.session.query(SupportTickets.created_at)
-            .filter(SupportTickets.reference_number == ref_number[0])  
-            .order_by(asc(SupportTickets.created_at))
-            .limit(2)  # Limited to the first two records
-            .all())
-        
-        
 
-        # Time difference calculation
-        if len(dates) == 2:
-            first_record, second_record = dates[0][0], dates[1][0]  
-            time_difference = second_record - first_record
-            response_times.append(time_difference)
-            print("The time elapsed between records:", time_difference)
-        else:
-            print("Not enough records found.")
-    
-    if response_times:
-        total_time = sum(response_times, timedelta())  # Timedelta summation
-        average_time_seconds = total_time.total_seconds() / len(response_times)  # Average time in seconds
+reports_and_statistics_bp = Blueprint('reports_and_statistics_bp', __name__)
 
-        # Calculation of hours and minutes
-        hours, remainder = divmod(average_time_seconds, 3600)
-        minutes, _ = divmod(remainder, 60)
+@reports_and_statistics_bp.route('/reports_and_statistics/chart_data/<chart_name>', methods=['GET'])
+@login_required
+@admin_required
+@read_only
+def report_chart_data(chart_name):
+    """
+    Returns the data series behind one chart of the reports and statistics page as JSON.
 
-        # Display of average time in hours and minutes
-        print("Average response time: {} hours {} minutes".format(int(hours), int(minutes)))
-    else:
-        print("Not enough records were found to calculate the average response time.")
-    
-    
-    if response_times:
-        average_time_seconds = total_time.total_seconds() / len(response_times)
-        hours, remainder = divmod(average_time_seconds, 3600)
-        minutes, _ = divmod(remainder, 60)
-        average_response_time = "{} hours {} minutes".format(int(hours), int(minutes))
+    The page renders its charts in the browser (static/charts.js) from these endpoints, so no images are generated on
+    the server and the HTML page stays small. The data comes from the latest report snapshot and the response is
+    cacheable with ETags.
+
+    Args:
+        chart_name (str): Name of the chart, one of the keys of REPORT_CHARTS.
+
+    Returns:
+        A JSON response with the keys 'title', 'kind', 'labels' and 'values', a 304 response if the client's copy is
+        current, or 404 for an unknown chart.
+    """
+    if chart_name not in REPORT_CHARTS:
+        abort(404)
+
+    snapshot_key, kind, title, _ = REPORT_CHARTS[chart_name]
+    _, report = latest_report_snapshot()
+
+    return chart_data_response(title, kind, report[snapshot_key])
+
+
+
+@reports_and_statistics_bp.route('/reports_and_statistics/chart/<chart_name>.png', methods=['GET'])
+@login_required
+@admin_required
+@read_only
+def report_chart_image(chart_name):
+    """
+    Returns one chart of the reports and statistics page as a PNG image.
+
+    This is the fallback for browsers without JavaScript. Images are rendered with Matplotlib through the chart cache,
+    so they are only re-rendered when the data of the latest report snapshot changes.
+
+    Args:
+        chart_name (str): Name of the chart, one of the keys of REPORT_CHARTS.
+
+    Returns:
+        A PNG response with an ETag, a 304 response if the client's copy is current, or 404 for an unknown chart.
+    """
+    if chart_name not in REPORT_CHARTS:
+        abort(404)
+
+    snapshot_key, kind, title, figsize = REPORT_CHARTS[chart_name]
+    _, report = latest_report_snapshot()
+    _, _, rows = chart_series(report[snapshot_key])
+
+    if kind == 'bar':
+        png = chart_cache.get_or_render(chart_name, rows, render_average_values_chart)
     else:
-        average_response_time = "Brak danych"
-    
-    
-    
-    # Group messages by priority and count them
-    priority_counts = (SupportTickets.query
-                       .with_entities(SupportTickets.priority, func.count(SupportTickets.reference_number.distinct()))
-                       .group_by(SupportTickets.priority)
-                       .all())
-
-    # Initialization of variables for each priority
-    normal_count = high_count = urgent_count = 0
-
-    # Assigning results to appropriate variables
-    for priority, count in priority_counts:
-        if priority == 'normal':
-            normal_count = count
-        elif priority == 'high':
-            high_count = count
-        elif priority == 'urgent':
-            urgent_count = count
-    total_count = normal_count + high_count + urgent_count
-    
-    
-    
-    
-    # Path to your log file
-    log_file_path = 'app.log'
-    
-    # Calling the log counting function
-    log_counts = count_log_levels(log_file_path)
-    
-    
-    # Creating a DataFrame for the log graph in the app.log file
-    
-    log_counts_df = pd.DataFrame(list(log_counts.items()), columns=['Log Level', 'Count'])
+        png = chart_cache.get_or_render(chart_name, rows, lambda data: render_pie_chart(data, title, figsize))
 
-    # Pie chart
-    fig, ax = plt.subplots(figsize=(6, 3))  # Utworzenie figury i osi
-    ax.pie(log_counts_df['Count'], labels=log_counts_df['Log Level'], autopct='%1.1f%%', startangle=140)
-    ax.set_title('Distribution of log types in the system')
+    response = make_response(png)
+    response.mimetype = 'image/png'
+    response.set_etag(fingerprint(rows))
+    response.headers['Cache-Control'] = 'private, no-cache'
 
-    ax.set_facecolor('black')  
-    fig.patch.set_facecolor('lightgrey')  
+    return response.make_conditional(request)
 
-    chart6 = plot_to_html_img(plt)
-    
-    
-    
-    
-    
-    
-    # Retrieving data about loan types
-    loan_types_count = Loans.query.with_entities(Loans.product_id, func.count(Loans.product_id)).group_by(Loans.product_id).all()
-    
-    # Creating dataframe
-    loan_types_df = pd.DataFrame(loan_types_count, columns = ['Loan type', 'Count'])
-    
-    # Create a pie chart
-    fig, ax = plt.subplots(figsize=(6, 3)) 
-    ax.pie(loan_types_df['Count'], labels = loan_types_df['Loan type'], autopct='%1.1f%%', startangle=140)
-    ax.set_title('Distribution of loan types in the system')
 
+
+@reports_and_statistics_bp.route('/reports_and_statistics', methods=['GET', 'POST'])
+@login_required
+@admin_required
+@read_only
+def reports_and_statistics():
+    """
+    Generates a comprehensive report and statistics for various aspects of the system, including user roles, nationalities,
+    support ticket priorities, transaction types, average transaction values, response times for support tickets,
+    priority counts for support tickets, log levels, and loan types. It visualizes this data using pie charts and bar charts,
+    which are drawn in the browser from the JSON chart data endpoints (report_chart_data).
+
+    The aggregates are not computed on every view: they are read from the latest report snapshot, which a scheduled
+    job refreshes in the background (see routes/report_snapshots.py), so the page latency does not depend on the size
+    of the tables or of the log file. Submitting the page's "Refresh now" form (a POST request) computes a new snapshot
+    immediately. The page itself contains no images: each chart is a canvas filled in by static/charts.js from the
+    chart's JSON endpoint, so Matplotlib is not used while serving the page (PNG images from the chart cache are only
+    served as a fallback for browsers without JavaScript).
+
+    The snapshot contains:
+    1. The distribution of user roles.
+    2. The distribution of user nationalities.
+    3. The distribution of support ticket priorities based on unique reference numbers.
+    4. The distribution of transaction types.
+    5. The average transaction value for each transaction type.
+    6. The average and the p50/p90/p99 response time between the first and second records for unique support
+       ticket reference numbers.
+    7. The number of support tickets for each priority level.
+    8. The occurrences of different log levels in the log file.
+    9. The distribution of loan types.
+
+    The results are passed to the 'reports_and_statistics.html' template, along with additional data like average
+    response time, priority counts, log counts, the snapshot's generation time and visualizations as context variables
+    for rendering.
+
+    Returns:
+    - render_template: Renders the 'reports_and_statistics.html' template with context variables including
+      the list of charts, average response time, counts of support tickets by priority, log counts, and more.
+
+    Requires:
+    - Flask login_required and admin_required decorators to ensure that only logged-in and authorized (admin) users
+      can access this function.
+    """
+    if request.method == 'POST' and request.form.get('refresh'):
+        refresh_report_snapshot()
+        flash('Reports have been refreshed.', 'success')
+        
+    generated_at, report = latest_report_snapshot()
     
-    ax.set_facecolor('black')
-    fig.patch.set_facecolor('lightgrey')
+    # First-response times of all tickets and their average / percentiles
+    response_time_stats = report['response_times']
+    average_response_time = response_time_stats['average']
+    
+    # Number of tickets for each priority
+    normal_count = report['priority_counts']['normal']
+    high_count = report['priority_counts']['high']
+    urgent_count = report['priority_counts']['urgent']
+    total_count = normal_count + high_count + urgent_count
     
-    # Convert chart to HTML img
-    chart7 = plot_to_html_img(plt)
+    log_counts = report['log_counts']
     
     
-    return render_template('reports_and_statistics.html', chart1 = chart1, chart2 = chart2, chart3 = chart3, chart4=chart4, chart5=chart5, average_response_time=average_response_time, 
-                           normal_count = normal_count, high_count = high_count, urgent_count = urgent_count, total_count=total_count, log_counts = log_counts, chart6 = chart6, chart7=chart7)
+    return render_template('reports_and_statistics.html', average_response_time=average_response_time, response_time_stats = response_time_stats, 
+                           normal_count = normal_count, high_count = high_count, urgent_count = urgent_count, total_count=total_count, log_counts = log_counts,
+                           generated_at = generated_at, report_charts = REPORT_CHARTS)
     
     
     
@@ -471,8 +366,11 @@ def delete_user():
 
         if user_to_delete:
             try:
+                user_id = user_to_delete.id
                 db.session.delete(user_to_delete)
+                increment_admin_counter('users', -1)
                 db.session.commit()
+                user_cache.invalidate(user_id)
                 flash('The user has been successfully deleted.', 'success')
             except Exception as e:
                 db.session.rollback()
@@ -528,6 +426,7 @@ def update_customer_information(username):
         user.phone_number = form.phone_number.data
         user.country = form.country.data
         db.session.commit()
+        user_cache.invalidate(user.id)
         flash('Customer profile for ' + user.username + ' has been updated.')
         return render_template('edit_customer_information.html', user = user)
 
@@ -545,24 +444,27 @@ find_tickets_bp = Blueprint('find_tickets_bp', __name__)
 @admin_required
 def find_tickets():
     """
-    Searches and filters support tickets based on their priority.
+    Searches and filters support tickets based on their priority or on the text of their messages.
 
     This function is accessible to administrators and allows them to find support tickets by priority. Upon receiving
-    a POST request, it captures the 'priority' value from the form submitted. It then constructs a subquery to find
-    the latest created_at date for each support ticket's reference number, allowing it to identify the most recent
-    tickets.
+    a POST request, it captures the 'priority' value from the form submitted. The latest message of every ticket
+    thread is read through the thread headers (TicketHeaders), which point at it, optionally filtered by the priority
+    specified in the form. The tickets are ordered by priority, with 'urgent' tickets shown first, followed by 'high'
+    and then all other tickets.
 
-    An external query then joins the subquery to retrieve full records of the latest tickets, optionally filtering
-    them by the priority specified in the form. The tickets are ordered by priority, with 'urgent' tickets shown first,
-    followed by 'high' and then all other tickets.
+    A GET request with the 'q' query parameter searches the titles and descriptions of all ticket messages instead,
+    e.g. for an account number or a merchant mentioned in a fraud ticket. The search uses the full-text index of the
+    tickets (see routes/ticket_search.py) and lists the matching threads, best match first, with the matched words
+    highlighted. The results are paginated with the 'page' query parameter.
 
     Parameters:
-    - None explicitly; however, the function processes 'priority' from POST request form data to filter the tickets.
+    - None explicitly; however, the function processes 'priority' from POST request form data to filter the tickets,
+      and 'q' and 'page' from the query string to search them.
 
     Returns:
     - render_template: Renders the 'communication_with_clients_sorting.html' template. On a POST request, it passes
-      the filtered and ordered tickets to the template. On a GET request or if no priority is specified, it may render
-      the template without passing any tickets, depending on the implementation details.
+      the filtered and ordered tickets to the template. On a GET request with a search text, it passes one page of
+      matching threads ('search_results') and the search text ('search_text'); otherwise it renders the forms only.
 
     Requires:
     - Flask login_required decorator to ensure that only logged-in users can access this route.
@@ -571,28 +473,21 @@ def find_tickets():
     if request.method == 'POST':
         priority = request.form.get('priority')
         
-        # A subquery to find the latest date for each reference number
-        # Podzapytanie do znalezienia najnowszej daty dla każdego reference_number
-        subquery = (db.session.query(SupportTickets.reference_number,
-                                     func.max(SupportTickets.created_at).label('latest_date'))
-                              .group_by(SupportTickets.reference_number)
-                              .subquery())
-        
-        # External query to retrieve full records
-        # Zewnętrzne zapytanie do pobrania pełnych rekordów
-        query = (db.session.query(SupportTickets)
-                            .join(subquery, and_(SupportTickets.reference_number == subquery.c.reference_number,
-                                                 SupportTickets.created_at == subquery.c.latest_date)))
+        # The latest message of every thread, found through the thread headers, urgent threads first
+        query = latest_ticket_messages()
         # Filtration by priority
         if priority:
-            query = query.filter(SupportTickets.priority == priority)
+            query = query.filter(TicketHeaders.priority_rank == priority_rank(priority))
 
-        query = query.order_by(case((SupportTickets.priority == 'urgent', 1),
-                                    (SupportTickets.priority == 'high', 2),
-                                    else_=3))
         tickets = query.all()
         return render_template('communication_with_clients_sorting.html', tickets=tickets)
-       
+
+    search_text = request.args.get('q', '').strip()
+    if search_text:
+        search_results = search_tickets(search_text, page=request.args.get('page', 1, type=int))
+        return render_template('communication_with_clients_sorting.html', search_results=search_results,
+                               search_text=search_text)
+
     return render_template('communication_with_clients_sorting.html')
 
 
@@ -637,7 +532,9 @@ def block_customer():
                 user_for_lock = LockedUsers(username=form.username.data)
                 
                 db.session.add(user_for_lock)
+                increment_admin_counter('locked_users')
                 db.session.commit()
+                user_cache.invalidate(user_exists.id)
 
                 flash('User account for: ' + user_for_lock.username + '  locked successfully!', 'success')
         else:
@@ -685,7 +582,11 @@ def unlock_access(username):
     
     if user:
         db.session.delete(user)
+        increment_admin_counter('locked_users', -1)
         db.session.commit()
+        user_cache.invalidate_username(user.username)
+        # The failed attempts that led to the lock no longer count
+        login_limiter.reset_username(user.username)
         flash('User account: ' + user.username + '  unlocked successfully!', 'success')
     else:
         flash('User not found.', 'error')
@@ -712,12 +613,11 @@ def admin_dashboard():
     high, urgent).
 
     The function first verifies the role of the current user to ensure they have
-    admin privileges. It then aggregates data from the Users and LockedUsers models
-    to provide counts of all users and locked users, respectively.
-
-    Additionally, it groups and counts support tickets by their priority, assigning
-    these counts to separate variables for normal, high, and urgent priority tickets.
-    This data is used to inform the admin about the volume and nature of support
+    admin privileges. The counts of all users and locked users, and the number of
+    support tickets for each priority (normal, high, urgent), are read from the
+    admin counters table. The counters are updated in the same transaction by the
+    code that adds or deletes users, locks or unlocks accounts and creates or
+    deletes support tickets, so they are always current. This data is used to inform the admin about the volume and nature of support
     queries being handled.
 
     If the user attempting to access this route does not have admin privileges, an
@@ -731,28 +631,15 @@ def admin_dashboard():
     """
     user = current_user
     if user.role != 'admin':
-        logger.error(f"No access to the protected resource - /admin_dashboard  '{user.username}' ")
+        logger.error(f"No access to the protected resource - /admin_dashboard  '{user.username}' ", extra={'event_type': 'access_denied'})
         
-    all_users = Users.query.count()
-    locked_users = LockedUsers.query.count()
-    
-    # Group messages by priority and count them
-    priority_counts = (SupportTickets.query
-                       .with_entities(SupportTickets.priority, func.count(SupportTickets.reference_number.distinct()))
-                       .group_by(SupportTickets.priority)
-                       .all())
-
-    # Initialization of variables for each priority
-    normal_count = high_count = urgent_count = 0
-
-    # Assigning results to appropriate variables
-    for priority, count in priority_counts:
-        if priority == 'normal':
-            normal_count = count
-        elif priority == 'high':
-            high_count = count
-        elif priority == 'urgent':
-            urgent_count = count
+    # Counts come from the admin counters, kept up to date by the code that adds or removes what they count
+    counters = admin_counters()
+    all_users = counters['users']
+    locked_users = counters['locked_users']
+    normal_count = counters['tickets_normal']
+    high_count = counters['tickets_high']
+    urgent_count = counters['tickets_urgent']
     
     # Render template by passing data
     return render_template('admin_dashboard.html', users = all_users, locked_users = locked_users, normal_count=normal_count, high_count=high_count, urgent_count=urgent_count)
@@ -766,63 +653,58 @@ logs_filtering_bp = Blueprint('logs_filtering_bp', __name__)
 @admin_required
 def logs_filtering():
     """
-    Filters and displays logs based on the selected log level from a web form.
-
-    This route is accessible only to logged-in administrators and provides
-    functionality for filtering application logs by severity level (CRITICAL, ERROR,
-    WARNING, INFO). The user selects a log level via a POST request through a form
-    on the 'safety_settings.html' page. The selected log level is used to filter
-    log entries from a specified log file ('app.log').
+    Filters and displays the application logs from the indexed audit log store.
 
-    The function reads the log file line by line, expecting each line to be in the
-    format: '%(asctime)s - %(levelname)s - %(message)s'. It then filters the logs
-    to include only those that match the selected level. The filtered log entries
-    are stored in a list of dictionaries, each dictionary representing a single
-    log entry with 'date', 'level', and 'message' keys.
+    This route is accessible only to logged-in administrators. Every record written to the application logger is also
+    stored as a structured entry (timestamp, level, event type, username, request path and message) in the audit log
+    database, so the logs can be filtered with indexed queries instead of reading and splitting the whole 'app.log'
+    file on every request.
 
-    After filtering, it uses pandas to create a DataFrame from the list of log
-    entries. This DataFrame is then passed to the 'safety_settings.html' template
-    as a list of dictionaries via the 'all_logs' variable, allowing for display
-    of the filtered log data in the web interface.
+    The filters are read from the request (query string or form data), and all of them are optional:
+    - source: 'archive' searches the compressed archives of the rotated log files (months of history) instead of
+      the audit log store; only the archive blocks whose index matches the filters are decompressed,
+    - level: log level (CRITICAL, ERROR, WARNING, INFO),
+    - username: exact username the record refers to,
+    - date_from / date_until: date range (YYYY-MM-DD), inclusive,
+    - text: text the log message must contain,
+    - page: page number of the results, 50 records per page, newest first.
 
-    If the request is of type GET, the page will simply display the form without
-    any filtered log results. This allows administrators to select a log level for
-    filtering each time they access the page.
+    The filter form on 'safety_settings.html' is submitted with GET, so the result pages can be linked to and paged
+    through. When no filter has been submitted, the page simply displays the form without results.
 
     Args:
         None
 
     Returns:
-        A rendered template ('safety_settings.html') that displays either the form
-        for selecting a log level (on GET request) or the results of the log
-        filtering (on POST request), based on the selected log level.
+        A rendered template ('safety_settings.html') that displays the filter form and, when a filter was submitted,
+        one page of the matching log records ('all_logs') together with the pagination object ('logs_page') and the
+        submitted filters ('filters'). The counters of the background log writer ('log_metrics') are shown as well.
     """
-    if request.method == 'POST':
-        selected_level = request.form['level'].upper()
-
-        # List for storing log data
-        logs_data = []
-
-        # Read logs from file
-        log_file_path = 'app.log'
-        with open(log_file_path, 'r') as file:
-            for line in file:
-                # Log's format: '%(asctime)s - %(levelname)s - %(message)s'
-                parts = line.strip().split(' - ', 2)
-                if len(parts) == 3:
-                    date, level, message = parts
-                    if level.upper() == selected_level:
-                        # We add data to the list
-                        logs_data.append({'date': date, 'level': level, 'message': message})
-
-        # Creating a DataFrame from filtered data
-        logs_df = pd.DataFrame(logs_data)
-
-        # Transferring filtered logs to the template
-        return render_template('safety_settings.html', all_logs=logs_df.to_dict('records'))
-    else:
-        # If the request is of type GET, just display the form without the results
-        return render_template('safety_settings.html')
+    filters = {name: request.values.get(name, '').strip() for name in ('source', 'level', 'username', 'date_from', 'date_until', 'text')}
+
+    if not any(value for name, value in filters.items() if name != 'source') and 'level' not in request.values:
+        # No filter submitted yet, just display the form without the results
+        return render_template('safety_settings.html', filters=filters, log_metrics=log_writer.metrics())
+
+    try:
+        date_from = datetime.strptime(filters['date_from'], '%Y-%m-%d').date() if filters['date_from'] else None
+        date_until = datetime.strptime(filters['date_until'], '%Y-%m-%d').date() if filters['date_until'] else None
+    except ValueError:
+        flash('Invalid date, please use the YYYY-MM-DD format.', 'danger')
+        return render_template('safety_settings.html', filters=filters, log_metrics=log_writer.metrics())
+
+    # Recent records come from the audit log store, older history from the compressed archives of rotated logs
+    store = log_archive if filters['source'] == 'archive' else audit_log
+    logs_page = store.search(level=filters['level'] or None,
+                             username=filters['username'] or None,
+                             date_from=date_from,
+                             date_to=date_until,
+                             text=filters['text'] or None,
+                             page=request.values.get('page', 1, type=int))
+
+    # Transferring filtered logs to the template
+    return render_template('safety_settings.html', all_logs=logs_page.items, logs_page=logs_page, filters=filters,
+                           log_metrics=log_writer.metrics())
     
     
     
@@ -831,54 +713,78 @@ cwc_bp = Blueprint('cwc_bp', __name__)
 @cwc_bp.route('/communication_with_clients', methods=['GET', 'POST'])
 @login_required
 @admin_required
+@read_only
 def cwc():
     """
-    Retrieves and displays support ticket information for communication with clients.
-
-    This route, accessible only to logged-in administrators, provides a view for
-    managing communications with clients through support tickets. It displays all
-    support tickets and specifically highlights the latest tickets based on the
-    unique reference number for each ticket thread.
+    Displays the admin work queue of support tickets for communication with clients.
 
-    The function performs two main queries:
-    1. Retrieves all support tickets to be displayed.
-    2. Utilizes a subquery to identify the latest date for each reference number,
-       allowing the identification of the most recent ticket in each thread. This
-       is achieved by grouping tickets by their reference number and selecting the
-       maximum creation date. An external query then joins this subquery to retrieve
-       full records of the latest tickets.
+    This route, accessible only to logged-in administrators, lists the ticket threads
+    that need attention, one row per thread showing its latest message. The threads
+    are read from the thread headers (TicketHeaders) in work queue order: by the
+    stored priority rank (urgent first, then high, then normal) and then by last
+    activity, the thread waiting longest first. The message table itself is never
+    scanned.
 
-    The results of these queries are passed to the 'communication_with_clients.html'
-    template. This setup allows administrators to view all tickets and specifically
-    focus on the latest updates in ongoing conversations with clients.
+    The queue is paginated with a cursor: the 'after' query parameter holds the
+    position of the last thread of the previous page, and the next page continues
+    from there using the index on the headers. An optional 'status' query parameter
+    limits the queue to threads with that status (one of TICKET_STATUSES).
 
-    The latest tickets are ordered by priority, ensuring that urgent tickets are
-    addressed first, followed by high and then lower priority tickets. This ordering
-    is achieved using the SQL `CASE` statement within the order_by clause.
+    The number of threads with each status, shown next to the status filters, comes
+    from the admin counters, which are maintained whenever a message changes a
+    thread's status, so no count query runs over the tickets.
 
     Args:
         None
 
     Returns:
-        A rendered template ('communication_with_clients.html') that displays both
-        all queries and the latest tickets, facilitating effective communication
-        management with clients by the administration team.
+        A rendered template ('communication_with_clients.html') with one page of the
+        work queue ('latest_tickets'), the cursor of the next page ('next_cursor'),
+        the selected status and the per-status counts ('status_counts').
     """
-    all_queries = SupportTickets.query.all()
+    status = request.args.get('status', '')
+    if status and status not in TICKET_STATUSES:
+        abort(400)
+
+    try:
+        latest_tickets, next_cursor = ticket_queue_page(status=status or None, after=request.args.get('after'))
+    except ValueError:
+        abort(400)
+
+    counters = admin_counters()
+    status_counts = {ticket_status: counters[status_counter(ticket_status)] for ticket_status in TICKET_STATUSES}
+
+    return render_template('communication_with_clients.html', latest_tickets=latest_tickets, next_cursor=next_cursor,
+                           status=status, status_counts=status_counts, total_count=sum(status_counts.values()))
+    
     
-    # A subquery to find the latest date for each reference number
-    subquery = (db.session.query(SupportTickets.reference_number,
-                                 func.max(SupportTickets.created_at).label('latest_date'))
-                          .group_by(SupportTickets.reference_number)
-                          .subquery())
-
-    # External query to retrieve full records
-    latest_tickets_query = (db.session.query(SupportTickets)
-                            .join(subquery, and_(SupportTickets.reference_number == subquery.c.reference_number,
-                                                 SupportTickets.created_at == subquery.c.latest_date))
-                            .order_by(case((SupportTickets.priority == 'urgent', 1),
-                                           (SupportTickets.priority == 'high', 2),
-                                           else_=3))
-                            .all())
-
-    return render_template('communication_with_clients.html', all_queries = all_queries, latest_tickets=latest_tickets_query)
\ No newline at end of file
+    
+query_stats_bp = Blueprint('query_stats_bp', __name__)
+
+@query_stats_bp.route('/admin/perf')
+@login_required
+@admin_required
+def query_performance():
+    """
+    Displays the SQL statement statistics of the latest requests and scheduler jobs.
+
+    This route is accessible only to logged-in administrators. The figures come from the rolling in-memory table of
+    the query instrumentation (see routes/query_stats.py) and cover the requests and jobs of this process since it
+    started, up to QUERY_STATS_HISTORY entries. No database query is needed to show them.
+
+    Two tables are shown:
+    - per route or job: number of runs, average and maximum statement count and database time, and the statement
+      repeated most often in one run, which points to per-row query loops (N+1 queries),
+    - the latest requests and jobs, newest first, with the same figures for each run.
+
+    Args:
+        None
+
+    Returns:
+        A rendered template ('query_performance.html') with the aggregated rows ('routes'), the latest runs ('recent')
+        and the warning thresholds ('thresholds').
+    """
+    thresholds = {'statements': query_stats.max_statements, 'db_ms': query_stats.max_db_ms,
+                  'repeated': query_stats.repeat_threshold}
+    return render_template('query_performance.html', routes=query_stats.by_name(), recent=query_stats.recent()[:100],
+                           thresholds=thresholds)
@@ -1,31 +1,28 @@
-from flask import Blueprint, render_template, request, flash, url_for, redirect
+from flask import Blueprint, render_template, request, flash, url_for, redirect, abort, Response
 from flask_login import current_user, login_required
 from routes.transfer import admin_required
 from forms.forms import SendQueryForm
-from models.models import Users, Transaction, db, LockedUsers, SupportTickets
-import pandas as pd
-import matplotlib.pyplot as plt
+from models.models import Users, db, LockedUsers, SupportTickets, TicketHeaders
 from datetime import datetime
-from routes.my_routes_admin import plot_to_html_img
+from routes.my_routes_admin import chart_data_response
+from routes.admin_counters import increment_admin_counter
+from routes.tickets import add_ticket_message, delete_ticket_thread
+from routes.sequences import ticket_references
+from models.read_replica import read_only
+from routes.ledger_archive import ledger_archive
+from routes.ticket_events import (ticket_events, ticket_channel, ADMIN_QUEUE_CHANNEL, event_stream, message_event,
+                                  publish_ticket_message)
 
 
 def generate_unique_reference_number(username):
     """
     Generates a unique reference number for a support ticket based on the given username.
 
-    This function creates a unique reference number by appending the username to a
-    base number derived from the total count of support tickets in the database plus
-    one, ensuring sequential uniqueness. The base number is zero-padded to ensure a
-    fixed length for the numeric portion, enhancing readability and standardization
-    of reference numbers.
-
-    The uniqueness of the generated reference number is verified by querying the
-    SupportTickets database. If a duplicate is found (indicating the proposed
-    reference number already exists), the base number is incremented, and the process
-    repeats until a unique reference number is generated.
-
-    This approach ensures that each support ticket can be uniquely identified and
-    referenced, facilitating efficient tracking and management of support queries.
+    The reference number consists of a sequential number, zero-padded to six digits, followed by the username
+    (e.g. '000001username'). The number comes from the 'ticket_reference' sequence: each application process
+    reserves a block of numbers in a short transaction of its own and then hands them out from memory, so generating
+    a reference number usually needs no database query at all, and concurrent submissions never receive the same
+    number. The unique constraint on TicketHeaders.reference_number is the safety net.
 
     Args:
         username (str): The username of the user submitting the support ticket, which
@@ -36,20 +33,7 @@ def generate_unique_reference_number(username):
         str: A unique reference number for the support ticket, combining a sequential
              number and the user's username (e.g., '000001username').
     """
-    new_reference_number = SupportTickets.query.count() + 1
-
-    while True:
-        # Creating a potentially unique reference number
-        potential_ref_number = f'{new_reference_number:06}{username}'
-        
-        # Checking if a reference number already exists
-        existing_ticket = SupportTickets.query.filter_by(reference_number=potential_ref_number).first()
-        
-        if not existing_ticket:
-            # A unique reference number has been created
-            return potential_ref_number
-        else:
-            new_reference_number += 1 
+    return f'{ticket_references.next_value():06}{username}'
             
             
                 
@@ -114,8 +98,10 @@ def send_query():
                                   status = 'new',
                                   priority = current_priority)
         
-        db.session.add(new_query)
+        add_ticket_message(new_query, new_thread=True)
+        increment_admin_counter('tickets_' + current_priority)
         db.session.commit()
+        publish_ticket_message(new_query)
         flash('Message sent successfully!', 'success')
         return redirect(url_for('help_center'))
     else:
@@ -263,8 +249,9 @@ def send_message_for_query(query_ref):
                                 status = request.form['status'],
                                 priority = last_query.priority)
         
-    db.session.add(new_query)
+    add_ticket_message(new_query)
     db.session.commit()
+    publish_ticket_message(new_query)
     
     flash('Your response has been sent successfully', 'success')
     return redirect(url_for('process_query_bp.process_query', query_ref=last_query.reference_number))
@@ -314,8 +301,9 @@ def send_message_for_message(query_ref):
                                 status = last_query.status,
                                 priority = last_query.priority)
         
-    db.session.add(new_query)
+    add_ticket_message(new_query)
     db.session.commit()
+    publish_ticket_message(new_query)
     user_queries = SupportTickets.query.filter_by(reference_number=query_ref).all()
     flash('Your response has been sent successfully', 'success')
     return render_template('reading_my_messages.html', query_ref=last_query.reference_number, all_queries=user_queries, query=last_query)
@@ -381,13 +369,12 @@ def delete_query_confirmation(query_ref):
         queries following the deletion operation.
     """
     last_query = SupportTickets.query.filter_by(reference_number=query_ref).order_by(SupportTickets.created_at.desc()).first()
-    user_queries = SupportTickets.query.filter_by(reference_number=query_ref).all()
     
     # Checking if the user has permission to delete these records (this is important to avoid unauthorized people deleting records)
     if last_query.user_id == current_user.id:
-        # Deleting all records with a given reference number
-        for query in user_queries:
-            db.session.delete(query)
+        # Deleting all records with a given reference number, together with the thread's header
+        delete_ticket_thread(query_ref)
+        increment_admin_counter('tickets_' + last_query.priority, -1)
         db.session.commit()
 
         flash('Your query has been deleted successfully', 'success')
@@ -397,7 +384,7 @@ def delete_query_confirmation(query_ref):
     # Refreshes the list of records to be displayed
     user_queries = SupportTickets.query.filter_by(user_id=current_user.id).all()
 
-    return redirect(url_for('help_center', query_ref=last_query.reference_number, all_queries = user_queries))
+    return redirect(url_for('help_center', query_ref=query_ref, all_queries = user_queries))
     
     
     
@@ -408,6 +395,7 @@ show_statement_for_customer_bp = Blueprint('show_statement_for_customer_bp', __n
 @show_statement_for_customer_bp.route('/show_statement_for_customer/<username>', methods=['GET', 'POST'])
 @login_required
 @admin_required
+@read_only
 def show_statement_for_customer(username):
     """
     Displays a summary of transactions for a specific customer, including a pie chart visualization.
@@ -419,12 +407,9 @@ def show_statement_for_customer(username):
     The function performs several key steps:
     - Retrieves all locked users, although this data is not directly used in presenting the transaction summary.
     - Fetches the user based on the provided username and then all transactions associated with that user.
-    - Prepares the transaction data, specifically focusing on the transaction type and the amounts involved, both debit and credit.
-    - Summarizes the transaction data into a pandas DataFrame for easy manipulation and analysis.
-    - Creates a new column in the DataFrame to represent the total amount of each transaction by summing the debit and credit amounts.
-    - Groups the summarized data by transaction type and calculates the sum of amounts for each type.
-    - Generates a pie chart visualization of the transaction summary, showing the proportion of total transactions by type.
-    - Converts the pie chart into an HTML image for embedding within the web page.
+    - Passes the transactions to the template, together with a canvas for the pie chart of the total transaction
+      amount by type. The chart is drawn in the browser (static/charts.js) from the data returned by
+      customer_chart_data, so no image is generated while rendering this page.
 
     Args:
         username (str): The username of the customer whose transaction summary is to be displayed.
@@ -440,36 +425,38 @@ def show_statement_for_customer(username):
     
     role = user.role
     users = Users.query.filter_by(role=role).all()
-    user_transactions = Transaction.query.filter_by(user_id = user.id).all()  
+    user_transactions = ledger_archive.transactions(user_id = user.id)
+    
+    return render_template('admin_dashboard_cam.html',  all_locked_users = all_locked_users, all_transactions = user_transactions, user = user, users=users)
 
-    # Data preparation do DataFrame
-    transactions_data = [{
-        'transaction_type': txn.transaction_type,
-        'debit_amount': txn.debit_amount,
-        'credit_amount': txn.credit_amount
-    } for txn in user_transactions]
 
-    # Creating DataFrame
-    transactions_df = pd.DataFrame(transactions_data)
 
-    # Creating a new 'amount' column by summing 'debit_amount' and 'credit_amount'
-    transactions_df['amount'] = transactions_df['debit_amount'] + transactions_df['credit_amount']
+@show_statement_for_customer_bp.route('/show_statement_for_customer/<username>/chart_data', methods=['GET'])
+@login_required
+@admin_required
+@read_only
+def customer_chart_data(username):
+    """
+    Returns the total transaction amount by transaction type for a specific customer as JSON chart data.
 
-    # Keeping only 'transaction_type' and 'amount' columns
-    final_df = transactions_df[['transaction_type', 'amount']]
-    
-    # Grouping data by 'transaction_type' and summing 'amount'
-    grouped_data = final_df.groupby('transaction_type')['amount'].sum()
+    The amounts (debit plus credit) are summed per transaction type by the database, in exact integer minor units,
+    over the transaction table and the ledger archive; the totals are converted to floats for the JSON response.
+    The response is cacheable with ETags, see chart_data_response.
 
-    # Create a pie chart
-    plt.figure(figsize=(10, 7))
-    plt.pie(grouped_data, labels=grouped_data.index, autopct='%1.1f%%', startangle=140)
-    plt.title('Total transactions by type')
-    
-    # Convert chart to HTML img
-    plot_html_img = plot_to_html_img(plt)
-    
-    return render_template('admin_dashboard_cam.html',  all_locked_users = all_locked_users, all_transactions = user_transactions, user = user, users=users, plot_html_img = plot_html_img)
+    Args:
+        username (str): The username of the customer.
+
+    Returns:
+        A JSON response with the keys 'title', 'kind', 'labels' and 'values', or a 304 response if the client's copy
+        is current. Aborts with 404 if the user does not exist.
+    """
+    user = Users.query.filter_by(username=username).first_or_404()
+
+    # Grouping transactions by 'transaction_type' and summing the amounts, archived transactions included
+    grouped_data = ledger_archive.totals_by_type(user.id)
+
+    return chart_data_response('Total transactions by type', 'pie',
+                               [(transaction_type, float(total or 0)) for transaction_type, total in grouped_data])
 
 
 
@@ -498,4 +485,86 @@ def edit_customer_information(username):
     """
     user = Users.query.filter_by(username=username).first()
     
-    return render_template('edit_customer_information.html', user = user)
\ No newline at end of file
+    return render_template('edit_customer_information.html', user = user)
+
+
+
+
+
+ticket_events_bp = Blueprint('ticket_events_bp', __name__)
+
+def stream_response(subscription, replay=()):
+    """
+    Returns the streaming text/event-stream response of a subscription to the ticket events.
+
+    The database session is closed before streaming starts, so an open stream holds no database connection, and the
+    subscription is closed when the response ends, even if the browser disconnects before the first event.
+    """
+    db.session.close()
+    response = Response(event_stream(subscription, replay), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    response.call_on_close(subscription.close)
+    return response
+
+
+def last_event_id():
+    # Sent by the browser when it reconnects a stream; the first connection passes the last rendered message instead
+    value = request.headers.get('Last-Event-ID') or request.args.get('after')
+    return int(value) if value and value.isdigit() else None
+
+
+@ticket_events_bp.route('/ticket_events/<query_ref>')
+@login_required
+def ticket_events_stream(query_ref):
+    """
+    Streams the new messages of a support ticket thread to the browser as server-sent events.
+
+    The ticket pages ('reading_my_messages.html' for the user, 'processing_clients_query.html' for the admin) open
+    this stream with an EventSource instead of being reloaded to look for replies. Every message committed to the
+    thread afterwards is pushed as a 'message' event whose id is the message id, and appended to the page by
+    static/ticket_events.js. An idle stream only carries a heartbeat comment from time to time.
+
+    When the browser reconnects a dropped stream it sends the id of the last event it received (Last-Event-ID), and
+    the messages added since then are sent first, from a single query on the thread's messages.
+
+    Only the author of the ticket and the administrators may listen to a thread.
+
+    Args:
+        query_ref (str): The reference number of the ticket thread, passed in the URL.
+
+    Returns:
+        A streaming 'text/event-stream' response, 404 if the thread does not exist or 403 if the user may not read it.
+    """
+    header = TicketHeaders.query.filter_by(reference_number=query_ref).first()
+    if header is None:
+        abort(404)
+    if header.user_id != current_user.id and current_user.role != 'admin':
+        abort(403)
+
+    # Subscribed before the missed messages are read, so no message falls between the two
+    subscription = ticket_events.subscribe(ticket_channel(query_ref))
+    replay = []
+    after = last_event_id()
+    if after is not None:
+        missed = (SupportTickets.query.filter(SupportTickets.reference_number == query_ref, SupportTickets.id > after)
+                  .order_by(SupportTickets.id).all())
+        replay = [(message.id, 'message', message_event(message)) for message in missed]
+
+    return stream_response(subscription, replay)
+
+
+@ticket_events_bp.route('/ticket_queue_events')
+@login_required
+@admin_required
+def ticket_queue_events_stream():
+    """
+    Streams the new messages of all support ticket threads to the admin work queue page as server-sent events.
+
+    The communication center page ('communication_with_clients.html') listens to this stream and lists the threads
+    with new activity above the queue, with links to process them, so the admin does not have to reload the queue
+    to notice new tickets and replies.
+
+    Returns:
+        A streaming 'text/event-stream' response.
+    """
+    return stream_response(ticket_events.subscribe(ADMIN_QUEUE_CHANNEL))
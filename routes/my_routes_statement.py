@@ -1,6 +1,7 @@
 from flask import Blueprint, abort
 from flask_login import current_user, login_required
-from models.models import Transaction
+from models.read_replica import read_only
+from routes.ledger_archive import ledger_archive
 import csv
 from reportlab.lib.pagesizes import letter
 from flask import make_response, send_file
@@ -84,6 +85,7 @@ download_transactions_bp = Blueprint('download_transactions_bp', __name__)
 
 @download_transactions_bp.route('/download_transactions/<int:user_id>')
 @login_required
+@read_only
 def download_transactions(user_id):
     """
     Allows users to download a PDF of their transaction history.
@@ -106,8 +108,8 @@ def download_transactions(user_id):
     if current_user.id != user_id and not current_user.is_admin:
         abort(403)
 
-    # Retrieving user transactions from the database
-    transactions = Transaction.query.filter_by(user_id=user_id).all()
+    # Retrieving user transactions from the database, with the archived ones
+    transactions = ledger_archive.transactions(user_id=user_id)
 
     # PDF creation
     
@@ -157,6 +159,7 @@ download_transactions_csv_bp = Blueprint('download_transactions_csv_bp', __name_
 
 @download_transactions_csv_bp.route('/download_transactions_csv/<int:user_id>')
 @login_required
+@read_only
 def download_transactions_csv(user_id):
     """
     Enables users to download their transaction history as a CSV file.
@@ -183,7 +186,7 @@ def download_transactions_csv(user_id):
         abort(403)
         
     # Download transaction data (you can add a filter for the current user's transactions here)
-    transactions = Transaction.query.filter_by(user_id=current_user.id).all()
+    transactions = ledger_archive.transactions(user_id=current_user.id)
 
     # Creating a filename
     filename = f"transactions_{current_user.username}.csv"
@@ -0,0 +1,281 @@
+import re
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime
+from functools import wraps
+from flask import current_app, request
+from sqlalchemy import event
+from routes.transfer import logger
+
+
+# Literals replaced by '?' in statement fingerprints, so statements differing only in their values count as the same
+STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+NUMBER_LITERAL = re.compile(r'\b\d+(?:\.\d+)?\b')
+IN_LIST = re.compile(r'\bIN \((?:\?, )+\?\)', re.IGNORECASE)
+WHITESPACE = re.compile(r'\s+')
+
+
+def fingerprint(statement):
+    """
+    Returns the normalized form of an SQL statement: literals replaced by '?', IN lists collapsed and whitespace
+    squeezed. Statements run in a per-row loop (an N+1 query pattern) all have the same fingerprint.
+    """
+    statement = STRING_LITERAL.sub('?', statement)
+    statement = NUMBER_LITERAL.sub('?', statement)
+    statement = WHITESPACE.sub(' ', statement).strip()
+    return IN_LIST.sub('IN (...)', statement)
+
+
+
+class QueryRecorder:
+    """
+    SQL statements executed by one request or scheduler job: their number, total database time and the number of
+    executions of each statement fingerprint.
+    """
+
+    def __init__(self, kind, name):
+        self.kind = kind
+        self.name = name
+        self.started = time.perf_counter()
+        self.statements = 0
+        self.db_time = 0.0
+        self.fingerprints = Counter()
+        # HTTP status of the response of a request
+        self.status = None
+
+    def add(self, statement, elapsed):
+        self.statements += 1
+        self.db_time += elapsed
+        self.fingerprints[fingerprint(statement)] += 1
+
+    def most_repeated(self):
+        """
+        Returns (count, fingerprint) of the statement executed most often, or (0, None) if there was none.
+        """
+        if not self.fingerprints:
+            return 0, None
+        statement, count = self.fingerprints.most_common(1)[0]
+        return count, statement
+
+    def summary(self):
+        repeated, statement = self.most_repeated()
+        return {'kind': self.kind, 'name': self.name, 'status': self.status, 'finished_at': datetime.now(),
+                'duration_ms': round((time.perf_counter() - self.started) * 1000, 1),
+                'statements': self.statements, 'db_ms': round(self.db_time * 1000, 1),
+                'distinct': len(self.fingerprints), 'repeated': repeated, 'repeated_statement': statement}
+
+
+
+class QueryStats:
+    """
+    Per-request and per-job SQL instrumentation.
+
+    SQLAlchemy cursor execution events of the application's engines (attach()) time every statement and add it to the
+    recorder of the current thread: one is started for each request (before_request) and for each scheduler job
+    wrapped with job(). When the request or job ends:
+    - its summary (statement count, database time, distinct fingerprints and the most repeated statement) is added to
+      a rolling in-memory table of the latest QUERY_STATS_HISTORY entries, shown on the admin '/admin/perf' page,
+    - a warning is logged if it ran more than QUERY_STATS_MAX_STATEMENTS statements, spent more than
+      QUERY_STATS_MAX_DB_MS milliseconds in the database, or ran the same statement QUERY_STATS_REPEAT_THRESHOLD times
+      or more, which is the signature of a per-row query loop (N+1 queries).
+
+    In debug mode (or with QUERY_STATS_HEADERS set) responses also carry the request's figures in the
+    'X-DB-Statements', 'X-DB-Time-Ms' and 'X-DB-Repeated' headers and a 'Server-Timing' entry.
+
+    Configuration (read in init_app):
+    - QUERY_STATS_ENABLED (bool): Whether statements are recorded. Defaults to True.
+    - QUERY_STATS_HISTORY (int): Number of requests and jobs kept in the rolling table. Defaults to 500.
+    - QUERY_STATS_MAX_STATEMENTS (int): Statements per request or job above which a warning is logged. Defaults to 50.
+    - QUERY_STATS_MAX_DB_MS (float): Database time in milliseconds above which a warning is logged. Defaults to 500.
+    - QUERY_STATS_REPEAT_THRESHOLD (int): Executions of one statement from which a warning is logged. Defaults to 10.
+    - QUERY_STATS_HEADERS (bool): Whether responses carry the headers. Defaults to None, which follows app.debug.
+    """
+
+    def __init__(self, history=500):
+        self.enabled = True
+        self.max_statements = 50
+        self.max_db_ms = 500
+        self.repeat_threshold = 10
+        self.headers = None
+        self.entries = deque(maxlen=history)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._engines = set()
+
+    def init_app(self, app):
+        self.enabled = app.config.setdefault('QUERY_STATS_ENABLED', True)
+        history = app.config.setdefault('QUERY_STATS_HISTORY', self.entries.maxlen)
+        self.max_statements = app.config.setdefault('QUERY_STATS_MAX_STATEMENTS', self.max_statements)
+        self.max_db_ms = app.config.setdefault('QUERY_STATS_MAX_DB_MS', self.max_db_ms)
+        self.repeat_threshold = app.config.setdefault('QUERY_STATS_REPEAT_THRESHOLD', self.repeat_threshold)
+        self.headers = app.config.setdefault('QUERY_STATS_HEADERS', self.headers)
+        self.entries = deque(self.entries, maxlen=history)
+        app.extensions['query_stats'] = self
+
+        if self.enabled:
+            app.before_request(self._start_request)
+            app.after_request(self._add_headers)
+            app.teardown_request(self._finish_request)
+
+    def attach(self, engine):
+        """
+        Times the statements executed by `engine`. Attaching an engine twice has no effect.
+        """
+        if engine in self._engines:
+            return
+        self._engines.add(engine)
+        event.listen(engine, 'before_cursor_execute', self._before_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_execute)
+        event.listen(engine, 'handle_error', self._execute_failed)
+
+    def _before_execute(self, connection, cursor, statement, parameters, context, executemany):
+        connection.info.setdefault('query_stats_started', []).append(time.perf_counter())
+        if context is not None:
+            context.query_stats_pending = True
+
+    def _after_execute(self, connection, cursor, statement, parameters, context, executemany):
+        started = connection.info['query_stats_started'].pop()
+        if context is not None:
+            context.query_stats_pending = False
+        recorder = getattr(self._local, 'recorder', None)
+        if recorder is not None:
+            recorder.add(statement, time.perf_counter() - started)
+
+    def _execute_failed(self, exception_context):
+        # A statement that raised gets no after_cursor_execute: drop its start time from the (pooled) connection, and
+        # still count it: failed statements take database time too
+        context = exception_context.execution_context
+        connection = exception_context.connection
+        if context is None or connection is None or not getattr(context, 'query_stats_pending', False):
+            return
+        context.query_stats_pending = False
+        started = connection.info['query_stats_started'].pop()
+        recorder = getattr(self._local, 'recorder', None)
+        if recorder is not None:
+            recorder.add(exception_context.statement or '', time.perf_counter() - started)
+
+    def start(self, kind, name):
+        """
+        Starts recording the statements of the current thread under `name`, and returns the recorder.
+        """
+        recorder = QueryRecorder(kind, name)
+        self._local.recorder = recorder
+        return recorder
+
+    def finish(self, error=None):
+        """
+        Stops recording the current thread's statements, adds the summary to the rolling table and logs a warning if
+        a threshold was exceeded. A request that ended with an unhandled `error` is recorded with status 500, a job with
+        status 'failed'.
+
+        Returns:
+        - dict: The summary, or None if nothing was being recorded.
+        """
+        recorder = getattr(self._local, 'recorder', None)
+        if recorder is None:
+            return None
+        self._local.recorder = None
+        if error is not None:
+            recorder.status = 500 if recorder.kind == 'request' else 'failed'
+
+        summary = recorder.summary()
+        with self._lock:
+            self.entries.append(summary)
+
+        problems = []
+        if summary['statements'] > self.max_statements:
+            problems.append(f"{summary['statements']} statements")
+        if summary['db_ms'] > self.max_db_ms:
+            problems.append(f"{summary['db_ms']} ms in the database")
+        if summary['repeated'] >= self.repeat_threshold:
+            problems.append(f"the same statement {summary['repeated']} times: {summary['repeated_statement'][:200]}")
+        if problems:
+            logger.warning(f"Query budget exceeded by {summary['kind']} '{summary['name']}': {'; '.join(problems)}",
+                           extra={'event_type': 'query_budget'})
+        return summary
+
+    def current(self):
+        """
+        Returns the recorder of the current thread, or None.
+        """
+        return getattr(self._local, 'recorder', None)
+
+    def job(self, func):
+        """
+        Decorator recording the statements of a scheduler job under the name of the job function.
+        """
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not self.enabled:
+                return func(*args, **kwargs)
+            self.start('job', func.__name__)
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                self.finish(e)
+                raise
+            self.finish()
+            return result
+
+        return wrapper
+
+    def _start_request(self):
+        if request.endpoint != 'static':
+            self.start('request', f'{request.method} {request.url_rule.rule if request.url_rule else request.path}')
+
+    def _add_headers(self, response):
+        recorder = self.current()
+        show = self.headers if self.headers is not None else current_app.debug
+        if recorder is not None and show:
+            repeated, _ = recorder.most_repeated()
+            db_ms = round(recorder.db_time * 1000, 1)
+            response.headers['X-DB-Statements'] = str(recorder.statements)
+            response.headers['X-DB-Time-Ms'] = str(db_ms)
+            response.headers['X-DB-Repeated'] = str(repeated)
+            response.headers.add('Server-Timing', f'db;desc="{recorder.statements} statements";dur={db_ms}')
+        if recorder is not None:
+            recorder.status = response.status_code
+        return response
+
+    def _finish_request(self, error=None):
+        self.finish(error)
+
+    def recent(self):
+        """
+        Returns the summaries of the rolling table, newest first.
+        """
+        with self._lock:
+            return list(reversed(self.entries))
+
+    def by_name(self):
+        """
+        Returns the rolling table aggregated per request route or job, the one with the most total database time first.
+
+        Returns:
+        - list: dicts with 'kind', 'name', 'count', 'avg_statements', 'max_statements', 'avg_db_ms', 'max_db_ms',
+          'max_repeated' and 'repeated_statement' (of the run with the most repeated statement).
+        """
+        groups = {}
+        for entry in self.recent():
+            group = groups.setdefault((entry['kind'], entry['name']), {
+                'kind': entry['kind'], 'name': entry['name'], 'count': 0, 'statements': 0, 'max_statements': 0,
+                'db_ms': 0.0, 'max_db_ms': 0.0, 'max_repeated': 0, 'repeated_statement': None})
+            group['count'] += 1
+            group['statements'] += entry['statements']
+            group['max_statements'] = max(group['max_statements'], entry['statements'])
+            group['db_ms'] += entry['db_ms']
+            group['max_db_ms'] = max(group['max_db_ms'], entry['db_ms'])
+            if entry['repeated'] > group['max_repeated']:
+                group['max_repeated'] = entry['repeated']
+                group['repeated_statement'] = entry['repeated_statement']
+
+        rows = []
+        for group in groups.values():
+            group['avg_statements'] = round(group.pop('statements') / group['count'], 1)
+            group['avg_db_ms'] = round(group.pop('db_ms') / group['count'], 1)
+            rows.append(group)
+        return sorted(rows, key=lambda row: row['avg_db_ms'] * row['count'], reverse=True)
+
+
+query_stats = QueryStats()
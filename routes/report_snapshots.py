@@ -0,0 +1,203 @@
+import json
+import math
+from datetime import datetime
+from sqlalchemy import func, literal
+from models.models import Users, Transaction, db, SupportTickets, LockedUsers, Loans, ReportSnapshots
+from routes.log_stats import log_stats
+from models.read_replica import primary_reads
+from models.money import MINOR_UNITS, Money, MoneyType
+from routes.ledger_archive import ledger_archive, BROUGHT_FORWARD
+
+
+# Transactions above this amount are left out of the average transaction values as outliers
+AVERAGE_VALUE_LIMIT = Money.of(10000)
+
+
+def merge_type_counts(counts, archived):
+    """
+    Adds the archived transaction counts (transaction type -> (count, total)) to (transaction type, count) rows.
+    """
+    merged = dict(counts)
+    for transaction_type, (count, total) in archived.items():
+        merged[transaction_type] = merged.get(transaction_type, 0) + count
+    return sorted(merged.items())
+
+
+def merge_type_totals(totals, archived):
+    """
+    Adds the archived transaction totals (transaction type -> (count, total)) to (transaction type, total, count) rows.
+    """
+    merged = {transaction_type: (total, count) for transaction_type, total, count in totals}
+    for transaction_type, (count, total) in archived.items():
+        previous_total, previous_count = merged.get(transaction_type, (Money(0), 0))
+        merged[transaction_type] = (previous_total + total, previous_count + count)
+    return [(transaction_type, total, count) for transaction_type, (total, count) in sorted(merged.items())]
+
+
+def format_response_time(seconds):
+    """
+    Formats a duration in seconds as '<hours> hours <minutes> minutes', the way response times are shown in reports.
+    """
+    hours, remainder = divmod(seconds, 3600)
+    minutes, _ = divmod(remainder, 60)
+
+    return "{} hours {} minutes".format(int(hours), int(minutes))
+
+
+
+def ticket_response_times():
+    """
+    Calculates the first-response time of every support ticket thread and summarises them.
+
+    The first-response time of a thread is the time elapsed between its first and second message (the user's query and
+    the first reply). Instead of looking up the first two messages of every reference number one by one, a single query
+    numbers the messages of each thread with the ROW_NUMBER() window function and keeps the first two, so the database
+    is queried once no matter how many tickets exist. Threads without a reply are skipped.
+
+    Percentiles are calculated with the nearest-rank method.
+
+    Returns:
+    - dict: Keys 'count' (number of answered tickets), 'average', 'p50', 'p90' and 'p99'. The time values are formatted
+      as '<hours> hours <minutes> minutes', or 'Brak danych' if no ticket has been answered yet.
+    """
+    position = func.row_number().over(partition_by=SupportTickets.reference_number,
+                                      order_by=(SupportTickets.created_at, SupportTickets.id)).label('position')
+    ranked = db.session.query(SupportTickets.reference_number, SupportTickets.created_at, position).subquery()
+
+    first_two_messages = (db.session.query(func.min(ranked.c.created_at), func.max(ranked.c.created_at))
+                          .filter(ranked.c.position <= 2)
+                          .group_by(ranked.c.reference_number)
+                          .having(func.count() == 2)
+                          .all())
+
+    response_times = sorted((second - first).total_seconds() for first, second in first_two_messages)
+
+    if not response_times:
+        return {'count': 0, 'average': 'Brak danych', 'p50': 'Brak danych', 'p90': 'Brak danych', 'p99': 'Brak danych'}
+
+    def percentile(pct):
+        rank = max(1, math.ceil(pct / 100 * len(response_times)))
+        return format_response_time(response_times[rank - 1])
+
+    return {'count': len(response_times),
+            'average': format_response_time(sum(response_times) / len(response_times)),
+            'p50': percentile(50),
+            'p90': percentile(90),
+            'p99': percentile(99)}
+
+
+
+def compute_report_aggregates():
+    """
+    Computes every aggregate shown on the admin reports and statistics page and on the admin dashboard.
+
+    This is the expensive part of the reports: group-bys over the Users, Transaction, SupportTickets and Loans tables.
+    The log level counts come from the incrementally maintained log statistics, so only the lines appended to
+    'app.log' since the previous report are parsed. All results are returned as plain lists and dictionaries so they can be stored as
+    JSON in a report snapshot.
+
+    Returns:
+    - dict: The aggregates, with the keys:
+      'user_roles', 'user_countries', 'ticket_priorities', 'transaction_types', 'loan_types' - lists of [label, count],
+      'average_transaction_values' - list of [transaction type, average value],
+      'response_times' - the summary returned by ticket_response_times(),
+      'priority_counts' - dict of the number of tickets per priority ('normal', 'high', 'urgent'),
+      'log_counts' - dict of the number of log records per level,
+      'users_count', 'locked_users_count' - int.
+    """
+    # Data about user roles and nationalities
+    roles_count = Users.query.with_entities(Users.role, func.count(Users.role)).group_by(Users.role).all()
+    countries_count = Users.query.with_entities(Users.country, func.count(Users.country)).group_by(Users.country).all()
+
+    # Subquery to extract unique reference numbers with their priorities
+    # Podzapytanie do wyodrębnienia unikalnych numerów referencyjnych z ich priorytetami
+    subquery = (db.session.query(SupportTickets.reference_number, SupportTickets.priority)
+                .distinct(SupportTickets.reference_number)
+                .subquery())
+
+    # Master Query - Priority grouping and counting based on unique reference numbers
+    # Zapytanie główne - grupowanie i zliczanie priorytetów na podstawie unikalnych numerów referencyjnych
+    tickets_count = (db.session.query(subquery.c.priority, func.count(subquery.c.priority))
+                    .group_by(subquery.c.priority)
+                    .all())
+
+    # Data about transaction types and the average transaction value for each type, over the transaction table and
+    # the ledger archive (the brought-forward rows left by the archive are balances, not transactions)
+    transaction_types_count = Transaction.query.with_entities(Transaction.transaction_type, func.count(Transaction.transaction_type)).filter(Transaction.transaction_type != BROUGHT_FORWARD).group_by(Transaction.transaction_type).all()
+    # The amounts are integer minor units: the database sums them exactly and only the final division is rounded
+    transaction_totals = (db.session.query(Transaction.transaction_type, func.sum(Transaction.debit_amount + Transaction.credit_amount), func.count())
+                    .filter((Transaction.debit_amount + Transaction.credit_amount) <= literal(AVERAGE_VALUE_LIMIT, MoneyType()), Transaction.transaction_type != BROUGHT_FORWARD).group_by(Transaction.transaction_type).all())
+    transaction_types_count = merge_type_counts(transaction_types_count, ledger_archive.archived_type_totals())
+    transaction_totals = merge_type_totals(transaction_totals, ledger_archive.archived_type_totals(AVERAGE_VALUE_LIMIT))
+    avg_transactions = [(transaction_type, round(total.minor_units / count / MINOR_UNITS, 2))
+                        for transaction_type, total, count in transaction_totals]
+
+    # Group messages by priority and count them
+    priority_counts = {'normal': 0, 'high': 0, 'urgent': 0}
+    for priority, count in (SupportTickets.query
+                            .with_entities(SupportTickets.priority, func.count(SupportTickets.reference_number.distinct()))
+                            .group_by(SupportTickets.priority)
+                            .all()):
+        if priority in priority_counts:
+            priority_counts[priority] = count
+
+    # Data about loan types
+    loan_types_count = Loans.query.with_entities(Loans.product_id, func.count(Loans.product_id)).group_by(Loans.product_id).all()
+
+    return {'user_roles': [list(row) for row in roles_count],
+            'user_countries': [list(row) for row in countries_count],
+            'ticket_priorities': [list(row) for row in tickets_count],
+            'transaction_types': [list(row) for row in transaction_types_count],
+            'average_transaction_values': [list(row) for row in avg_transactions],
+            'response_times': ticket_response_times(),
+            'priority_counts': priority_counts,
+            'log_counts': log_stats.level_counts(),
+            'loan_types': [list(row) for row in loan_types_count],
+            'users_count': Users.query.count(),
+            'locked_users_count': LockedUsers.query.count()}
+
+
+
+def refresh_report_snapshot(keep=24):
+    """
+    Computes all report aggregates and stores them as a new report snapshot.
+
+    Older snapshots are pruned so that only the `keep` most recent ones remain. The aggregates are always computed from
+    the primary database, even when called from a read-only view.
+
+    Parameters:
+    - keep (int): Number of snapshots to retain.
+
+    Returns:
+    - ReportSnapshots: The newly created snapshot.
+    """
+    with primary_reads():
+        aggregates = compute_report_aggregates()
+    snapshot = ReportSnapshots(generated_at=datetime.utcnow(), data=json.dumps(aggregates))
+    db.session.add(snapshot)
+    db.session.flush()
+
+    ReportSnapshots.query.filter(ReportSnapshots.id <= snapshot.id - keep).delete()
+    db.session.commit()
+
+    return snapshot
+
+
+
+def latest_report_snapshot():
+    """
+    Returns the most recent report snapshot, computing the first one if none exists yet.
+
+    Reading a snapshot is a single primary-key-ordered lookup, so the admin views that use it no longer depend on the
+    size of the underlying tables or the log file.
+
+    Returns:
+    - tuple: (generated_at, aggregates) - the UTC generation timestamp and the dictionary returned by
+      compute_report_aggregates().
+    """
+    snapshot = ReportSnapshots.query.order_by(ReportSnapshots.id.desc()).first()
+
+    if snapshot is None:
+        snapshot = refresh_report_snapshot()
+
+    return snapshot.generated_at, json.loads(snapshot.data)
@@ -0,0 +1,92 @@
+import os
+import re
+import threading
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from models.models import db, Sequences, SupportTickets
+
+
+
+class SequenceAllocator:
+    """
+    Hands out increasing numbers from a named sequence stored in the Sequences table.
+
+    Numbers are reserved in blocks: when the process has used up its block, it advances the sequence row by
+    `block_size` in a separate, short transaction on the engine (independent of the request's session), and then
+    hands the numbers of the new block out from memory without touching the database. The UPDATE of the row
+    serialises concurrent reservations, so two processes never get the same block. Numbers of a block that is not
+    used up (e.g. when the process stops) are skipped, so the sequence can have gaps but never duplicates.
+
+    A block is never shared between a parent process and a forked worker: after a fork a new block is reserved.
+
+    Configuration (read in init_app):
+    - <NAME>_BLOCK_SIZE (int): Numbers reserved per block, e.g. TICKET_REFERENCE_BLOCK_SIZE. Defaults to 20.
+    """
+
+    def __init__(self, name, block_size=20, initial_value=None):
+        self.name = name
+        self.block_size = block_size
+        self.initial_value = initial_value
+        self._next = 0
+        self._limit = 0
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.block_size = app.config.setdefault(f'{self.name.upper()}_BLOCK_SIZE', self.block_size)
+
+    def next_value(self):
+        """
+        Returns the next number of the sequence.
+
+        Returns:
+        - int: A number never returned before by any process.
+        """
+        with self._lock:
+            if self._pid != os.getpid() or self._next >= self._limit:
+                self._next, self._limit = self._reserve_block()
+                self._pid = os.getpid()
+            value = self._next
+            self._next += 1
+
+        return value
+
+    def _reserve_block(self, retry=True):
+        table = Sequences.__table__
+        try:
+            with db.engine.begin() as connection:
+                result = connection.execute(table.update()
+                                            .where(table.c.name == self.name)
+                                            .values(next_value=table.c.next_value + self.block_size))
+                if result.rowcount == 0:
+                    # First use of the sequence: it starts after the numbers already in use
+                    start = self.initial_value(connection) if self.initial_value else 1
+                    connection.execute(table.insert().values(name=self.name, next_value=start + self.block_size))
+                end = connection.execute(select(table.c.next_value).where(table.c.name == self.name)).scalar()
+        except IntegrityError:
+            # Another process created the row at the same moment; reserve the block from it instead
+            if not retry:
+                raise
+            return self._reserve_block(retry=False)
+
+        return end - self.block_size, end
+
+
+
+def first_free_ticket_number(connection):
+    """
+    Returns the number following the highest number used in the existing ticket reference numbers
+    ('000042username' -> 43), so the sequence continues where the old numbering ended.
+    """
+    highest = 0
+    references = connection.execute(select(SupportTickets.reference_number).distinct()).scalars()
+    for reference in references:
+        match = re.match(r'\d+', reference)
+        if match:
+            highest = max(highest, int(match.group()))
+
+    return highest + 1
+
+
+# Numbers of the support ticket reference numbers
+ticket_references = SequenceAllocator('ticket_reference', initial_value=first_free_ticket_number)
@@ -0,0 +1,296 @@
+import os
+import secrets
+import sqlite3
+import threading
+import time
+import zlib
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from itsdangerous import BadSignature, Signer
+from werkzeug.datastructures import CallbackDict
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    sid TEXT PRIMARY KEY,
+    data BLOB NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_sessions_expires_at ON sessions (expires_at);
+"""
+
+
+
+class CompactSessionSerializer:
+    """
+    Serializes session data for the server-side store: Flask's tagged JSON (so flash message tuples, Markup, bytes
+    and datetimes survive the round trip), written without whitespace and zlib-compressed when that makes it smaller.
+    The first byte tells which encoding was used.
+    """
+
+    def __init__(self, compress_threshold=256):
+        self.compress_threshold = compress_threshold
+        self._json = TaggedJSONSerializer()
+
+    def dumps(self, data):
+        encoded = self._json.dumps(data).encode('utf-8')
+        if len(encoded) >= self.compress_threshold:
+            compressed = zlib.compress(encoded, 6)
+            if len(compressed) < len(encoded):
+                return b'z' + compressed
+        return b'j' + encoded
+
+    def loads(self, value):
+        value = bytes(value)
+        encoded = zlib.decompress(value[1:]) if value[:1] == b'z' else value[1:]
+        return self._json.loads(encoded.decode('utf-8'))
+
+
+
+class MemorySessionStore:
+    """
+    Session store in the memory of the process, with TTL eviction. For a single-process deployment or development.
+    """
+
+    def __init__(self):
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def load(self, sid, now):
+        with self._lock:
+            entry = self._sessions.get(sid)
+            if entry is None:
+                return None
+            if entry[1] <= now:
+                del self._sessions[sid]
+                return None
+            return entry
+
+    def save(self, sid, data, expires_at):
+        with self._lock:
+            self._sessions[sid] = (data, expires_at)
+
+    def touch(self, sid, expires_at):
+        with self._lock:
+            entry = self._sessions.get(sid)
+            if entry is not None:
+                self._sessions[sid] = (entry[0], expires_at)
+
+    def delete(self, sid):
+        with self._lock:
+            self._sessions.pop(sid, None)
+
+    def purge_expired(self, now):
+        with self._lock:
+            expired = [sid for sid, (_, expires_at) in self._sessions.items() if expires_at <= now]
+            for sid in expired:
+                del self._sessions[sid]
+        return len(expired)
+
+
+
+class SQLiteSessionStore:
+    """
+    Session store in a separate SQLite database, shared by all worker processes of the application.
+    """
+
+    def __init__(self, database):
+        self.database = database
+        os.makedirs(os.path.dirname(os.path.abspath(database)), exist_ok=True)
+        connection = self._connect()
+        try:
+            connection.executescript(SCHEMA)
+        finally:
+            connection.close()
+
+    def _connect(self):
+        connection = sqlite3.connect(self.database, timeout=10)
+        # WAL lets requests read sessions while another worker writes one
+        connection.execute('PRAGMA journal_mode=WAL')
+        return connection
+
+    def _execute(self, statement, params):
+        connection = self._connect()
+        try:
+            with connection:
+                return connection.execute(statement, params).rowcount
+        finally:
+            connection.close()
+
+    def load(self, sid, now):
+        connection = self._connect()
+        try:
+            return connection.execute('SELECT data, expires_at FROM sessions WHERE sid = ? AND expires_at > ?',
+                                      (sid, now)).fetchone()
+        finally:
+            connection.close()
+
+    def save(self, sid, data, expires_at):
+        self._execute('INSERT OR REPLACE INTO sessions (sid, data, expires_at) VALUES (?, ?, ?)',
+                      (sid, data, expires_at))
+
+    def touch(self, sid, expires_at):
+        self._execute('UPDATE sessions SET expires_at = ? WHERE sid = ?', (expires_at, sid))
+
+    def delete(self, sid):
+        self._execute('DELETE FROM sessions WHERE sid = ?', (sid,))
+
+    def purge_expired(self, now):
+        return self._execute('DELETE FROM sessions WHERE expires_at <= ?', (now,))
+
+
+
+class ServerSideSession(CallbackDict, SessionMixin):
+    """
+    Session whose data is kept in a server-side store; the cookie only carries its signed id.
+
+    regenerate() gives the session a new id when it is saved (e.g. at login, against session fixation).
+    """
+
+    def __init__(self, initial=None, sid=None, expires_at=None):
+        def on_update(self):
+            self.modified = True
+            self.accessed = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.expires_at = expires_at
+        self.new = sid is None
+        self.modified = False
+        self.accessed = False
+        self.rotate = False
+
+    def __getitem__(self, key):
+        self.accessed = True
+        return super().__getitem__(key)
+
+    def get(self, key, default=None):
+        self.accessed = True
+        return super().get(key, default)
+
+    def setdefault(self, key, default=None):
+        self.accessed = True
+        return super().setdefault(key, default)
+
+    def regenerate(self):
+        self.rotate = True
+        self.modified = True
+
+
+
+class ServerSideSessionInterface(SessionInterface):
+    """
+    Flask session interface keeping the session data on the server.
+
+    With Flask's default signed-cookie sessions, the whole session (Flask-Login's state, the CSRF token, flash
+    messages) travels in the cookie of every request, and the cookie is sent again with every response whenever the
+    session is permanent. Here the cookie only holds a signed random session id and the data is kept in a store: a
+    table in a separate SQLite database (shared by the worker processes) or the memory of the process.
+
+    Writes are skipped for unchanged sessions: the data is only stored when the session was modified, and the expiry
+    of an unchanged session (with its cookie) is only renewed when SESSION_REFRESH_AFTER seconds have passed since
+    the last renewal, instead of on every request. Expired sessions are removed by a scheduler job (see
+    purge_expired()).
+
+    Configuration (read in init_app):
+    - SESSION_BACKEND (str): 'sqlite', 'memory' or 'cookie' (Flask's default signed cookies). Defaults to 'cookie':
+      the server-side store is opt-in, so a deployment only depends on the sessions database once it chooses it.
+    - SESSION_DATABASE (str): SQLite file of the 'sqlite' backend. Defaults to 'sessions.db' in the instance folder.
+    - SESSION_REFRESH_AFTER (int): Seconds after which an unchanged session's expiry is renewed. Defaults to 300.
+    """
+
+    def __init__(self):
+        self.store = None
+        self.refresh_after = 300
+        self.serializer = CompactSessionSerializer()
+
+    def init_app(self, app):
+        backend = app.config.setdefault('SESSION_BACKEND', 'cookie')
+        database = app.config.setdefault('SESSION_DATABASE', os.path.join(app.instance_path, 'sessions.db'))
+        self.refresh_after = app.config.setdefault('SESSION_REFRESH_AFTER', self.refresh_after)
+        app.extensions['server_sessions'] = self
+
+        if backend == 'cookie':
+            return
+        if backend == 'sqlite':
+            self.store = SQLiteSessionStore(database)
+        elif backend == 'memory':
+            self.store = MemorySessionStore()
+        else:
+            raise ValueError(f'Unknown SESSION_BACKEND: {backend!r}')
+        app.session_interface = self
+
+    @staticmethod
+    def _signer(app):
+        return Signer(app.secret_key, salt='server-side-session', key_derivation='hmac')
+
+    def open_session(self, app, request):
+        cookie = request.cookies.get(self.get_cookie_name(app))
+        if not cookie or not app.secret_key:
+            return ServerSideSession()
+        try:
+            sid = self._signer(app).unsign(cookie).decode('ascii')
+        except BadSignature:
+            return ServerSideSession()
+
+        entry = self.store.load(sid, time.time())
+        if entry is None:
+            return ServerSideSession()
+        try:
+            data = self.serializer.loads(entry[0])
+        except (ValueError, zlib.error):
+            # A corrupt entry is treated as no session instead of failing every request that sends its cookie
+            return ServerSideSession()
+        return ServerSideSession(data, sid, entry[1])
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if session.accessed:
+            response.vary.add('Cookie')
+
+        if not session:
+            # An emptied session (e.g. after logout) is deleted together with its cookie
+            if session.sid is not None and session.modified:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path, secure=self.get_cookie_secure(app),
+                                       httponly=self.get_cookie_httponly(app), samesite=self.get_cookie_samesite(app))
+            return
+
+        now = time.time()
+        lifetime = app.permanent_session_lifetime.total_seconds()
+        expires_at = now + lifetime
+
+        if session.rotate and session.sid is not None:
+            self.store.delete(session.sid)
+            session.sid = None
+        new_sid = session.sid is None
+        if new_sid:
+            session.sid = secrets.token_urlsafe(32)
+
+        if session.modified or new_sid:
+            self.store.save(session.sid, self.serializer.dumps(dict(session)), expires_at)
+        elif session.expires_at is None or session.expires_at - now < lifetime - self.refresh_after:
+            self.store.touch(session.sid, expires_at)
+        else:
+            # Unchanged and recently renewed: no write and no cookie
+            return
+
+        if new_sid or session.permanent:
+            response.set_cookie(name, self._signer(app).sign(session.sid).decode('ascii'),
+                                expires=self.get_expiration_time(app, session), httponly=self.get_cookie_httponly(app),
+                                domain=domain, path=path, secure=self.get_cookie_secure(app),
+                                samesite=self.get_cookie_samesite(app))
+
+    def purge_expired(self):
+        """
+        Removes the expired sessions from the store. Run periodically by the scheduler.
+        """
+        if self.store is not None:
+            return self.store.purge_expired(time.time())
+        return 0
+
+
+server_sessions = ServerSideSessionInterface()
@@ -0,0 +1,82 @@
+from sqlalchemy import event
+
+
+# Applied to every new connection of the application database
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',          # Readers and the writer no longer block each other
+    'synchronous': 'NORMAL',        # Safe with WAL: a power loss may lose the last commits, never corrupt the file
+    'busy_timeout': 5000,           # Milliseconds a writer waits for the write lock instead of failing at once
+    'mmap_size': 256 * 1024 * 1024, # Reads served from the memory-mapped file instead of read() calls
+    'cache_size': -32000,           # Page cache per connection, in KiB when negative (about 32 MB)
+    'temp_store': 'MEMORY',         # Temporary tables and indexes of sorts and GROUP BYs kept in memory
+}
+
+# Connection pool of the application engine; requests, the ticket event streams and the scheduler jobs share it
+DEFAULT_ENGINE_OPTIONS = {
+    'pool_size': 10,
+    'max_overflow': 20,
+    'pool_timeout': 10,
+}
+
+
+
+class SQLiteProfile:
+    """
+    Performance profile of the application's SQLite database: pragmas set on every connection and the options of
+    the connection pool.
+
+    SQLite's defaults are a rollback journal, in which a writer (e.g. the scheduler's payment jobs) locks readers out
+    of the whole database and readers delay the writer, a full fsync on every commit, a 2 MB page cache, and no
+    memory mapping. The pragmas below (DEFAULT_PRAGMAS) switch to write-ahead logging, so reads continue during a
+    write, sync at checkpoints instead of every commit, wait for a busy database instead of raising 'database is
+    locked', and give each connection a larger cache. Most of these pragmas only last as long as the connection, so
+    they are set in a 'connect' event listener of the engine, once for each pooled connection.
+
+    Configuration (read in init_app, before db.init_app creates the engine):
+    - SQLITE_PRAGMAS (dict): Pragmas overriding or extending DEFAULT_PRAGMAS; a value of None leaves the SQLite
+      default for that pragma.
+    - SQLALCHEMY_ENGINE_OPTIONS (dict): Flask-SQLAlchemy's engine options; the pool options of DEFAULT_ENGINE_OPTIONS
+      are added unless set. Not applied to in-memory databases, which have no pool to size.
+    """
+
+    def __init__(self):
+        self.pragmas = dict(DEFAULT_PRAGMAS)
+
+    def init_app(self, app):
+        pragmas = dict(DEFAULT_PRAGMAS)
+        pragmas.update(app.config.setdefault('SQLITE_PRAGMAS', {}))
+        self.pragmas = {name: value for name, value in pragmas.items() if value is not None}
+
+        engine_options = app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {})
+        if ':memory:' not in app.config.get('SQLALCHEMY_DATABASE_URI', ''):
+            for option, value in DEFAULT_ENGINE_OPTIONS.items():
+                engine_options.setdefault(option, value)
+        app.extensions['sqlite_profile'] = self
+
+    def attach(self, engine):
+        """
+        Sets the pragmas on every new connection of an engine. Call it in an application context after db.init_app,
+        before the engine opens its first connection.
+        """
+        if engine.dialect.name == 'sqlite':
+            event.listen(engine, 'connect', self.apply)
+
+    def apply(self, dbapi_connection, connection_record=None):
+        """
+        Sets the pragmas on a DB-API connection.
+        """
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in self.pragmas.items():
+                cursor.execute(f'PRAGMA {name} = {value}')
+        finally:
+            cursor.close()
+
+    def settings(self, connection):
+        """
+        Returns the current value of each profile pragma on a connection, e.g. to check that the profile was applied.
+        """
+        return {name: connection.exec_driver_sql(f'PRAGMA {name}').scalar() for name in self.pragmas}
+
+
+sqlite_profile = SQLiteProfile()
@@ -0,0 +1,256 @@
+import json
+import sys
+import threading
+from collections import deque
+
+
+# Channel of the admin work queue; every ticket thread has a channel of its own, see ticket_channel()
+ADMIN_QUEUE_CHANNEL = 'admin_queue'
+
+
+def ticket_channel(reference_number):
+    return f'ticket:{reference_number}'
+
+
+def green_threads():
+    """
+    Returns True if the process runs on green threads (gevent or eventlet monkey-patched threading, as set up by
+    serve.py), where a waiting stream does not occupy an OS thread.
+    """
+    gevent_monkey = sys.modules.get('gevent.monkey')
+    if gevent_monkey is not None and gevent_monkey.is_module_patched('threading'):
+        return True
+    eventlet_patcher = sys.modules.get('eventlet.patcher')
+    return eventlet_patcher is not None and eventlet_patcher.is_monkey_patched('thread')
+
+
+
+class TooManyListeners(Exception):
+    """
+    Raised when a stream is refused because the process already has EVENT_STREAM_MAX_LISTENERS open streams.
+    """
+
+
+
+class Subscription:
+    """
+    One listener of an EventBroker channel: a bounded queue of the events published since it subscribed.
+
+    If the listener falls behind and its queue is full, the oldest event is dropped and the subscription is marked as
+    lagging, so the stream can tell the browser to reload instead of silently missing a message.
+    """
+
+    def __init__(self, broker, channel, size):
+        self.broker = broker
+        self.channel = channel
+        self.events = deque(maxlen=size)
+        self.lagging = False
+        self._ready = threading.Condition()
+
+    def put(self, event):
+        with self._ready:
+            if len(self.events) == self.events.maxlen:
+                self.lagging = True
+            self.events.append(event)
+            self._ready.notify()
+
+    def get(self, timeout):
+        """
+        Waits up to `timeout` seconds for the next event.
+
+        Returns:
+        - tuple: (event_id, event_type, data), or None if no event was published in time.
+        """
+        with self._ready:
+            if not self.events:
+                self._ready.wait(timeout)
+            return self.events.popleft() if self.events else None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+
+class EventBroker:
+    """
+    In-process publish/subscribe of ticket events, feeding the server-sent event streams of the help center.
+
+    Instead of reloading a ticket page (and re-running its queries) to look for replies, the browser keeps one
+    EventSource connection open per page. The connection subscribes to a channel and sleeps until a route publishes
+    an event to it: a listener costs no database query and no CPU while nothing happens, only its connection and a
+    heartbeat comment every EVENT_STREAM_HEARTBEAT seconds, which keeps proxies from closing the idle connection and
+    lets the server notice disconnected browsers.
+
+    What an idle listener costs depends on the server. Under a green-thread server (serve.py: gevent, with the
+    standard library monkey-patched) a stream waiting in Subscription.get() is a parked greenlet of a few kilobytes,
+    so a process holds thousands of open ticket pages, up to EVENT_STREAM_MAX_LISTENERS (10000 by default there).
+    Under a synchronous or threaded server (the Flask development server, sync WSGI workers) every open stream holds
+    one OS worker thread for as long as the page stays open, so the goal of near-free idle listeners cannot be met
+    there: the cap defaults to 50, kept below the server's thread count so the streams cannot take every worker and
+    stall the rest of the bank. Beyond the cap subscribe() raises TooManyListeners, answered with 503 and a
+    Retry-After header, and the page reconnects later (static/ticket_events.js backs off); the pages keep working,
+    they only miss the live updates until then.
+
+    The broker only reaches listeners connected to the same process. With several worker processes a message
+    published in one of them is not pushed to the others' listeners; their browsers still receive it when the stream
+    reconnects, since the ticket streams replay the messages newer than the last event they saw.
+
+    Configuration (read in init_app):
+    - EVENT_STREAM_HEARTBEAT (float): Seconds between heartbeats on an idle stream. Defaults to 15.
+    - EVENT_STREAM_QUEUE_SIZE (int): Maximum number of events kept for a slow listener. Defaults to 100.
+    - EVENT_STREAM_MAX_LISTENERS (int): Maximum number of open streams in the process. Defaults to 10000 on green
+      threads and 50 otherwise.
+    - EVENT_STREAM_RETRY_AFTER (int): Seconds a refused stream is asked to wait before retrying. Defaults to 30.
+    """
+
+    def __init__(self, heartbeat=15.0, queue_size=100, max_listeners=None, retry_after=30):
+        self.heartbeat = heartbeat
+        self.queue_size = queue_size
+        self.max_listeners = max_listeners
+        self.retry_after = retry_after
+        self._listeners = 0
+        self._channels = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.heartbeat = app.config.setdefault('EVENT_STREAM_HEARTBEAT', self.heartbeat)
+        self.queue_size = app.config.setdefault('EVENT_STREAM_QUEUE_SIZE', self.queue_size)
+        if self.max_listeners is None:
+            self.max_listeners = 10000 if green_threads() else 50
+        self.max_listeners = app.config.setdefault('EVENT_STREAM_MAX_LISTENERS', self.max_listeners)
+        self.retry_after = app.config.setdefault('EVENT_STREAM_RETRY_AFTER', self.retry_after)
+        app.extensions['ticket_events'] = self
+
+    def subscribe(self, channel):
+        """
+        Starts listening to a channel. The subscription must be closed (or used as a context manager) when the
+        stream ends.
+
+        Raises:
+        - TooManyListeners: If the process already has max_listeners open subscriptions.
+        """
+        subscription = Subscription(self, channel, self.queue_size)
+        with self._lock:
+            if self.max_listeners is not None and self._listeners >= self.max_listeners:
+                raise TooManyListeners(f'{self._listeners} event streams are already open.')
+            self._channels.setdefault(channel, set()).add(subscription)
+            self._listeners += 1
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            listeners = self._channels.get(subscription.channel)
+            if listeners is not None and subscription in listeners:
+                listeners.discard(subscription)
+                self._listeners -= 1
+                if not listeners:
+                    del self._channels[subscription.channel]
+
+    def publish(self, channel, event_type, data, event_id=None):
+        """
+        Sends an event to every current listener of a channel. Never blocks the publishing request.
+
+        Parameters:
+        - channel (str): The channel, e.g. ticket_channel(reference_number) or ADMIN_QUEUE_CHANNEL.
+        - event_type (str): The SSE event name, e.g. 'message'.
+        - data (dict): JSON-serialisable event data.
+        - event_id (int, optional): The SSE event id, used by reconnecting browsers to resume after it.
+
+        Returns:
+        - int: The number of listeners the event was sent to.
+        """
+        with self._lock:
+            listeners = list(self._channels.get(channel, ()))
+        for subscription in listeners:
+            subscription.put((event_id, event_type, data))
+        return len(listeners)
+
+    def listener_count(self):
+        with self._lock:
+            return self._listeners
+
+
+def format_event(event_type, data, event_id=None):
+    """
+    Formats an event in the text/event-stream wire format.
+    """
+    lines = []
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f'event: {event_type}')
+    lines.append(f'data: {json.dumps(data)}')
+    return '\n'.join(lines) + '\n\n'
+
+
+def message_event(message):
+    """
+    Returns the event data of a support ticket message, as sent to the browsers.
+    """
+    return {'id': message.id,
+            'reference_number': message.reference_number,
+            'title': message.title,
+            'description': message.description,
+            'category': message.category,
+            'status': message.status,
+            'priority': message.priority,
+            'user_id': message.user_id,
+            'created_at': message.created_at.strftime('%Y-%m-%d %H:%M')}
+
+
+def publish_ticket_message(message):
+    """
+    Announces a committed support ticket message to the listeners of its thread and of the admin work queue.
+    """
+    data = message_event(message)
+    ticket_events.publish(ticket_channel(message.reference_number), 'message', data, event_id=message.id)
+    ticket_events.publish(ADMIN_QUEUE_CHANNEL, 'message', data, event_id=message.id)
+
+
+def event_stream(subscription, replay=(), heartbeat=None):
+    """
+    Generates the text/event-stream body of a subscription.
+
+    Parameters:
+    - subscription (Subscription): The subscription to stream; closed when the stream ends, including when the
+      browser disconnects.
+    - replay (iterable): Events (event_id, event_type, data) to send first, e.g. the messages the browser missed
+      while it was disconnected.
+    - heartbeat (float, optional): Seconds between heartbeats. Defaults to the broker's setting.
+
+    Returns:
+    - generator: The chunks of the response.
+    """
+    heartbeat = heartbeat or subscription.broker.heartbeat
+    try:
+        # Browsers wait this many milliseconds before reconnecting a dropped stream
+        yield 'retry: 5000\n\n'
+        last_id = None
+        for event_id, event_type, data in replay:
+            last_id = event_id
+            yield format_event(event_type, data, event_id)
+
+        while True:
+            event = subscription.get(heartbeat)
+            if subscription.lagging:
+                # Events were dropped for this slow listener: the page has to be reloaded to be complete
+                yield format_event('reload', {})
+                return
+            if event is None:
+                yield ': heartbeat\n\n'
+                continue
+            event_id, event_type, data = event
+            if last_id is not None and event_id is not None and event_id <= last_id:
+                # Published while the replay was read, and already sent with it
+                continue
+            yield format_event(event_type, data, event_id)
+    finally:
+        subscription.close()
+
+
+ticket_events = EventBroker()
@@ -0,0 +1,144 @@
+import re
+from markupsafe import Markup, escape
+from sqlalchemy import inspect, text
+from models.models import db
+from routes.audit_log import AuditLogPage
+
+
+# Full-text index of the titles and descriptions of support ticket messages. It is an external-content FTS5 table:
+# it stores only the index and reads the text itself from support_tickets, by message id.
+SCHEMA = ("CREATE VIRTUAL TABLE IF NOT EXISTS support_tickets_fts USING fts5("
+          "title, description, content='support_tickets', content_rowid='id', tokenize='unicode61')")
+
+# Matches in the title weigh more than matches in the description when ranking
+TITLE_WEIGHT = 5.0
+DESCRIPTION_WEIGHT = 1.0
+
+# Control characters used to mark the matched terms, replaced after the text has been HTML-escaped
+HIGHLIGHT_START = '\x02'
+HIGHLIGHT_END = '\x03'
+
+# The matches are materialized first: the FTS5 auxiliary functions only work in the query that runs the MATCH
+SEARCH = text(f"""
+WITH matches AS MATERIALIZED (
+    SELECT rowid AS id,
+           bm25(support_tickets_fts, {TITLE_WEIGHT}, {DESCRIPTION_WEIGHT}) AS score,
+           highlight(support_tickets_fts, 0, :start, :end) AS title,
+           snippet(support_tickets_fts, 1, :start, :end, '...', 16) AS description
+    FROM support_tickets_fts
+    WHERE support_tickets_fts MATCH :query
+)
+SELECT h.reference_number, h.user_id, h.category, h.status, h.priority, h.last_message_at,
+       MIN(m.score) AS score, m.title, m.description, COUNT(*) AS matched_messages
+FROM matches m
+JOIN support_tickets t ON t.id = m.id
+JOIN ticket_headers h ON h.reference_number = t.reference_number
+GROUP BY h.reference_number
+ORDER BY score, h.last_message_at DESC
+LIMIT :limit OFFSET :offset
+""")
+
+COUNT = text("""
+SELECT COUNT(DISTINCT t.reference_number)
+FROM support_tickets_fts
+JOIN support_tickets t ON t.id = support_tickets_fts.rowid
+WHERE support_tickets_fts MATCH :query
+""")
+
+
+
+def ensure_ticket_search_index():
+    """
+    Creates the full-text index of the support tickets if it does not exist yet, and fills it with the messages
+    already stored. Run by the schema migration that introduced it (migrations/v003_ticket_search_index.py).
+
+    Returns:
+    - bool: True if the index was created.
+    """
+    if 'support_tickets_fts' in inspect(db.engine).get_table_names():
+        return False
+
+    with db.engine.begin() as connection:
+        connection.execute(text(SCHEMA))
+        # Reads every row of the content table into the index
+        connection.execute(text("INSERT INTO support_tickets_fts(support_tickets_fts) VALUES ('rebuild')"))
+    return True
+
+
+def index_ticket_message(message):
+    """
+    Adds a flushed support ticket message to the full-text index, in the current database session.
+    """
+    db.session.execute(text('INSERT INTO support_tickets_fts(rowid, title, description) '
+                            'VALUES (:id, :title, :description)'),
+                       {'id': message.id, 'title': message.title, 'description': message.description})
+
+
+def unindex_ticket_thread(reference_number):
+    """
+    Removes the messages of a ticket thread from the full-text index, in the current database session. Must run
+    before the messages themselves are deleted, since the index needs their text to remove them.
+    """
+    db.session.execute(text("INSERT INTO support_tickets_fts(support_tickets_fts, rowid, title, description) "
+                            "SELECT 'delete', id, title, description FROM support_tickets "
+                            "WHERE reference_number = :reference_number"),
+                       {'reference_number': reference_number})
+
+
+def match_query(search_text):
+    """
+    Turns the text typed by the admin into a safe FTS5 query.
+
+    Every word is quoted, so characters with a meaning in the FTS5 query syntax (quotes, '*', '-', ':', 'AND', 'OR',
+    'NEAR', parentheses) are searched for literally instead of raising a syntax error. All words must occur in the
+    message; the last one may be the beginning of a longer word, e.g. a partially typed account number.
+
+    Parameters:
+    - search_text (str): The search text.
+
+    Returns:
+    - str: The FTS5 query, or None if the text contains no words.
+    """
+    words = re.findall(r'\w+', search_text or '')
+    if not words:
+        return None
+    return ' '.join(f'"{word}"' for word in words) + '*'
+
+
+def _highlighted(value):
+    # The text is escaped first, so only the highlight markers become HTML
+    return Markup(str(escape(value or ''))
+                  .replace(HIGHLIGHT_START, '<mark>')
+                  .replace(HIGHLIGHT_END, '</mark>'))
+
+
+def search_tickets(search_text, page=1, per_page=20):
+    """
+    Searches the titles and descriptions of all support ticket messages and returns the matching threads.
+
+    Threads are ranked by the BM25 score of their best matching message, with title matches weighing more than
+    description matches. Each result carries the best matching message's title and a snippet of its description,
+    with the matched words wrapped in <mark> tags.
+
+    Parameters:
+    - search_text (str): Words to search for, e.g. an account number or a merchant name.
+    - page (int): Page number, starting at 1.
+    - per_page (int): Number of threads per page.
+
+    Returns:
+    - AuditLogPage: Dictionaries with the keys 'reference_number', 'user_id', 'category', 'status', 'priority',
+      'last_message_at', 'title', 'description' (both Markup) and 'matched_messages', and the pagination attributes.
+    """
+    page = max(1, page)
+    query = match_query(search_text)
+    if query is None:
+        return AuditLogPage([], page, per_page, 0)
+
+    total = db.session.execute(COUNT, {'query': query}).scalar()
+    rows = db.session.execute(SEARCH, {'query': query, 'start': HIGHLIGHT_START, 'end': HIGHLIGHT_END,
+                                       'limit': per_page, 'offset': (page - 1) * per_page}).mappings().all()
+
+    items = [dict(row, title=_highlighted(row['title']), description=_highlighted(row['description']))
+             for row in rows]
+
+    return AuditLogPage(items, page, per_page, total)
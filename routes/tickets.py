@@ -0,0 +1,194 @@
+from datetime import datetime
+from sqlalchemy import func, inspect, text, tuple_
+from models.models import db, SupportTickets, TicketHeaders
+from routes.admin_counters import increment_admin_counter, status_counter
+from routes.ticket_search import index_ticket_message, unindex_ticket_thread
+
+
+# Position of each priority in the work queue: urgent threads first, then high, then the rest
+PRIORITY_RANKS = {'urgent': 1, 'high': 2, 'normal': 3}
+
+# Order of the work queue: by priority, then the thread waiting longest first; the id makes the order total
+QUEUE_ORDER = (TicketHeaders.priority_rank, TicketHeaders.last_message_at, TicketHeaders.id)
+
+
+def priority_rank(priority):
+    return PRIORITY_RANKS.get(priority, 3)
+
+
+
+def add_ticket_message(message, new_thread=False):
+    """
+    Adds a message to a support ticket thread and updates the thread's header.
+
+    The first message of a reference number creates the header; every later one updates its status, priority, latest
+    message and message count. The per-status ticket counters are adjusted when the thread's status changes, and the
+    message is added to the full-text search index. The changes are added to the current database session and committed by the caller, together with the message itself.
+
+    Parameters:
+    - message (SupportTickets): The new message, with its reference_number set.
+    - new_thread (bool): True if the message opens a new thread with a freshly allocated reference number; the
+      header is then inserted without looking for an existing one.
+
+    Returns:
+    - TicketHeaders: The header of the thread.
+    """
+    db.session.add(message)
+    # Flushing assigns the message id (and the default created_at) used by the header
+    db.session.flush()
+    index_ticket_message(message)
+
+    header = None if new_thread else TicketHeaders.query.filter_by(reference_number=message.reference_number).first()
+    if header is None:
+        header = TicketHeaders(reference_number=message.reference_number,
+                               user_id=message.user_id,
+                               title=message.title,
+                               category=message.category,
+                               created_at=message.created_at,
+                               message_count=0)
+        db.session.add(header)
+
+    if header.status != message.status:
+        if header.status is not None:
+            increment_admin_counter(status_counter(header.status), -1)
+        increment_admin_counter(status_counter(message.status))
+
+    header.status = message.status
+    header.priority = message.priority
+    header.priority_rank = priority_rank(message.priority)
+    header.last_message_at = message.created_at
+    header.last_message_id = message.id
+    header.message_count += 1
+
+    return header
+
+
+
+def delete_ticket_thread(reference_number):
+    """
+    Deletes all messages of a support ticket thread and its header, removes the messages from the full-text search
+    index and updates the per-status ticket counter. The caller commits the changes.
+
+    Parameters:
+    - reference_number (str): Reference number of the thread.
+
+    Returns:
+    - int: The number of deleted messages.
+    """
+    header = TicketHeaders.query.filter_by(reference_number=reference_number).first()
+    if header is not None:
+        increment_admin_counter(status_counter(header.status), -1)
+        TicketHeaders.query.filter_by(id=header.id).delete(synchronize_session=False)
+    unindex_ticket_thread(reference_number)
+    return SupportTickets.query.filter_by(reference_number=reference_number).delete(synchronize_session=False)
+
+
+
+def latest_ticket_messages():
+    """
+    Returns a query for the latest message of every ticket thread, in work queue order.
+
+    The query scans the headers and joins each one to its latest message by primary key, so the listings show the
+    current state of every thread (the latest message carries the thread's current status) without grouping the
+    messages. Threads are ordered by priority rank (urgent first) and then by last activity, the thread waiting
+    longest first, which is the order of the (priority_rank, last_message_at, id) index. Further filters on
+    TicketHeaders columns can be added by the caller.
+
+    Returns:
+    - Query: A query of SupportTickets rows.
+    """
+    return (db.session.query(SupportTickets)
+            .join(TicketHeaders, TicketHeaders.last_message_id == SupportTickets.id)
+            .order_by(*QUEUE_ORDER))
+
+
+
+def ticket_queue_page(status=None, after=None, per_page=25):
+    """
+    Returns one page of the admin ticket work queue, using cursor (keyset) pagination.
+
+    Instead of an OFFSET, which makes the database skip all earlier rows, the page starts right after the position
+    given by the cursor, so every page is read straight from the (status, priority_rank, last_message_at, id) or
+    (priority_rank, last_message_at, id) index, however deep into the queue it is.
+
+    Parameters:
+    - status (str, optional): Only threads with this status.
+    - after (str, optional): Cursor returned with the previous page.
+    - per_page (int): Number of threads per page.
+
+    Returns:
+    - tuple: (tickets, next_cursor) - the latest message of each thread on the page, and the cursor of the next page
+      (None on the last page).
+
+    Raises:
+    - ValueError: If the cursor is malformed.
+    """
+    query = latest_ticket_messages().add_columns(*QUEUE_ORDER)
+    if status:
+        query = query.filter(TicketHeaders.status == status)
+    if after:
+        rank, last_message_at, header_id = after.split('_')
+        position = (int(rank), datetime.fromisoformat(last_message_at), int(header_id))
+        query = query.filter(tuple_(*QUEUE_ORDER) > tuple_(*position))
+
+    rows = query.limit(per_page + 1).all()
+    tickets = [row[0] for row in rows[:per_page]]
+
+    next_cursor = None
+    if len(rows) > per_page:
+        rank, last_message_at, header_id = rows[per_page - 1][1:]
+        next_cursor = f'{rank}_{last_message_at.isoformat()}_{header_id}'
+
+    return tickets, next_cursor
+
+
+
+def backfill_ticket_headers():
+    """
+    Creates the headers of ticket threads that do not have one yet, from their messages.
+
+    Run by the schema migration that introduced the headers (migrations/v002_ticket_headers.py), so threads created
+    before the headers existed are listed too. A single query finds
+    every reference number without a header and its message count; the first and latest messages of those threads
+    are then read to fill in the header.
+
+    Returns:
+    - int: The number of created headers.
+    """
+    # Databases whose ticket_headers table was created before it had the priority_rank column get it added
+    if 'priority_rank' not in [column['name'] for column in inspect(db.engine).get_columns('ticket_headers')]:
+        with db.engine.begin() as connection:
+            connection.execute(text('ALTER TABLE ticket_headers ADD COLUMN priority_rank INTEGER NOT NULL DEFAULT 3'))
+            connection.execute(text("UPDATE ticket_headers SET priority_rank = CASE priority "
+                                    "WHEN 'urgent' THEN 1 WHEN 'high' THEN 2 ELSE 3 END"))
+
+    # Make sure the indexes exist, also in databases created before they were declared
+    for index in list(SupportTickets.__table__.indexes) + list(TicketHeaders.__table__.indexes):
+        index.create(db.engine, checkfirst=True)
+
+    threads = (db.session.query(SupportTickets.reference_number, func.count(SupportTickets.id).label('message_count'))
+               .outerjoin(TicketHeaders, TicketHeaders.reference_number == SupportTickets.reference_number)
+               .filter(TicketHeaders.id.is_(None))
+               .group_by(SupportTickets.reference_number)
+               .all())
+
+    for thread in threads:
+        messages = (SupportTickets.query.filter_by(reference_number=thread.reference_number)
+                    .order_by(SupportTickets.created_at, SupportTickets.id).all())
+        first, last = messages[0], messages[-1]
+        db.session.add(TicketHeaders(reference_number=thread.reference_number,
+                                     user_id=first.user_id,
+                                     title=first.title,
+                                     category=first.category,
+                                     status=last.status,
+                                     priority=last.priority,
+                                     priority_rank=priority_rank(last.priority),
+                                     created_at=first.created_at,
+                                     last_message_at=last.created_at,
+                                     last_message_id=last.id,
+                                     message_count=thread.message_count))
+        increment_admin_counter('tickets_' + last.priority)
+        increment_admin_counter(status_counter(last.status))
+    db.session.commit()
+
+    return len(threads)
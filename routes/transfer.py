@@ -3,6 +3,12 @@ from flask_login import current_user, login_required, login_user
 from forms.forms import TransferForm, LoginForm, DDSOForm, CreateTransactionForm, EditUserForm, AddRecipientForm
 from datetime import date
 from models.models import Users, Transaction, db, DDSO, LockedUsers, Recipient
+from routes.audit_log import audit_log, AuditLogHandler
+from routes.log_writer import QueuedLogWriter
+from routes.admin_counters import increment_admin_counter
+from routes.user_cache import user_cache
+from routes.login_limiter import login_limiter
+from models.password_hasher import password_hasher
 from functools import wraps
 import logging
 import re
@@ -17,12 +23,16 @@ logger.setLevel(logging.INFO)
 # Definition of your own formatter
 formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
 
-# Creating and configuring the handler
-handler = logging.FileHandler('app.log')
-handler.setFormatter(formatter)
+# Creating the writer of the 'app.log' file: records are put on a queue by the request threads and written to the
+# file in batches by a background thread, which also rotates the file
+log_writer = QueuedLogWriter('app.log', formatter)
+log_writer.start()
 
 # Adding a handler to the logger
-logger.addHandler(handler)
+logger.addHandler(log_writer.handler())
+
+# Every record is also stored as a structured entry in the indexed audit log (written in batches in the background)
+logger.addHandler(AuditLogHandler(audit_log))
 
 
 def admin_required(func):
@@ -47,7 +57,7 @@ def admin_required(func):
     def decorated_view(*args, **kwargs):
         if not current_user.is_authenticated or current_user.role != 'admin':
             # Logging an attempt to access a resource by an unauthorized user
-            logger.error(f"No access to the resource - {request.path}  '{current_user.username}' ")
+            logger.error(f"No access to the resource - {request.path}  '{current_user.username}' ", extra={'event_type': 'access_denied'})
             # Returns a 403 Forbidden error
             abort(403)
         return func(*args, **kwargs)
@@ -190,60 +200,79 @@ def login():
     If the user is already logged in, it redirects them to the appropriate dashboard based on their role. For an admin, it 
     redirects to the admin dashboard, otherwise to the user dashboard.
 
-    The function implements a security measure to prevent brute force attacks by tracking the number of failed login attempts. 
-    If a user exceeds a predefined number of failed attempts, their account is locked, and they are redirected to an account 
-    locked page. The counter of failed attempts is reset when a user successfully logs in or when a different user attempts to 
-    log in.
+    The function implements a security measure to prevent brute force attacks by counting the failed login attempts on
+    the server, per username and per client IP address, in sliding time windows (see routes/login_limiter.py). Before
+    the user is loaded and before any password hash is checked, an attempt from an address or for a username with too
+    many recent failures is refused with a 429 Too Many Requests response and a Retry-After header. If an existing
+    user reaches a predefined number of failed attempts, their account is locked, and they are redirected to an account
+    locked page. A successful login clears the failures of the username, and a password hash made with older hashing
+    parameters is replaced by one made with the current ones. It also makes the session permanent (lasting
+    PERMANENT_SESSION_LIFETIME) and, with the server-side session store, gives it a new session id.
 
     Returns:
         On GET: Renders and returns the login form.
         On POST: If form validation fails, or if the user cannot be authenticated, re-renders the login form with an error message.
                  If the user is authenticated, redirects to the appropriate dashboard based on the user's role.
                  If the user's account is locked, renders and returns the account locked page.
+                 If there were too many failed attempts, re-renders the login form with status 429.
         If the user is already logged in, redirects to the appropriate dashboard immediately without rendering the login form.
     """
     form = LoginForm()
     if request.method == "POST":
         if form.validate_on_submit():
             username = form.username.data
+            ip_address = request.remote_addr
             
-            # Check if the user trying to log in has changed
-            if session.get('last_login_attempt_user') != username:
-                # Reset login attempt counter for new user
-                session['login_attempts'] = 0  
-                # Record the name of the user trying to log in
-                session['last_login_attempt_user'] = username  
+            # Refuse bursts of failed attempts before touching the database or the password hash
+            retry_after = login_limiter.check(username, ip_address)
+            if retry_after:
+                logger.warning(f"Too many failed login attempts for user '{username}' or from {ip_address}.", extra={'event_type': 'login_throttled', 'username': username})
+                flash(f'Too many failed login attempts. Please try again in {retry_after} seconds.', 'danger')
+                return render_template('login.html', form=form), 429, {'Retry-After': str(retry_after)}
             
-            # First, check if the user is blocked
-            locked_user = LockedUsers.query.filter_by(username=username).first()
+            # The user and their lock, if any, in a single query
+            user, locked_user = (db.session.query(Users, LockedUsers)
+                                 .outerjoin(LockedUsers, LockedUsers.username == Users.username)
+                                 .filter(Users.username == username)
+                                 .first()) or (None, None)
             if locked_user:
                 # If the user is blocked, immediately redirect to the blocked account page
                 return render_template('account_locked.html', locked_user=locked_user)
 
-            user = Users.query.filter_by(username=username).first()
             if user:
                 if user.check_password(form.password.data): 
-                    # Continue the login process if your password is correct
+                    # Continue the login process if your password is correct. The session gets a new id (with the
+                    # server-side session store) and becomes permanent once here, instead of on every request
+                    if hasattr(session, 'regenerate'):
+                        session.regenerate()
+                    session.permanent = True
                     login_user(user)
                     flash("Login successful!", 'success')
-                    logger.info(f"User '{user.username}' logged in to the system.")
-                    # Reset login attempt counter
-                    session['login_attempts'] = 0
+                    logger.info(f"User '{user.username}' logged in to the system.", extra={'event_type': 'login', 'username': user.username})
+                    # Reset the failed attempts of the username
+                    login_limiter.record_success(username)
+                    # Upgrade a hash made with older parameters while the password is at hand
+                    if password_hasher.needs_rehash(user.password_hash):
+                        user.set_password(form.password.data)
+                        db.session.commit()
+                        user_cache.invalidate(user.id)
                     return redirect(url_for('admin_dashboard_bp.admin_dashboard') if user.role == 'admin' else url_for('dashboard'))
                 else:
                     flash('Invalid username or password.', 'danger')
-                    #Increase the login attempt counter
-                    session['login_attempts'] = session.get('login_attempts', 0) + 1
-                    logger.warning(f"Failed login attempt for user '{user.username}'.")
-                    if session['login_attempts'] >= 3 and user:
+                    # Count the failed attempt
+                    login_limiter.record_failure(username, ip_address)
+                    logger.warning(f"Failed login attempt for user '{user.username}'.", extra={'event_type': 'login_failed', 'username': user.username})
+                    if login_limiter.should_lock(username):
                         locked_user = LockedUsers(username=user.username)
                         db.session.add(locked_user)
+                        increment_admin_counter('locked_users')
                         db.session.commit()
-                        logger.critical(f"Account for user '{user.username}' has been locked.")
-                        session['login_attempts'] = 0
+                        user_cache.invalidate(user.id)
+                        logger.critical(f"Account for user '{user.username}' has been locked.", extra={'event_type': 'account_locked', 'username': user.username})
                         flash("Your account has been locked after exceeding the maximum number of failed login attempts.")
                         return render_template('account_locked.html', locked_user=locked_user)
             else:
+                login_limiter.record_failure(username, ip_address)
                 flash('User not found.', 'danger')
 
         # In case of validation errors or user not found, re-render the form
@@ -328,7 +357,7 @@ def ddso():
         
         except Exception as e:
             db.session.rollback()
-            logger.error(f"Failed to add DDSO: {e}")
+            logger.error(f"Failed to add DDSO: {e}", extra={'event_type': 'ddso_error'})
             flash('An error occurred. Please try again.', 'danger')
             return redirect(url_for('ddso_bp.ddso')) 
 
@@ -465,14 +494,15 @@ def edit_profile():
         
         try:
             db.session.commit()
+            user_cache.invalidate(current_user.id)
             flash('Your profile has been updated.')
-            logger.warning(f"Change of personal data -  '{current_user.username}' ")
+            logger.warning(f"Change of personal data -  '{current_user.username}' ", extra={'event_type': 'profile_change'})
             return redirect(url_for('account_data'))
             
         except Exception as e:
             db.session.rollback()
             flash('An error occurred. Please try again.')
-            logger.error(f"Error updating profile: {e}")
+            logger.error(f"Error updating profile: {e}", extra={'event_type': 'profile_error'})
             return redirect(url_for('account_data'))
     
 
@@ -529,7 +559,7 @@ def add_recipient():
             except Exception as e:
                 db.session.rollback()
                 flash('An error occurred. Please try again.', 'danger')
-                logger.error(f"Error adding new recipient: {e}")
+                logger.error(f"Error adding new recipient: {e}", extra={'event_type': 'recipient_error'})
         else:
             # The user does not exist, display an error message
             flash('The user with the given sort code and account number does not exist.', 'danger')
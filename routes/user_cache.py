@@ -0,0 +1,129 @@
+import threading
+import time
+from collections import OrderedDict
+from sqlalchemy import inspect
+from sqlalchemy.orm import make_transient_to_detached
+from models.models import db, Users
+
+
+
+class UserCache:
+    """
+    In-process cache of the logged-in users' identities, serving Flask-Login's user_loader without a database query.
+
+    Every authenticated request reloads its user from the id stored in the session. The cache keeps the column values
+    of recently loaded users; a hit builds a Users instance from them and attaches it to the request's session with
+    session.merge(load=False), which emits no SELECT. The instance behaves like a loaded one: its relationships are
+    loaded lazily and changes to it are flushed as usual.
+
+    Entries expire after USER_CACHE_TTL seconds and the least recently used entry is evicted when the cache is full.
+    Routes that change a user call invalidate() after committing. Each user id also carries a version stamp that
+    invalidate() increments: a load that read the user from the database before an invalidation, and finishes after
+    it, does not store its (possibly outdated) values.
+
+    The cache is local to the process, so a change committed in another worker process is seen there only when the
+    entry expires; the TTL bounds that delay.
+
+    Configuration (read in init_app):
+    - USER_CACHE_TTL (float): Lifetime of an entry in seconds, 0 disables the cache. Defaults to 60.
+    - USER_CACHE_MAX_ENTRIES (int): Maximum number of cached users. Defaults to 1024.
+    """
+
+    def __init__(self, ttl=60, max_entries=1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.ttl = app.config.setdefault('USER_CACHE_TTL', self.ttl)
+        self.max_entries = app.config.setdefault('USER_CACHE_MAX_ENTRIES', self.max_entries)
+        app.extensions['user_cache'] = self
+
+    @staticmethod
+    def _snapshot(user):
+        return {attribute.key: getattr(user, attribute.key) for attribute in inspect(Users).column_attrs}
+
+    @staticmethod
+    def _attach(values):
+        user = Users(**values)
+        # Marks the instance as persistent-but-detached with no pending changes, so merge() can skip the SELECT
+        make_transient_to_detached(user)
+        return db.session.merge(user, load=False)
+
+    def load(self, user_id):
+        """
+        Returns the user with the given id, from the cache if possible.
+
+        Parameters:
+        - user_id (int): The user's id.
+
+        Returns:
+        - Users: The user, attached to the current database session, or None if no user has that id.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and now - entry[0] < self.ttl:
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                values = entry[1]
+            else:
+                values = None
+                self.misses += 1
+            version = self._versions.get(user_id, 0)
+
+        if values is not None:
+            return self._attach(values)
+
+        user = db.session.get(Users, user_id)
+        if user is not None and self.ttl:
+            self._store(user_id, version, self._snapshot(user), now)
+        return user
+
+    def _store(self, user_id, version, values, loaded_at):
+        with self._lock:
+            if self._versions.get(user_id, 0) != version:
+                # The user was changed while being loaded
+                return
+            self._entries[user_id] = (loaded_at, values)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        """
+        Drops the cached identity of a user whose data has changed, or who was deleted, locked or unlocked. Call it
+        after the change has been committed.
+        """
+        with self._lock:
+            self._versions[user_id] = self._versions.get(user_id, 0) + 1
+            self._entries.pop(user_id, None)
+
+    def invalidate_username(self, username):
+        """
+        Drops the cached identity of the user with the given username, for changes made by username only.
+        """
+        with self._lock:
+            user_ids = [user_id for user_id, (_, values) in self._entries.items() if values['username'] == username]
+        for user_id in user_ids:
+            self.invalidate(user_id)
+
+    def clear(self):
+        with self._lock:
+            for user_id in self._entries:
+                self._versions[user_id] = self._versions.get(user_id, 0) + 1
+            self._entries.clear()
+
+    def stats(self):
+        """
+        Returns the number of cached users, hits and misses since the start of the process.
+        """
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+
+user_cache = UserCache()
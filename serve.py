@@ -0,0 +1,38 @@
+"""
+Production entry point serving the application on gevent green threads.
+
+The help center keeps one server-sent event stream open per ticket page (routes/ticket_events.py). Under the Flask
+development server or a threaded WSGI server each open stream holds an OS thread; here the standard library is
+monkey-patched first, so a stream waiting for events is a parked greenlet and thousands of idle listeners cost
+almost nothing. The ticket event broker detects this and raises its listener cap (EVENT_STREAM_MAX_LISTENERS).
+
+Requires gevent (pip install gevent). The same can be had from gunicorn with 'gunicorn -k gevent app:app'.
+
+Usage (from the repository root):
+    python serve.py [--host 0.0.0.0] [--port 5000]
+"""
+from gevent import monkey
+
+# Before anything else imports threading, socket or queue
+monkey.patch_all()
+
+import argparse
+import sys
+from gevent.pywsgi import WSGIServer
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1', help='address to listen on')
+    parser.add_argument('--port', type=int, default=5000, help='port to listen on')
+    args = parser.parse_args()
+
+    from app import app, initialize_app
+    initialize_app()
+    print(f'Serving on http://{args.host}:{args.port} (gevent)')
+    WSGIServer((args.host, args.port), app).serve_forever()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,110 @@
+// charts.js - draws the admin charts in the browser from the JSON chart data endpoints.
+//
+// Every <canvas class="chart" data-chart-url="..."> on the page is filled with a pie or bar chart. The endpoints
+// return {title, kind, labels, values} and send ETags, so the browser revalidates them with a cheap 304 response
+// while the data is unchanged.
+
+(function () {
+    var COLORS = ['#1f77b4', '#ff7f0e', '#2ca02c', '#d62728', '#9467bd', '#8c564b', '#e377c2', '#7f7f7f', '#bcbd22', '#17becf'];
+
+    function drawTitle(ctx, canvas, title) {
+        ctx.fillStyle = '#000';
+        ctx.font = '14px sans-serif';
+        ctx.textAlign = 'center';
+        ctx.textBaseline = 'top';
+        ctx.fillText(title, canvas.width / 2, 8);
+    }
+
+    function drawPie(ctx, canvas, data) {
+        var total = data.values.reduce(function (sum, value) { return sum + value; }, 0);
+        var radius = Math.min(canvas.width / 2, canvas.height - 40) / 2 - 10;
+        var centerX = 20 + radius;
+        var centerY = 30 + (canvas.height - 30) / 2;
+        var angle = -Math.PI / 2;
+
+        ctx.fillStyle = 'lightgrey';
+        ctx.fillRect(0, 0, canvas.width, canvas.height);
+        drawTitle(ctx, canvas, data.title);
+
+        ctx.textAlign = 'left';
+        ctx.textBaseline = 'middle';
+        ctx.font = '12px sans-serif';
+
+        data.values.forEach(function (value, i) {
+            var slice = total ? (value / total) * 2 * Math.PI : 0;
+            var color = COLORS[i % COLORS.length];
+
+            ctx.beginPath();
+            ctx.moveTo(centerX, centerY);
+            ctx.arc(centerX, centerY, radius, angle, angle + slice);
+            ctx.closePath();
+            ctx.fillStyle = color;
+            ctx.fill();
+            angle += slice;
+
+            // Legend: colour box, label and percentage
+            var legendY = 40 + i * 18;
+            ctx.fillRect(centerX + radius + 20, legendY - 6, 12, 12);
+            ctx.fillStyle = '#000';
+            var percent = total ? (100 * value / total).toFixed(1) : '0.0';
+            ctx.fillText(data.labels[i] + ' (' + percent + '%)', centerX + radius + 38, legendY);
+        });
+    }
+
+    function drawBar(ctx, canvas, data) {
+        var left = 60, right = 20, top = 40, bottom = 90;
+        var width = canvas.width - left - right;
+        var height = canvas.height - top - bottom;
+        var max = Math.max.apply(null, data.values.concat([0])) || 1;
+        var step = data.values.length ? width / data.values.length : width;
+
+        ctx.fillStyle = '#fff';
+        ctx.fillRect(0, 0, canvas.width, canvas.height);
+        drawTitle(ctx, canvas, data.title);
+
+        ctx.strokeStyle = '#000';
+        ctx.beginPath();
+        ctx.moveTo(left, top);
+        ctx.lineTo(left, top + height);
+        ctx.lineTo(left + width, top + height);
+        ctx.stroke();
+
+        ctx.font = '12px sans-serif';
+        data.values.forEach(function (value, i) {
+            var barHeight = (value / max) * height * 0.9;
+            var x = left + i * step + step * 0.1;
+
+            ctx.fillStyle = 'skyblue';
+            ctx.fillRect(x, top + height - barHeight, step * 0.8, barHeight);
+
+            ctx.fillStyle = '#000';
+            ctx.textAlign = 'center';
+            ctx.textBaseline = 'bottom';
+            ctx.fillText(Number(value).toFixed(2), x + step * 0.4, top + height - barHeight - 2);
+
+            ctx.save();
+            ctx.translate(x + step * 0.4, top + height + 8);
+            ctx.rotate(-Math.PI / 4);
+            ctx.textAlign = 'right';
+            ctx.textBaseline = 'middle';
+            ctx.fillText(data.labels[i], 0, 0);
+            ctx.restore();
+        });
+    }
+
+    function renderChart(canvas) {
+        fetch(canvas.getAttribute('data-chart-url'), { credentials: 'same-origin' })
+            .then(function (response) { return response.json(); })
+            .then(function (data) {
+                var ctx = canvas.getContext('2d');
+                if (data.kind === 'bar') {
+                    drawBar(ctx, canvas, data);
+                } else {
+                    drawPie(ctx, canvas, data);
+                }
+            })
+            .catch(function (error) { console.log('Chart could not be loaded:', error); });
+    }
+
+    document.querySelectorAll('canvas.chart[data-chart-url]').forEach(renderChart);
+})();
@@ -0,0 +1,82 @@
+// ticket_events.js - shows new support ticket messages without reloading the page.
+//
+// An element with a data-events-url attribute opens an EventSource on that server-sent event stream. Every 'message'
+// event is rendered by cloning the <template> named in data-events-template: each element with a data-field
+// attribute gets the text of that field of the message, and each element with a data-href attribute gets it as its
+// link, with '__ref__' replaced by the message's reference number. The copy is appended to the element named in
+// data-events-target, or prepended if data-events-insert is 'prepend'. Text is always set with textContent, so
+// messages are never interpreted as HTML.
+//
+// The browser reconnects a dropped stream by itself, but gives up when the server refuses it (503 when the server
+// has reached its number of open streams). The stream is then opened again after a delay that doubles on every
+// refusal, resuming after the last message received.
+
+(function () {
+    function render(template, message) {
+        var fragment = template.content.cloneNode(true);
+        fragment.querySelectorAll('[data-field]').forEach(function (element) {
+            var value = message[element.getAttribute('data-field')];
+            element.textContent = value === null || value === undefined ? '' : value;
+        });
+        fragment.querySelectorAll('[data-href]').forEach(function (element) {
+            element.href = element.getAttribute('data-href').replace('__ref__', encodeURIComponent(message.reference_number));
+        });
+        return fragment;
+    }
+
+    function listen(element) {
+        var template = document.getElementById(element.getAttribute('data-events-template'));
+        var target = document.getElementById(element.getAttribute('data-events-target'));
+        var prepend = element.getAttribute('data-events-insert') === 'prepend';
+        var seen = {};
+        var lastId = null;
+        var delay = 30000;
+
+        function connect() {
+            var url = new URL(element.getAttribute('data-events-url'), window.location.href);
+            if (lastId !== null) {
+                url.searchParams.set('after', lastId);
+            }
+            var source = new EventSource(url.toString());
+
+            source.addEventListener('open', function () {
+                delay = 30000;
+            });
+
+            source.addEventListener('message', function (event) {
+                var message = JSON.parse(event.data);
+                lastId = message.id;
+                // A message may arrive twice when the stream reconnects
+                if (seen[message.id]) {
+                    return;
+                }
+                seen[message.id] = true;
+
+                var fragment = render(template, message);
+                if (prepend) {
+                    target.insertBefore(fragment, target.firstChild);
+                } else {
+                    target.appendChild(fragment);
+                }
+            });
+
+            // Sent when events were dropped for this page: only a reload shows everything again
+            source.addEventListener('reload', function () {
+                source.close();
+                window.location.reload();
+            });
+
+            // Refused by the server: the browser does not retry by itself, so back off and reconnect
+            source.addEventListener('error', function () {
+                if (source.readyState === EventSource.CLOSED) {
+                    setTimeout(connect, delay * (0.5 + Math.random() / 2));
+                    delay = Math.min(delay * 2, 300000);
+                }
+            });
+        }
+
+        connect();
+    }
+
+    document.querySelectorAll('[data-events-url]').forEach(listen);
+})();